@@ -1,22 +1,32 @@
 from fastapi import FastAPI, HTTPException, BackgroundTasks, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, ORJSONResponse
 from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from typing import Optional, List, Any, Dict
+from typing import Optional, List, Any, Dict, Tuple
+import re
 import socket
+import unicodedata
 import platform
 import psutil
 from datetime import datetime
 import threading
-import json
 import os
 import tempfile
-from fastapi import Request
+import shutil
+from fastapi import Request, WebSocket, WebSocketDisconnect
 import asyncio
-import requests
-from scapy.all import sniff, IP, TCP, UDP, ICMP, ARP, wrpcap, AsyncSniffer
+import httpx
+import orjson
+from collections import deque, Counter, OrderedDict
+from bisect import bisect_left
+from operator import itemgetter
+import heapq
+from scapy.all import conf, Ether, IP, TCP, UDP, ICMP, ARP, DNS
 import time
+import struct
+import select
+import subprocess
 from dotenv import load_dotenv
 from pathlib import Path
 
@@ -29,6 +39,7 @@ import network_connections
 import lan_discovery
 import snmp_discovery
 import nmap_scan
+import packet_hot as _hot
 
 # 明示的に backend フォルダの .env を読み込む
 env_path = Path(__file__).resolve().parent / '.env'
@@ -43,7 +54,50 @@ if _api:
 else:
     print('[config] OPENAI_API_KEY not set')
 
-app = FastAPI(title="Network Monitor API", version="1.0.0")
+# 大きなネストした dict（プロセス一覧・イベントログ等）を返すため、既定の JSON エンコーダを orjson にする
+app = FastAPI(title="Network Monitor API", version="1.0.0", default_response_class=ORJSONResponse)
+
+# 外部 HTTP(OpenAI 等) 用の共有クライアント。keep-alive で TLS ハンドシェイクを使い回す
+try:
+    import h2  # noqa: F401
+    _HTTP2_AVAILABLE = True
+except Exception:
+    _HTTP2_AVAILABLE = False
+
+
+def _create_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        http2=_HTTP2_AVAILABLE,
+        timeout=60.0,
+        limits=httpx.Limits(max_keepalive_connections=20),
+    )
+
+
+@app.on_event("startup")
+async def _startup_http_client():
+    app.state.http = _create_http_client()
+
+
+@app.on_event("shutdown")
+async def _shutdown_http_client():
+    client = getattr(app.state, 'http', None)
+    if client is not None:
+        await client.aclose()
+        app.state.http = None
+
+
+@app.on_event("shutdown")
+def _shutdown_db_pool():
+    db.close_pool()
+
+
+def _get_http_client() -> httpx.AsyncClient:
+    # startup イベントを経ずに呼ばれた場合（スクリプトからの直接呼び出し等）も遅延生成する
+    client = getattr(app.state, 'http', None)
+    if client is None or client.is_closed:
+        client = _create_http_client()
+        app.state.http = client
+    return client
 
 # CORS設定
 app.add_middleware(
@@ -54,22 +108,51 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+def _capture_buffer_from_env(default=1000):
+    """保持するパケット数の上限（CAPTURE_BUFFER、未指定・不正なら既定値）"""
+    value = (os.getenv('CAPTURE_BUFFER') or '').strip()
+    if value:
+        try:
+            size = int(value)
+            if size > 0:
+                return size
+        except ValueError:
+            pass
+        print(f"CAPTURE_BUFFER の値が不正です（{default} を使います）: {value!r}")
+    return default
+
+
 # パケットキャプチャ用のグローバル変数
-capture_packets = []
-capture_raw_packets = []
+CAPTURE_MAX_PACKETS = _capture_buffer_from_env()
+capture_packets = deque(maxlen=CAPTURE_MAX_PACKETS)
+# pcap エクスポート用の生フレームはメモリに貯めず、キャプチャ中にファイルへ追記する（_CapturePcapWriter）
+capture_pcap = None
 is_capturing = False
 capture_thread = None
-capture_sniffer = None
+capture_socket = None
 capture_session_id = None
 stop_capture_flag = False
 
+# 受信スレッドは (ts, cls, raw_bytes) を積むだけにし、解析は別スレッドで行う
+CAPTURE_RAW_QUEUE_MAX = 4096
+capture_raw_queue = deque(maxlen=CAPTURE_RAW_QUEUE_MAX)
+# 解析が追いつかずキューから押し出されたフレーム数（pcap には残るが capture_packets には入らない）
+capture_dropped = 0
+
+# カーネル(BPF)側で解析対象外のフレームを落とす既定フィルタ（解析できるのは IPv4 と ARP のみ）
+DEFAULT_CAPTURE_FILTER = 'ip or arp'
+
 # エクスポート用ディレクトリ
 EXPORT_DIR = tempfile.gettempdir()
 
+# ホスト名はプロセス実行中に変わらない前提で起動時に1回だけ取得する（DB 保存時の既定値などに使う）
+HOSTNAME = socket.gethostname()
+
 def get_network_info():
     """ネットワーク情報を取得"""
     info = {
-        'hostname': socket.gethostname(),
+        'hostname': HOSTNAME,
         'platform': platform.system(),
         'interfaces': []
     }
@@ -239,324 +322,1014 @@ def get_network_stats():
         'dropout': stats.dropout
     }
 
+class PacketRecord:
+    """キャプチャしたパケット1件分の解析結果
+
+    パケットごとにネストした dict を作らないよう __slots__ の平坦な属性で保持し、
+    API 応答時に to_dict() で従来の JSON 形式へ変換する。
+    解説文・重要度、HTTP 先頭行・DNS 名のデコードはキャプチャ時には行わず、
+    初めて参照されたときに生成してキャッシュする（1000件のうち実際に読まれる分だけ計算すればよい）。
+    summary も Scapy の packet.summary() は使わず、解析済みのフィールドから参照時に組み立てる。
+    """
+
+    __slots__ = (
+        'ts', 'length', '_summary', 'type',
+        'src', 'dst', 'proto', 'ttl', 'version',
+        'sport', 'dport', 'flags', 'seq', 'ack', 'window', 'udp_length',
+        'icmp_type', 'icmp_code',
+        'arp_psrc', 'arp_pdst', 'arp_hwsrc', 'arp_hwdst', 'arp_op',
+        'payload_length', '_http_raw', '_dns_qname', '_dns_rdata',
+        '_http_data', '_dns_query', '_dns_answer',
+        '_explanation', '_importance',
+    )
+
+    def __init__(self, ts, length):
+        self.ts = ts
+        self.length = length
+        self._summary = None
+        self.type = 'Other'
+        self.src = None
+        self.dst = None
+        self.proto = None
+        self.ttl = None
+        self.version = None
+        self.sport = None
+        self.dport = None
+        self.flags = None
+        self.seq = None
+        self.ack = None
+        self.window = None
+        self.udp_length = None
+        self.icmp_type = None
+        self.icmp_code = None
+        self.arp_psrc = None
+        self.arp_pdst = None
+        self.arp_hwsrc = None
+        self.arp_hwdst = None
+        self.arp_op = None
+        self.payload_length = None
+        # 解析スレッドでは生の値だけ保持する（デコードは参照時）
+        self._http_raw = None
+        self._dns_qname = None
+        self._dns_rdata = None
+        self._http_data = None
+        self._dns_query = None
+        self._dns_answer = None
+        self._explanation = None
+        self._importance = None
+
+    @property
+    def summary(self):
+        if self._summary is None:
+            packet_type = self.type
+            if packet_type == 'TCP':
+                s = f"TCP {self.src}:{self.sport} > {self.dst}:{self.dport} {_hot.tcp_flags_str(self.flags or 0)}"
+            elif packet_type == 'UDP':
+                s = f"UDP {self.src}:{self.sport} > {self.dst}:{self.dport}"
+                if self.dns_query is not None:
+                    s += f" DNS {self.dns_query}"
+            elif packet_type == 'ICMP':
+                s = f"ICMP {self.src} > {self.dst} type={self.icmp_type} code={self.icmp_code}"
+            elif packet_type == 'ARP':
+                if self.arp_op == 2:
+                    s = f"ARP is at {self.arp_hwsrc} says {self.arp_psrc}"
+                else:
+                    s = f"ARP who has {self.arp_pdst} says {self.arp_psrc}"
+            elif self.src is not None:
+                s = f"IP {self.src} > {self.dst} proto={self.proto}"
+            else:
+                s = 'Other'
+            self._summary = s
+        return self._summary
+
+    @property
+    def http_data(self):
+        if self._http_data is None and self._http_raw is not None:
+            try:
+                payload_preview = self._http_raw.decode('utf-8', errors='ignore')
+                if payload_preview.startswith('GET') or payload_preview.startswith('POST') or payload_preview.startswith('HTTP'):
+                    self._http_data = payload_preview.split('\r\n')[0]
+            except Exception:
+                pass
+            self._http_raw = None
+        return self._http_data
+
+    @property
+    def dns_query(self):
+        if self._dns_query is None and self._dns_qname is not None:
+            try:
+                self._dns_query = self._dns_qname.decode('utf-8', errors='ignore')
+            except Exception:
+                pass
+            self._dns_qname = None
+        return self._dns_query
+
+    @property
+    def dns_answer(self):
+        if self._dns_answer is None and self._dns_rdata is not None:
+            try:
+                self._dns_answer = str(self._dns_rdata)
+            except Exception:
+                pass
+            self._dns_rdata = None
+        return self._dns_answer
+
+    @property
+    def explanation(self):
+        if self._explanation is None:
+            self._explanation = _hot.get_packet_explanation(
+                self.type, self.sport, self.dport, self.flags, self.icmp_type, self.arp_op, self.src, self.dst
+            )
+        return self._explanation
+
+    @property
+    def importance(self):
+        if self._importance is None:
+            self._importance = _hot.determine_packet_importance(self.type, self.dport, self.flags)
+        return self._importance
+
+    def to_dict(self):
+        """API/エクスポート用の dict（従来の packet_info と同じ形）に変換"""
+        info = {
+            'timestamp': datetime.fromtimestamp(self.ts).isoformat(),
+            'length': self.length,
+            'summary': self.summary,
+        }
+
+        if self.src is not None:
+            info['ip'] = {
+                'src': self.src,
+                'dst': self.dst,
+                'protocol': self.proto,
+                'ttl': self.ttl,
+                'version': self.version
+            }
+
+        if self.type == 'TCP':
+            info['tcp'] = {
+                'sport': self.sport,
+                'dport': self.dport,
+                'flags': _hot.tcp_flags_str(self.flags),
+                'seq': self.seq,
+                'ack': self.ack,
+                'window': self.window
+            }
+            info['type'] = self.type
+            if self.payload_length is not None:
+                info['payload_length'] = self.payload_length
+            if self.http_data is not None:
+                info['http_data'] = self.http_data
+        elif self.type == 'UDP':
+            info['udp'] = {
+                'sport': self.sport,
+                'dport': self.dport,
+                'length': self.udp_length
+            }
+            info['type'] = self.type
+            if self.dns_query is not None:
+                info['dns_query'] = self.dns_query
+            if self.dns_answer is not None:
+                info['dns_answer'] = self.dns_answer
+        elif self.type == 'ICMP':
+            info['icmp'] = {
+                'type': self.icmp_type,
+                'code': self.icmp_code
+            }
+        elif self.type == 'ARP':
+            info['arp'] = {
+                'psrc': self.arp_psrc,
+                'pdst': self.arp_pdst,
+                'hwsrc': self.arp_hwsrc,
+                'hwdst': self.arp_hwdst,
+                'op': self.arp_op
+            }
+
+        if 'type' not in info:
+            info['type'] = self.type
+        info['explanation'] = self.explanation
+        info['importance'] = self.importance
+        return info
+
+
+# パケットサイズ分布の上限値（以下）とラベル
+_SIZE_BUCKET_BOUNDS = (100, 500, 1000, 1500)
+_SIZE_BUCKET_LABELS = ('0-100', '101-500', '501-1000', '1001-1500', '1501+')
+_ENCRYPTED_DPORTS = frozenset((443, 22, 993, 995))
+_UNENCRYPTED_DPORTS = frozenset((80, 21, 23, 110))
+# 異常検知で「不審なポート番号」として数えるポート
+_SUSPICIOUS_PORTS = frozenset((
+    1337, 31337,  # ハッカーツールでよく使われるポート
+    4444, 5555,   # バックドアでよく使われるポート
+    6667, 6668, 6669,  # IRC（ボットネット通信）
+    12345, 54321,  # トロイの木馬
+    1234, 3127, 3128, 8080  # プロキシ/トンネル
+))
+# 不審IP分析で見る宛先ポート（バックドア・IRC ボットなど）。理由にはこの並びで最初に該当したものを出す
+_SUSPICIOUS_DPORTS = (1337, 31337, 4444, 5555, 6667)
+
+
+def _ipv4_net(cidr):
+    """'10.0.0.0/8' → (ネットワーク整数, マスク整数)"""
+    net, bits = cidr.split('/')
+    mask = (0xFFFFFFFF << (32 - int(bits))) & 0xFFFFFFFF
+    return struct.unpack('!I', socket.inet_aton(net))[0], mask
+
+
+# プライベート扱いにするアドレス範囲（RFC1918 + ループバック）
+_PRIVATE_NETS = tuple(_ipv4_net(c) for c in ('10.0.0.0/8', '172.16.0.0/12', '192.168.0.0/16', '127.0.0.0/8'))
+_ZERO_NET = _ipv4_net('0.0.0.0/8')
+_APIPA_NET = _ipv4_net('169.254.0.0/16')
+_MULTICAST_NETS = (_ipv4_net('224.0.0.0/8'), _ipv4_net('239.0.0.0/8'))
+
+
+def _ipv4_int(ip):
+    """IPv4 文字列を32ビット整数にする（解釈できなければ None）"""
+    try:
+        return struct.unpack('!I', socket.inet_aton(ip))[0]
+    except (OSError, struct.error):
+        return None
+
+
+def _counter_add(counter, key, n):
+    """Counter に n を加える。0 になったキーは削除する（ユニーク数・上位リストに残さない）"""
+    value = counter.get(key, 0) + n
+    if value:
+        counter[key] = value
+    else:
+        del counter[key]
+
+
+class _CaptureStats:
+    """capture_packets の中身に対する集計値を、追加・押し出しのたびに差分で保つ
+
+    統計 API はリングバッファを走査せず、ここの Counter のコピーを返すだけにする。
+    リングへの追加と集計の更新は同じロックの中で行い、件数と集計値を常に一致させる。
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # 結果キャッシュのキー。clear() でも戻さず、内容が変わるたびに増やす
+        self.version = 0
+        self.reset()
+
+    def reset(self):
+        self.protocol = Counter()
+        self.ports = Counter()
+        self.src_ips = Counter()
+        self.dst_ips = Counter()
+        self.ip_bytes = Counter()
+        self.sizes = Counter()
+        self.size_buckets = Counter()
+        self.size_sum = 0
+        self.importance = Counter()
+        self.encrypted = 0
+        self.unencrypted = 0
+        self.tcp_flags = Counter()
+        self.syn_counts = Counter()
+        self.rst_counts = Counter()
+        # 送信元IP → 宛先ポートごとの件数（押し出し時に減算できるよう set ではなく Counter）
+        self.ip_port_map = {}
+
+    def _apply(self, rec, n):
+        """1パケット分を集計に加える（n=1）/ 差し引く（n=-1）"""
+        packet_type = rec.type
+        size = rec.length or 0
+        _counter_add(self.protocol, packet_type or 'Unknown', n)
+        _counter_add(self.sizes, size, n)
+        _counter_add(self.size_buckets, bisect_left(_SIZE_BUCKET_BOUNDS, size), n)
+        self.size_sum += n * size
+        _counter_add(self.importance, rec.importance, n)
+
+        src = rec.src
+        if src is not None:
+            if src:
+                _counter_add(self.src_ips, src, n)
+                # 送信バイト数は 0 でも送信元として残すため、src_ips と同じキー集合で保つ
+                if src in self.src_ips:
+                    self.ip_bytes[src] += n * size
+                else:
+                    del self.ip_bytes[src]
+            if rec.dst:
+                _counter_add(self.dst_ips, rec.dst, n)
+
+        if packet_type != 'TCP' and packet_type != 'UDP':
+            return
+        sport = rec.sport
+        dport = rec.dport
+        if sport:
+            _counter_add(self.ports, sport, n)
+        if dport:
+            _counter_add(self.ports, dport, n)
+        if packet_type != 'TCP':
+            return
+
+        flags = rec.flags or 0
+        _counter_add(self.tcp_flags, flags, n)
+        if dport in _ENCRYPTED_DPORTS:
+            self.encrypted += n
+        elif dport in _UNENCRYPTED_DPORTS:
+            self.unencrypted += n
+        if src:
+            if rec.flags == _hot.TCP_SYN:
+                _counter_add(self.syn_counts, src, n)
+            if flags & _hot.TCP_RST:
+                _counter_add(self.rst_counts, src, n)
+            if dport:
+                ports = self.ip_port_map.get(src)
+                if ports is None:
+                    ports = self.ip_port_map[src] = Counter()
+                _counter_add(ports, dport, n)
+                if not ports:
+                    del self.ip_port_map[src]
+
+    def append(self, rec):
+        """リングバッファへ追加し、maxlen で押し出される最古のパケットの分を差し引く"""
+        with self.lock:
+            if len(capture_packets) == capture_packets.maxlen:
+                self._apply(capture_packets[0], -1)
+            capture_packets.append(rec)
+            self._apply(rec, 1)
+            self.version += 1
+
+    def extend(self, recs):
+        """append() をまとめて行う（ロックの取得を1回にする）"""
+        maxlen = capture_packets.maxlen
+        with self.lock:
+            for rec in recs:
+                if len(capture_packets) == maxlen:
+                    self._apply(capture_packets[0], -1)
+                capture_packets.append(rec)
+                self._apply(rec, 1)
+            self.version += 1
+
+    def clear(self):
+        with self.lock:
+            capture_packets.clear()
+            self.reset()
+            self.version += 1
+
+    def snapshot(self):
+        """集計値のコピーを返す（パケットが無ければ None）。ロックはコピーの間だけ持つ"""
+        with self.lock:
+            if not capture_packets:
+                return None
+            return {
+                'version': self.version,
+                'total_packets': len(capture_packets),
+                'first_ts': capture_packets[0].ts,
+                'last_ts': capture_packets[-1].ts,
+                'protocol': dict(self.protocol),
+                'ports': Counter(self.ports),
+                'src_ips': Counter(self.src_ips),
+                'dst_ips': Counter(self.dst_ips),
+                'ip_bytes': dict(self.ip_bytes),
+                'size_min': min(self.sizes),
+                'size_max': max(self.sizes),
+                'size_sum': self.size_sum,
+                'size_buckets': dict(self.size_buckets),
+                'importance': dict(self.importance),
+                'encrypted': self.encrypted,
+                'unencrypted': self.unencrypted,
+                'tcp_flags': dict(self.tcp_flags),
+                'syn_counts': dict(self.syn_counts),
+                'rst_counts': dict(self.rst_counts),
+                'ip_port_counts': {ip: len(ports) for ip, ports in self.ip_port_map.items()},
+                'suspicious_dports': {
+                    ip: port for ip, ports in self.ip_port_map.items()
+                    for port in (next((p for p in _SUSPICIOUS_DPORTS if p in ports), None),) if port
+                },
+            }
+
+
+capture_stats = _CaptureStats()
+
+
 def packet_callback(packet):
     """パケットキャプチャのコールバック関数"""
-    global capture_packets, capture_raw_packets, stop_capture_flag
-    
     if stop_capture_flag:
         return True
     
+    rec = _packet_record(packet)
+    if rec is not None:
+        # deque(maxlen) が古いものから O(1) で押し出す（押し出された分は集計から差し引く）
+        capture_stats.append(rec)
+    return False
+
+
+def _packet_record(packet):
+    """Scapy のパケットから PacketRecord を作る（解析できなければ None）"""
     try:
-        capture_raw_packets.append(packet)
-        
-        packet_info = {
-            'timestamp': datetime.now().isoformat(),
-            'length': len(packet),
-            'summary': packet.summary()
-        }
+        rec = PacketRecord(float(packet.time), len(packet))
         
-        if IP in packet:
-            packet_info['ip'] = {
-                'src': packet[IP].src,
-                'dst': packet[IP].dst,
-                'protocol': packet[IP].proto,
-                'ttl': packet[IP].ttl,
-                'version': packet[IP].version
-            }
+        # レイヤーは1回だけ取得してローカル変数で使い回す（packet[X] は毎回レイヤーを走査する）
+        ip = packet.getlayer(IP)
+        if ip is not None:
+            rec.src = ip.src
+            rec.dst = ip.dst
+            rec.proto = ip.proto
+            rec.ttl = ip.ttl
+            rec.version = ip.version
         
-        if TCP in packet:
-            packet_info['tcp'] = {
-                'sport': packet[TCP].sport,
-                'dport': packet[TCP].dport,
-                'flags': str(packet[TCP].flags),
-                'seq': packet[TCP].seq,
-                'ack': packet[TCP].ack,
-                'window': packet[TCP].window
-            }
-            packet_info['type'] = 'TCP'
+        if (tcp := packet.getlayer(TCP)) is not None:
+            dport = tcp.dport
+            rec.sport = tcp.sport
+            rec.dport = dport
+            # 文字列化せず整数のまま持つ（判定はビットマスクで行い、表示時に文字列へ変換）
+            rec.flags = int(tcp.flags)
+            rec.seq = tcp.seq
+            rec.ack = tcp.ack
+            rec.window = tcp.window
+            rec.type = 'TCP'
             
-            if hasattr(packet[TCP], 'payload'):
-                payload = bytes(packet[TCP].payload)
-                packet_info['payload_length'] = len(payload)
-                if len(payload) > 0 and packet[TCP].dport in [80, 8080]:
-                    try:
-                        payload_preview = payload[:200].decode('utf-8', errors='ignore')
-                        if payload_preview.startswith('GET') or payload_preview.startswith('POST') or payload_preview.startswith('HTTP'):
-                            packet_info['http_data'] = payload_preview.split('\r\n')[0]
-                    except:
-                        pass
+            payload = bytes(tcp.payload)
+            rec.payload_length = len(payload)
+            if payload and dport in (80, 8080):
+                # 先頭200バイトだけ保持し、HTTP 判定とデコードは http_data 参照時に行う
+                rec._http_raw = payload[:200]
                         
-        elif UDP in packet:
-            packet_info['udp'] = {
-                'sport': packet[UDP].sport,
-                'dport': packet[UDP].dport,
-                'length': packet[UDP].len
-            }
-            packet_info['type'] = 'UDP'
+        elif (udp := packet.getlayer(UDP)) is not None:
+            rec.sport = udp.sport
+            rec.dport = udp.dport
+            rec.udp_length = udp.len
+            rec.type = 'UDP'
             
-            if packet[UDP].dport == 53 or packet[UDP].sport == 53:
+            if udp.dport == 53 or udp.sport == 53:
                 try:
-                    from scapy.all import DNS
-                    if DNS in packet:
-                        dns = packet[DNS]
+                    dns = packet.getlayer(DNS)
+                    if dns is not None:
                         if dns.qd:
-                            packet_info['dns_query'] = dns.qd.qname.decode('utf-8', errors='ignore')
+                            rec._dns_qname = dns.qd.qname
                         if dns.an:
-                            packet_info['dns_answer'] = str(dns.an.rdata) if hasattr(dns.an, 'rdata') else 'Response'
+                            rec._dns_rdata = dns.an.rdata if hasattr(dns.an, 'rdata') else 'Response'
                 except:
                     pass
                     
-        elif ICMP in packet:
-            packet_info['icmp'] = {
-                'type': packet[ICMP].type,
-                'code': packet[ICMP].code
-            }
-            packet_info['type'] = 'ICMP'
+        elif (icmp := packet.getlayer(ICMP)) is not None:
+            rec.icmp_type = icmp.type
+            rec.icmp_code = icmp.code
+            rec.type = 'ICMP'
             
-        elif ARP in packet:
-            packet_info['arp'] = {
-                'psrc': packet[ARP].psrc,
-                'pdst': packet[ARP].pdst,
-                'hwsrc': packet[ARP].hwsrc,
-                'hwdst': packet[ARP].hwdst,
-                'op': packet[ARP].op
-            }
-            packet_info['type'] = 'ARP'
-        else:
-            packet_info['type'] = 'Other'
+        elif (arp := packet.getlayer(ARP)) is not None:
+            rec.arp_psrc = arp.psrc
+            rec.arp_pdst = arp.pdst
+            rec.arp_hwsrc = arp.hwsrc
+            rec.arp_hwdst = arp.hwdst
+            rec.arp_op = arp.op
+            rec.type = 'ARP'
         
-        packet_info['explanation'] = get_packet_explanation(packet_info)
-        packet_info['importance'] = determine_packet_importance(packet_info)
+        elif ip is None:
+            # IPv4/ARP 以外（IPv6 など）は元のフィールドが無いので Scapy の要約を使う（既定の BPF では来ない）
+            rec._summary = packet.summary()
         
-        capture_packets.append(packet_info)
-        
-        if len(capture_packets) > 1000:
-            capture_packets.pop(0)
-        
-        if len(capture_packets) >= 1000:
-            return True
-            
+        return rec
     except Exception as e:
         print(f"パケット処理エラー: {e}")
-    
-    return False
+        return None
 
-def determine_packet_importance(packet_info):
-    """パケットの重要度を判定"""
-    packet_type = packet_info.get('type')
-    
-    if packet_type == 'TCP':
-        tcp = packet_info.get('tcp', {})
-        dport = tcp.get('dport', 0)
-        if dport in [22, 443, 80, 3389, 21]:
-            return 'high'
-        if 'R' in tcp.get('flags', '') or 'F' in tcp.get('flags', ''):
-            return 'medium'
-    
-    if packet_type == 'UDP':
-        udp = packet_info.get('udp', {})
-        dport = udp.get('dport', 0)
-        if dport in [53, 67, 68]:
-            return 'medium'
-    
-    if packet_type == 'ICMP':
-        return 'medium'
-    
-    if packet_type == 'ARP':
-        return 'low'
-    
-    return 'normal'
+class _CapturePcapWriter:
+    """受信した生フレームを pcap 形式でファイルへ逐次追記する
 
-def get_packet_explanation(packet_info):
-    """パケットの解説を生成"""
-    explanation = []
-    
-    packet_type = packet_info.get('type', 'Unknown')
-    
-    if packet_type == 'TCP':
-        explanation.append("📌 TCP (Transmission Control Protocol): 信頼性の高いデータ転送を行うプロトコル")
-        tcp_info = packet_info.get('tcp', {})
-        sport = tcp_info.get('sport')
-        dport = tcp_info.get('dport')
-        flags = tcp_info.get('flags', '')
-        
-        if dport == 80:
-            explanation.append("🌐 ポート80: HTTP通信（暗号化されていないWeb通信）")
-            explanation.append("⚠️ セキュリティ: データが暗号化されていないため、盗聴のリスクがあります")
-        elif dport == 443:
-            explanation.append("🔒 ポート443: HTTPS通信（暗号化されたWeb通信）")
-            explanation.append("✅ セキュリティ: SSL/TLSで暗号化されており安全です")
-        elif dport == 22:
-            explanation.append("🔐 ポート22: SSH通信（リモートログイン）")
-            explanation.append("✅ セキュリティ: サーバーへの安全な接続です")
-        elif dport == 21:
-            explanation.append("📁 ポート21: FTP通信（ファイル転送）")
-            explanation.append("⚠️ セキュリティ: パスワードが平文で送信されるため推奨されません")
-        elif dport == 3389:
-            explanation.append("🖥️ ポート3389: RDP通信（リモートデスクトップ）")
-            explanation.append("💡 用途: Windows PCへのリモート接続です")
-        elif dport == 25:
-            explanation.append("📧 ポート25: SMTP通信（メール送信）")
-        elif dport == 110:
-            explanation.append("📬 ポート110: POP3通信（メール受信）")
-        elif dport == 143:
-            explanation.append("📮 ポート143: IMAP通信（メール受信）")
-        elif dport == 993:
-            explanation.append("🔒 ポート993: IMAPS通信（暗号化されたメール受信）")
-        elif dport == 3306:
-            explanation.append("🗄️ ポート3306: MySQL通信（データベース）")
-        elif dport == 5432:
-            explanation.append("🗄️ ポート5432: PostgreSQL通信（データベース）")
-        elif dport == 8080:
-            explanation.append("🌐 ポート8080: HTTP代替ポート（開発用Webサーバーなど）")
-        
-        if 'S' in flags and 'A' not in flags:
-            explanation.append("🔄 SYNフラグ: 接続開始リクエスト（3ウェイハンドシェイクの開始）")
-        elif 'S' in flags and 'A' in flags:
-            explanation.append("🤝 SYN-ACKフラグ: 接続受け入れ応答（3ウェイハンドシェイクの2段階目）")
-        elif 'F' in flags:
-            explanation.append("👋 FINフラグ: 接続終了リクエスト（正常な切断）")
-        elif 'R' in flags:
-            explanation.append("⛔ RSTフラグ: 接続リセット（異常な切断または拒否）")
-        elif 'P' in flags:
-            explanation.append("📤 PSHフラグ: データの即座送信（アプリケーションへすぐに渡す）")
-        
-    elif packet_type == 'UDP':
-        explanation.append("📌 UDP (User Datagram Protocol): 高速だが信頼性は低いプロトコル")
-        explanation.append("💡 特徴: 接続確立なし、データ到達保証なし、ストリーミングやゲームに最適")
-        udp_info = packet_info.get('udp', {})
-        sport = udp_info.get('sport')
-        dport = udp_info.get('dport')
-        
-        if dport == 53 or sport == 53:
-            explanation.append("🔍 ポート53: DNS通信（ドメイン名の解決）")
-            explanation.append("💡 役割: www.example.com → IPアドレスへの変換")
-        elif dport == 67 or dport == 68:
-            explanation.append(f"📡 ポート{dport}: DHCP通信（IPアドレスの自動割り当て）")
-            explanation.append("💡 役割: ネットワーク参加時に自動でIPアドレスを取得")
-        elif dport == 123:
-            explanation.append("⏰ ポート123: NTP通信（時刻同期）")
-            explanation.append("💡 役割: コンピュータの時計を正確に保つ")
-        elif dport == 137 or dport == 138:
-            explanation.append(f"🏷️ ポート{dport}: NetBIOSネーム通信")
-            explanation.append("💡 役割: Windowsネットワークでのコンピュータ名解決")
-        elif dport == 161 or dport == 162:
-            explanation.append(f"📊 ポート{dport}: SNMP通信（ネットワーク機器の監視）")
-        elif dport >= 5060 and dport <= 5061:
-            explanation.append("☎️ ポート5060-5061: SIP通信（VoIP電話）")
-        elif dport >= 27000 and dport <= 27050:
-            explanation.append("🎮 ポート27000番台: オンラインゲーム通信の可能性")
-        
-    elif packet_type == 'ICMP':
-        explanation.append("📌 ICMP: ネットワーク診断やエラー通知に使用されるプロトコル")
-        icmp_info = packet_info.get('icmp', {})
-        icmp_type = icmp_info.get('type')
-        
-        if icmp_type == 8:
-            explanation.append("🔔 Pingリクエスト（Echo Request）")
-            explanation.append("💡 用途: ネットワーク接続の確認、応答速度の測定")
-        elif icmp_type == 0:
-            explanation.append("✅ Ping応答（Echo Reply）")
-            explanation.append("💡 意味: 相手が正常に応答、ネットワークは正常")
-        elif icmp_type == 3:
-            explanation.append("⚠️ 到達不可能（Destination Unreachable）")
-            explanation.append("💡 原因: ファイアウォール、経路なし、サービス停止など")
-        elif icmp_type == 11:
-            explanation.append("⏱️ 時間超過（Time Exceeded）")
-            explanation.append("💡 原因: パケットが経路上で時間切れ（TTL=0）")
-        
-    elif packet_type == 'ARP':
-        explanation.append("📌 ARP (Address Resolution Protocol): IPアドレスからMACアドレスを解決")
-        explanation.append("💡 役割: ローカルネットワーク内でのデバイス通信に必要")
-        explanation.append("🔄 動作: 「このIPアドレスのMACアドレスを教えて」と問い合わせ")
-        arp_info = packet_info.get('arp', {})
-        if arp_info.get('op') == 1:
-            explanation.append("❓ ARPリクエスト: 誰かのMACアドレスを探しています")
-        elif arp_info.get('op') == 2:
-            explanation.append("✅ ARP応答: MACアドレスを返答しています")
-    
-    if packet_info.get('ip'):
-        ip_info = packet_info['ip']
-        src = ip_info.get('src', '')
-        dst = ip_info.get('dst', '')
-        
-        if src.startswith('192.168.') or src.startswith('10.') or src.startswith('172.'):
-            explanation.append(f"🏠 送信元 {src}: ローカルネットワーク内のデバイス")
-        elif src.startswith('127.'):
-            explanation.append(f"💻 送信元 {src}: 自分自身（ループバック）")
-        
-        if dst.startswith('192.168.') or dst.startswith('10.') or dst.startswith('172.'):
-            explanation.append(f"🏠 宛先 {dst}: ローカルネットワーク内のデバイス")
-        elif dst.startswith('127.'):
-            explanation.append(f"💻 宛先 {dst}: 自分自身（ループバック）")
-        elif dst.startswith('224.') or dst.startswith('239.'):
-            explanation.append(f"📢 宛先 {dst}: マルチキャスト（複数デバイスへの同時配信）")
-        elif dst == '255.255.255.255':
-            explanation.append("📣 宛先 255.255.255.255: ブロードキャスト（全デバイスへの配信）")
-    
-    return ' | '.join(explanation) if explanation else 'その他の通信'
+    1フレームごとに 16 バイトのレコードヘッダと生バイト列を書くだけなので、
+    Scapy オブジェクトを保持せずにセッション全体を pcap として残せる。
+    受信スレッドからの書き込みとエクスポート時の flush/コピーはロックで排他する。
+    """
+
+    _GLOBAL_HEADER = struct.Struct('<IHHiIII')  # magic, major, minor, thiszone, sigfigs, snaplen, linktype
+    _RECORD_HEADER = struct.Struct('<IIII')     # ts_sec, ts_usec, incl_len, orig_len
+    _SNAPLEN = 262144
+    # 書き込みはこの大きさのバッファに溜めてからまとめてディスクへ出す（fsync はしない）
+    _BUFFER_SIZE = 1024 * 1024
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._lock = threading.Lock()
+        self._file = open(path, 'wb', buffering=self._BUFFER_SIZE)
+        self._header_written = False
+
+    def write(self, ts, cls, data):
+        with self._lock:
+            f = self._file
+            if f is None:
+                return
+            if not self._header_written:
+                # リンク種別は最初のフレームのレイヤークラスから決める（Ethernet なら 1）
+                linktype = conf.l2types.layer2num.get(cls, 1)
+                f.write(self._GLOBAL_HEADER.pack(0xA1B2C3D4, 2, 4, 0, 0, self._SNAPLEN, linktype))
+                self._header_written = True
+            sec = int(ts)
+            usec = min(int((ts - sec) * 1000000), 999999)
+            size = len(data)
+            f.write(self._RECORD_HEADER.pack(sec, usec, size, size))
+            f.write(data)
+            self.count += 1
+
+    def copy_to(self, dest):
+        """書き込み途中のファイルを flush してその時点までの内容を dest にコピーする"""
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+            shutil.copyfile(self.path, dest)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    @property
+    def closed(self):
+        return self._file is None
+
+    def remove(self):
+        self.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+_ETH_HEADER_LEN = 14
+_ETHERTYPE_IPV4 = 0x0800
+_IPPROTO_ICMP = 1
+_IPPROTO_TCP = 6
+_IPPROTO_UDP = 17
+_IPV4_HEADER = struct.Struct('!BxHxxHBBxx4s4s')  # ver_ihl, total_len, flags_frag, ttl, proto, src, dst
+_TCP_HEADER = struct.Struct('!HHIIHH')          # sport, dport, seq, ack, off_flags, window
+_UDP_HEADER = struct.Struct('!HHH')             # sport, dport, len
+_ICMP_FAST_TYPES = frozenset((0, 3, 8, 11))
+# Scapy が上位レイヤーを結び付けている UDP ポート（DNS やトンネル内の TCP など）は Scapy 側で解析する
+_UDP_SCAPY_PORTS = frozenset(
+    port for fields, _cls in UDP.payload_guess for key, port in fields.items() if key in ('sport', 'dport')
+)
+
+# 4バイトのアドレス → 文字列。キャプチャ中は同じアドレスが繰り返し現れるので、
+# 毎回 inet_ntoa で新しい str を作らず同じオブジェクトを使い回す（上限を超えたら作り直す）
+_IPV4_STR_CACHE = {}
+_IPV4_STR_CACHE_MAX = 65536
+
+
+def _ipv4_str(raw):
+    if len(_IPV4_STR_CACHE) >= _IPV4_STR_CACHE_MAX:
+        _IPV4_STR_CACHE.clear()
+    s = _IPV4_STR_CACHE[raw] = socket.inet_ntoa(raw)
+    return s
+
+
+def _parse_frame_fast(ts, cls, data):
+    """Ethernet/IPv4 の TCP・UDP・ICMP を struct で直接解析する
+
+    Scapy でパケットオブジェクトを組み立てずに、必要な固定長フィールドだけを読む。
+    ARP・DNS・VLAN・フラグメント・ヘッダ不足など対象外のフレームは None を返し、
+    呼び出し側で従来どおり Scapy で解析する。
+    """
+    if cls is not Ether or len(data) < _ETH_HEADER_LEN + 20:
+        return None
+    if data[12] << 8 | data[13] != _ETHERTYPE_IPV4:
+        return None
+
+    ver_ihl, total_len, flags_frag, ttl, proto, src, dst = _IPV4_HEADER.unpack_from(data, _ETH_HEADER_LEN)
+    ihl = (ver_ihl & 0x0F) * 4
+    off = _ETH_HEADER_LEN + ihl
+    size = len(data)
+    if ihl < 20 or flags_frag & 0x1FFF or size < off:
+        return None
+    # IP の全長より後ろは Ethernet のパディング（Scapy と同じく全長が不正なら末尾までを使う）
+    seg_end = min(size, _ETH_HEADER_LEN + total_len) if total_len >= ihl else size
+
+    if proto == _IPPROTO_TCP:
+        if seg_end < off + 20:
+            return None
+        sport, dport, seq, ack, off_flags, window = _TCP_HEADER.unpack_from(data, off)
+        header_len = (off_flags >> 12) * 4
+        if header_len < 20:
+            return None
+        payload_off = min(off + header_len, seg_end)
+        rec = PacketRecord(float(ts), size)
+        rec.type = 'TCP'
+        rec.sport = sport
+        rec.dport = dport
+        rec.flags = off_flags & 0x1FF
+        rec.seq = seq
+        rec.ack = ack
+        rec.window = window
+        rec.payload_length = size - payload_off
+        if payload_off < size and dport in (80, 8080):
+            rec._http_raw = data[payload_off:payload_off + 200]
+    elif proto == _IPPROTO_UDP:
+        if seg_end < off + 8:
+            return None
+        sport, dport, udp_len = _UDP_HEADER.unpack_from(data, off)
+        if sport in _UDP_SCAPY_PORTS or dport in _UDP_SCAPY_PORTS:
+            return None
+        rec = PacketRecord(float(ts), size)
+        rec.type = 'UDP'
+        rec.sport = sport
+        rec.dport = dport
+        rec.udp_length = udp_len
+    elif proto == _IPPROTO_ICMP:
+        # ヘッダ長が8バイト固定の Echo / Echo Reply / 到達不能 / 時間超過だけを扱う
+        if seg_end < off + 8 or data[off] not in _ICMP_FAST_TYPES:
+            return None
+        rec = PacketRecord(float(ts), size)
+        rec.type = 'ICMP'
+        rec.icmp_type = data[off]
+        rec.icmp_code = data[off + 1]
+    else:
+        return None
+
+    rec.src = _IPV4_STR_CACHE.get(src) or _ipv4_str(src)
+    rec.dst = _IPV4_STR_CACHE.get(dst) or _ipv4_str(dst)
+    rec.proto = proto
+    rec.ttl = ttl
+    rec.version = ver_ihl >> 4
+    return rec
+
+
+# 解析済みレコードはこの件数ずつまとめて capture_packets に反映する（キューが空になったときも反映）
+_DISSECT_BATCH = 64
+
+
+def _dissect_worker(reader_done):
+    """受信キューから生フレームを取り出して解析する（解析を受信ループから切り離す）
+
+    解析は GIL の下で CPU を使うため、スレッドを増やさず1本で順番に処理する
+    （capture_packets と pcap の並びも受信順のまま保てる）。
+    """
+    batch = []
+    while True:
+        try:
+            ts, cls, data = capture_raw_queue.popleft()
+        except IndexError:
+            if batch:
+                capture_stats.extend(batch)
+                batch = []
+            if reader_done.is_set() or stop_capture_flag:
+                break
+            time.sleep(0.01)
+            continue
+        if stop_capture_flag:
+            break
+
+        rec = _parse_frame_fast(ts, cls, data)
+        if rec is None:
+            try:
+                packet = cls(data)
+                packet.time = ts
+            except Exception as e:
+                print(f"パケット解析エラー: {e}")
+                continue
+            rec = _packet_record(packet)
+        if rec is not None:
+            batch.append(rec)
+            if len(batch) >= _DISSECT_BATCH:
+                capture_stats.extend(batch)
+                batch = []
+    if batch:
+        capture_stats.extend(batch)
+
+
+def _capture_cpu_from_env():
+    """受信スレッドを固定する CPU 番号（CAPTURE_CPU=none で固定しない、未指定なら使用可能な最後のコア）"""
+    value = (os.getenv('CAPTURE_CPU') or '').strip().lower()
+    if value in ('none', 'off', '-1'):
+        return None
+    if value:
+        try:
+            return int(value)
+        except ValueError:
+            print(f"CAPTURE_CPU の値が不正です（無視します）: {value!r}")
+    try:
+        allowed = psutil.Process().cpu_affinity()
+    except Exception:
+        allowed = None
+    if allowed:
+        return allowed[-1]
+    count = psutil.cpu_count() or 1
+    return count - 1 if count > 1 else None
+
+
+def _boost_capture_thread():
+    """呼び出し元スレッド（受信ループ）を1コアに固定し、優先度を上げる（ベストエフォート）
+
+    受信ループが FastAPI のワーカーと同じコアを奪い合うとカーネルのリングバッファで取りこぼすため、
+    プロセス全体ではなくこのスレッドだけを対象にする。権限不足などで失敗しても続行する。
+    """
+    cpu = _capture_cpu_from_env()
 
-def capture_packets_thread(interface, packet_count):
-    """パケットキャプチャを別スレッドで実行（AsyncSnifferを使い即時停止をサポート）"""
-    global is_capturing, stop_capture_flag, capture_sniffer
+    if platform.system() == 'Windows':
+        try:
+            import ctypes
+            kernel32 = ctypes.windll.kernel32
+            handle = kernel32.GetCurrentThread()
+            if cpu is not None and 0 <= cpu < 64:
+                kernel32.SetThreadAffinityMask(handle, ctypes.c_size_t(1 << cpu))
+            THREAD_PRIORITY_HIGHEST = 2
+            kernel32.SetThreadPriority(handle, THREAD_PRIORITY_HIGHEST)
+        except Exception as e:
+            print(f"キャプチャスレッドの優先度設定に失敗しました: {e}")
+        return
+
+    # Linux では pid=0 / スレッドID 指定でスレッド単位に設定できる
+    if cpu is not None and hasattr(os, 'sched_setaffinity'):
+        try:
+            os.sched_setaffinity(0, {cpu})
+        except Exception as e:
+            print(f"キャプチャスレッドのCPU固定に失敗しました: cpu={cpu}: {e}")
+    if hasattr(os, 'setpriority'):
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), -10)
+        except Exception as e:
+            print(f"キャプチャスレッドの優先度設定に失敗しました: {e}")
+
+
+# 受信ソケットのカーネル側バッファ。解析が一時的に遅れてもバースト分をここで吸収する
+CAPTURE_RCVBUF_BYTES = 32 * 1024 * 1024
+
+
+def _enlarge_receive_buffer(sock):
+    """受信バッファを広げる（生ソケットを持たない pcap/Npcap 経由のソケットでは何もしない）"""
+    ins = getattr(sock, 'ins', None)
+    if not hasattr(ins, 'setsockopt'):
+        return
+    try:
+        ins.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, CAPTURE_RCVBUF_BYTES)
+    except OSError as e:
+        print(f"受信バッファを拡大できませんでした: {e}")
+
+
+# 受信を tcpdump に任せる場合は CAPTURE_BACKEND=tcpdump（Linux/macOS。Windows では使わない）
+CAPTURE_SNAPLEN = 2000
+_PCAP_GLOBAL_HEADER = struct.Struct('<IHHiIII')
+_PCAP_MAGIC_US = 0xA1B2C3D4
+_PCAP_MAGIC_NS = 0xA1B23C4D
+
+
+class _TcpdumpCapture:
+    """tcpdump -w - の出力を読む受信ソース
+
+    conf.L2listen と同じ select / recv_raw / close を持ち、受信ループをそのまま使える。
+    受信と BPF の評価は tcpdump プロセス側で行われ、Python は pcap レコードを切り出すだけになる。
+    """
+
+    def __init__(self, tcpdump, interface, bpf_filter):
+        cmd = [tcpdump, '-n', '-U', '-w', '-', '-s', str(CAPTURE_SNAPLEN)]
+        if interface:
+            cmd += ['-i', interface]
+        if bpf_filter:
+            cmd.append(bpf_filter)
+        self.proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=0)
+        self._fd = self.proc.stdout.fileno()
+        try:
+            header = self._read_exact(_PCAP_GLOBAL_HEADER.size)
+            if header is None:
+                raise OSError(f"tcpdump が終了しました (exit={self.proc.wait()})")
+            magic = struct.unpack('<I', header[:4])[0]
+            endian = '<'
+            if magic not in (_PCAP_MAGIC_US, _PCAP_MAGIC_NS):
+                endian = '>'
+                magic = struct.unpack('>I', header[:4])[0]
+            if magic not in (_PCAP_MAGIC_US, _PCAP_MAGIC_NS):
+                raise OSError(f"tcpdump の出力が pcap 形式ではありません: {header[:4].hex()}")
+            linktype = struct.unpack(endian + 'I', header[20:24])[0]
+        except Exception:
+            self.close()
+            raise
+        self._record = struct.Struct(endian + 'IIII')
+        self._frac = 1e-9 if magic == _PCAP_MAGIC_NS else 1e-6
+        self.cls = conf.l2types.num2layer.get(linktype, conf.raw_layer)
+
+    def _read_exact(self, size):
+        buf = b''
+        while len(buf) < size:
+            chunk = os.read(self._fd, size - len(buf))
+            if not chunk:
+                return None
+            buf += chunk
+        return buf
+
+    def select(self, sockets, timeout):
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        return ready
+
+    def recv_raw(self):
+        header = self._read_exact(self._record.size)
+        if header is None:
+            raise EOFError('tcpdump の出力が終了しました')
+        sec, frac, caplen, _ = self._record.unpack(header)
+        data = self._read_exact(caplen)
+        if data is None:
+            raise EOFError('tcpdump の出力が終了しました')
+        return self.cls, data, sec + frac * self._frac
+
+    def close(self):
+        if self.proc.poll() is None:
+            self.proc.terminate()
+            try:
+                self.proc.wait(timeout=2.0)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+        self.proc.stdout.close()
+
+
+def _tcpdump_path():
+    """CAPTURE_BACKEND=tcpdump のときに使う tcpdump のパス（使わない・見つからなければ None）"""
+    if (os.getenv('CAPTURE_BACKEND') or '').strip().lower() != 'tcpdump':
+        return None
+    if platform.system() == 'Windows':
+        print("CAPTURE_BACKEND=tcpdump は Windows では使えません（Scapy で受信します）")
+        return None
+    path = shutil.which('tcpdump')
+    if path is None:
+        print("tcpdump が見つかりません（Scapy で受信します）")
+    return path
+
+
+def _open_capture_socket(interface, bpf_filter):
+    """BPFフィルタ付きで受信ソケットを開く（フィルタが使えない環境ではフィルタなしで開き直す）"""
+    tcpdump = _tcpdump_path()
+    if tcpdump:
+        try:
+            return _TcpdumpCapture(tcpdump, interface, bpf_filter)
+        except Exception as e:
+            print(f"tcpdump を起動できませんでした（Scapy で受信します）: {e}")
+    sock = None
+    if bpf_filter:
+        try:
+            sock = conf.L2listen(iface=interface, filter=bpf_filter)
+        except Exception as e:
+            print(f"BPFフィルタを適用できませんでした（フィルタなしで続行）: {bpf_filter!r}: {e}")
+    if sock is None:
+        sock = conf.L2listen(iface=interface)
+    _enlarge_receive_buffer(sock)
+    return sock
+
+
+def capture_packets_thread(interface, packet_count, bpf_filter=DEFAULT_CAPTURE_FILTER):
+    """パケットキャプチャを別スレッドで実行
+
+    受信ループは pcap ソケットから生バイト列を受け取りキューに積むだけにし、
+    Scapy による解析は _dissect_worker スレッドで行う（受信側の取りこぼしを減らす）。
+    bpf_filter はカーネル側で評価され、一致しないフレームは Python まで上がってこない。
+    """
+    global is_capturing, stop_capture_flag, capture_socket, capture_dropped
     stop_capture_flag = False
+    capture_raw_queue.clear()
+    capture_dropped = 0
 
     print(f"パケットキャプチャ開始: {packet_count}個のパケットを収集")
 
-    try:
-        # Use AsyncSniffer to allow immediate stop() from another thread
-        capture_sniffer = AsyncSniffer(
-            iface=interface,
-            prn=packet_callback,
-            store=False,
-            count=packet_count,
-            timeout=None
-        )
-        capture_sniffer.start()
+    reader_done = threading.Event()
+    worker = threading.Thread(target=_dissect_worker, args=(reader_done,), daemon=True)
 
-        # Wait until sniffer stops (either reached count or stopped externally)
-        while capture_sniffer.running:
-            # Check stop flag and if set, call stop() to interrupt sniffing immediately
-            if stop_capture_flag and capture_sniffer.running:
-                try:
-                    capture_sniffer.stop()
-                except Exception:
-                    pass
-                break
-            time.sleep(0.1)
+    try:
+        capture_socket = _open_capture_socket(interface, bpf_filter)
+        worker.start()
+        # 解析スレッドは既定のまま、受信ループのスレッドだけを固定・優先する
+        _boost_capture_thread()
+
+        # pcap は解析キューより前に受信ループで書くので、解析が遅れても取りこぼさない
+        writer = capture_pcap
+        received = 0
+        while not stop_capture_flag and received < packet_count:
+            # select で待機し、停止フラグを定期的に確認できるようにする
+            if not capture_socket.select([capture_socket], 0.1):
+                continue
+            raw = capture_socket.recv_raw()
+            if not raw or raw[1] is None:
+                continue
+            cls, data, ts = raw
+            if ts is None:
+                ts = time.time()
+            if writer is not None:
+                writer.write(ts, cls, data)
+            # 満杯の deque への append は一番古いフレームを黙って捨てるので、ここで数えておく
+            if len(capture_raw_queue) == CAPTURE_RAW_QUEUE_MAX:
+                capture_dropped += 1
+            capture_raw_queue.append((ts, cls, data))
+            received += 1
+
+        reader_done.set()
+        worker.join()
 
         print(f"パケットキャプチャ終了: {len(capture_packets)}個のパケットを収集しました")
+        if capture_dropped:
+            print(f"解析が追いつかず {capture_dropped} 個のパケットを解析せずに破棄しました（pcap には保存済み）")
     except KeyboardInterrupt:
         print("パケットキャプチャが中断されました")
     except Exception as e:
         print(f"キャプチャエラー: {e}")
     finally:
         # cleanup
-        if capture_sniffer and capture_sniffer.running:
+        reader_done.set()
+        if capture_socket:
             try:
-                capture_sniffer.stop()
+                capture_socket.close()
             except Exception:
                 pass
-        capture_sniffer = None
+        capture_socket = None
+        if capture_pcap is not None:
+            capture_pcap.close()
         is_capturing = False
         stop_capture_flag = False
         print("キャプチャスレッドが正常に終了しました")
 
+class _ThreadpoolTTLCache:
+    """同期関数をスレッドプールで実行し、結果を ttl_s 秒キャッシュする
+
+    netsh/psutil の呼び出しでイベントループを止めないようにし、
+    同時に来たリクエストはロックで1回の実行にまとめる。
+    """
+
+    def __init__(self, func, ttl_s):
+        self._func = func
+        self._ttl_s = ttl_s
+        self._lock = asyncio.Lock()
+        self._value = None
+        self._expires_at = 0.0
+
+    async def get(self):
+        if time.monotonic() < self._expires_at:
+            return self._value
+        async with self._lock:
+            if time.monotonic() < self._expires_at:
+                return self._value
+            value = await run_in_threadpool(self._func)
+            self._value = value
+            self._expires_at = time.monotonic() + self._ttl_s
+            return value
+
+
+_network_info_cache = _ThreadpoolTTLCache(get_network_info, ttl_s=1.0)
+_wifi_info_cache = _ThreadpoolTTLCache(get_wifi_info, ttl_s=5.0)
+_network_stats_cache = _ThreadpoolTTLCache(get_network_stats, ttl_s=1.0)
+
+
+class _WebSocketBroadcaster:
+    """1つのバックグラウンドタスクで定期的に値を取得し、接続中の全 WebSocket に配信する
+
+    クライアントごとにポーリングさせず、取得とシリアライズは1周期に1回だけ行う。
+    タスクは最初のクライアント接続で起動し、全員が切断すると終了する。
+    """
+
+    def __init__(self, fetch, interval_s):
+        self._fetch = fetch
+        self._interval_s = interval_s
+        self._clients = set()
+        self._task = None
+
+    async def serve(self, websocket: WebSocket):
+        await websocket.accept()
+        self._clients.add(websocket)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        try:
+            # クライアントからのメッセージは使わない（切断の検知だけ）
+            while True:
+                await websocket.receive_text()
+        except WebSocketDisconnect:
+            pass
+        finally:
+            self._clients.discard(websocket)
+
+    async def _run(self):
+        while self._clients:
+            try:
+                payload = await self._fetch()
+            except Exception as e:
+                payload = {'error': str(e)}
+            text = orjson.dumps(payload).decode('utf-8')
+            for ws in list(self._clients):
+                try:
+                    await ws.send_text(text)
+                except Exception:
+                    self._clients.discard(ws)
+            await asyncio.sleep(self._interval_s)
+
+
+_network_stats_broadcaster = _WebSocketBroadcaster(_network_stats_cache.get, interval_s=1.0)
+
+
 # APIエンドポイント
 @app.get("/api/network-info")
 async def network_info():
     """ネットワーク情報のエンドポイント"""
-    return get_network_info()
+    return await _network_info_cache.get()
 
 @app.get("/api/wifi-info")
 async def wifi_info():
     """WiFi情報のエンドポイント"""
-    return get_wifi_info()
+    return await _wifi_info_cache.get()
 
 @app.get("/api/network-stats")
 async def network_stats():
     """ネットワーク統計のエンドポイント"""
-    return get_network_stats()
+    return await _network_stats_cache.get()
+
+@app.websocket("/ws/network-stats")
+async def network_stats_ws(websocket: WebSocket):
+    """ネットワーク統計を1秒ごとに push する（全クライアントで1回の取得を共有）"""
+    await _network_stats_broadcaster.serve(websocket)
 
 
 @app.get("/api/network/lan-devices")
@@ -713,7 +1486,7 @@ async def nmap_network_ports(
 
 
 @app.get("/api/db/health")
-async def database_health():
+def database_health():
     """PostgreSQL 接続ヘルスチェック（DATABASE_URL が必要）"""
     return db.db_health()
 
@@ -725,30 +1498,24 @@ async def system_specs_endpoint():
 
 
 @app.get("/api/system/process-snapshot")
-async def process_snapshot(
+def process_snapshot(
     sample_ms: int = Query(200, ge=50, le=2000),
     limit: int = Query(250, ge=1, le=2000),
     timeout_s: int = Query(10, ge=1, le=60),
     save: bool = Query(False),
 ):
     """タスクマネージャ相当のプロセス情報を収集。save=true でDB保存。"""
-    try:
-        payload = await asyncio.wait_for(
-            run_in_threadpool(
-                windows_collect.collect_process_snapshot,
-                sample_ms=sample_ms,
-                limit=limit,
-                timeout_s=timeout_s,
-            ),
-            timeout=timeout_s + 5,
-        )
-    except asyncio.TimeoutError:
-        raise HTTPException(status_code=504, detail="process snapshot timed out")
+    # タイムアウトは収集関数側が timeout_s で打ち切る（同期ハンドラなので FastAPI がスレッドプールで実行する）
+    payload = windows_collect.collect_process_snapshot(
+        sample_ms=sample_ms,
+        limit=limit,
+        timeout_s=timeout_s,
+    )
 
     if save:
         try:
             db_id = db.insert_process_snapshot(
-                hostname=payload.get('hostname') or socket.gethostname(),
+                hostname=payload.get('hostname') or HOSTNAME,
                 summary=payload.get('summary') or {},
                 processes=payload.get('processes') or [],
             )
@@ -762,43 +1529,31 @@ async def process_snapshot(
 
 
 @app.get("/api/windows/services")
-async def windows_services(
+def windows_services(
     limit: int = Query(500, ge=1, le=5000),
     timeout_s: int = Query(10, ge=1, le=60),
 ):
     """Windowsサービス一覧（タスクマネージャーのサービス相当）を返す。"""
-    try:
-        payload = await asyncio.wait_for(
-            run_in_threadpool(
-                windows_collect.collect_windows_services,
-                limit=limit,
-                timeout_s=timeout_s,
-            ),
-            timeout=timeout_s + 5,
-        )
-    except asyncio.TimeoutError:
-        raise HTTPException(status_code=504, detail="windows services timed out")
+    payload = windows_collect.collect_windows_services(
+        limit=limit,
+        timeout_s=timeout_s,
+    )
 
     return payload
 
 
 @app.get("/api/windows/startup-apps")
-async def windows_startup_apps(
+def windows_startup_apps(
     limit: int = Query(200, ge=1, le=2000),
     timeout_s: int = Query(15, ge=5, le=120),
 ):
     """スタートアップアプリ一覧（タスクマネージャー相当）を返す。"""
-    try:
-        payload = await asyncio.wait_for(
-            run_in_threadpool(
-                windows_collect.collect_startup_apps,
-                limit=limit,
-                timeout_s=timeout_s,
-            ),
-            timeout=timeout_s + 5,
-        )
-    except asyncio.TimeoutError:
-        raise HTTPException(status_code=504, detail="startup apps timed out")
+    payload = windows_collect.collect_startup_apps(
+        limit=limit,
+        timeout_s=timeout_s,
+    )
+
+    return payload
 
 
 @app.get("/api/windows/registry/report")
@@ -843,7 +1598,7 @@ async def diagnostics_connectivity(req: ConnectivityRequest):
         )
         return {
             "collected_at": datetime.utcnow().isoformat() + "Z",
-            "hostname": socket.gethostname(),
+            "hostname": HOSTNAME,
             "request": req.model_dump(),
             "results": payload,
         }
@@ -930,10 +1685,10 @@ async def report_all(
     """主要タブの情報をまとめたレポートJSONを返す（重い項目は控えめ）。"""
     out: Dict[str, Any] = {
         "collected_at": datetime.utcnow().isoformat() + "Z",
-        "hostname": socket.gethostname(),
-        "network_info": get_network_info(),
-        "wifi_info": get_wifi_info(),
-        "network_stats": get_network_stats(),
+        "hostname": HOSTNAME,
+        "network_info": await _network_info_cache.get(),
+        "wifi_info": await _wifi_info_cache.get(),
+        "network_stats": await _network_stats_cache.get(),
     }
 
     # system specs
@@ -1001,7 +1756,9 @@ async def report_all(
     # eventlog (summary only; respect max_events)
     try:
         if max_events > 0:
-            out["eventlog"] = await windows_eventlog(log_name="System", since_hours=24, max_events=max_events, save=False)
+            out["eventlog"] = await run_in_threadpool(
+                windows_eventlog, log_name="System", since_hours=24, max_events=max_events, timeout_s=30, save=False
+            )
     except Exception as e:
         out["eventlog_error"] = str(e)
 
@@ -1009,28 +1766,21 @@ async def report_all(
 
 
 @app.post("/api/system/app-history/sample")
-async def app_history_sample(
+def app_history_sample(
     save: bool = Query(True),
     timeout_s: int = Query(10, ge=1, le=60),
     limit: int = Query(2000, ge=1, le=5000),
 ):
     """アプリ履歴用の“サンプル”を採取。save=true でDB保存。"""
-    try:
-        payload = await asyncio.wait_for(
-            run_in_threadpool(
-                windows_collect.collect_app_usage_sample,
-                timeout_s=timeout_s,
-                limit=limit,
-            ),
-            timeout=timeout_s + 5,
-        )
-    except asyncio.TimeoutError:
-        raise HTTPException(status_code=504, detail="app history sample timed out")
+    payload = windows_collect.collect_app_usage_sample(
+        timeout_s=timeout_s,
+        limit=limit,
+    )
 
     if save:
         try:
             db_id = db.insert_app_usage_sample(
-                hostname=payload.get('hostname') or socket.gethostname(),
+                hostname=payload.get('hostname') or HOSTNAME,
                 sample=payload,
             )
             payload['db_saved'] = True
@@ -1042,8 +1792,26 @@ async def app_history_sample(
     return payload
 
 
+# サンプル中のプロセス別累積カウンタ → 集計結果のキー
+_APP_HISTORY_COUNTERS = (
+    ('cpu_user', 'cpu_user_s'),
+    ('cpu_system', 'cpu_system_s'),
+    ('io_read_bytes', 'io_read_bytes'),
+    ('io_write_bytes', 'io_write_bytes'),
+)
+
+
+def _app_history_proc_key(p: Dict[str, Any]) -> Optional[Tuple[int, float]]:
+    """2つのサンプル間で同一プロセスを突き合わせるキー（PID再利用に備えて起動時刻も含める）"""
+    pid = p.get('pid')
+    ct = p.get('create_time')
+    if isinstance(pid, int) and isinstance(ct, (int, float)):
+        return (pid, ct)
+    return None
+
+
 @app.get("/api/system/app-history")
-async def app_history(
+def app_history(
     since_hours: int = Query(24, ge=1, le=24 * 365),
     hostname: Optional[str] = Query(None),
     limit: int = Query(50, ge=1, le=500),
@@ -1077,40 +1845,28 @@ async def app_history(
             "apps": [],
         }
 
-    def key(p: dict) -> Optional[str]:
-        pid = p.get('pid')
-        ct = p.get('create_time')
-        if isinstance(pid, int) and isinstance(ct, (int, float)):
-            return f"{pid}:{ct}"
-        return None
-
-    first_map = {key(p): p for p in first_procs if isinstance(p, dict) and key(p)}
+    first_map: Dict[Any, Dict[str, Any]] = {}
+    for p in first_procs:
+        if isinstance(p, dict):
+            k = _app_history_proc_key(p)
+            if k is not None:
+                first_map[k] = p
 
     agg: Dict[str, Dict[str, Any]] = {}
     for p in last_procs:
         if not isinstance(p, dict):
             continue
-        k = key(p)
-        if not k or k not in first_map:
+        k = _app_history_proc_key(p)
+        p0 = first_map.get(k) if k is not None else None
+        if p0 is None:
             continue
-        p0 = first_map[k]
 
         name = p.get('name') or p0.get('name') or '(unknown)'
         if not isinstance(name, str):
             name = str(name)
 
-        def _delta_num(a: Any, b: Any) -> Optional[float]:
-            if isinstance(a, (int, float)) and isinstance(b, (int, float)):
-                return float(a - b)
-            return None
-
-        cpu_user = _delta_num(p.get('cpu_user'), p0.get('cpu_user'))
-        cpu_sys = _delta_num(p.get('cpu_system'), p0.get('cpu_system'))
-        io_r = _delta_num(p.get('io_read_bytes'), p0.get('io_read_bytes'))
-        io_w = _delta_num(p.get('io_write_bytes'), p0.get('io_write_bytes'))
-
         item = agg.get(name)
-        if not item:
+        if item is None:
             item = {
                 "name": name,
                 "cpu_user_s": 0.0,
@@ -1121,20 +1877,22 @@ async def app_history(
             }
             agg[name] = item
 
-        if isinstance(cpu_user, float):
-            item["cpu_user_s"] += max(0.0, cpu_user)
-        if isinstance(cpu_sys, float):
-            item["cpu_system_s"] += max(0.0, cpu_sys)
-        if isinstance(io_r, float):
-            item["io_read_bytes"] += max(0.0, io_r)
-        if isinstance(io_w, float):
-            item["io_write_bytes"] += max(0.0, io_w)
+        # 累積カウンタの差分（負値=カウンタのリセット等は0扱い）
+        for src_key, out_key in _APP_HISTORY_COUNTERS:
+            a = p.get(src_key)
+            b = p0.get(src_key)
+            if isinstance(a, (int, float)) and isinstance(b, (int, float)):
+                delta = float(a - b)
+                if delta > 0.0:
+                    item[out_key] += delta
 
         item["process_count"] += 1
 
-    apps = list(agg.values())
-    apps.sort(key=lambda x: (x.get('cpu_user_s', 0.0) + x.get('cpu_system_s', 0.0)), reverse=True)
-    apps = apps[: max(1, min(500, int(limit)))]
+    apps = heapq.nlargest(
+        max(1, min(500, int(limit))),
+        agg.values(),
+        key=lambda x: (x.get('cpu_user_s', 0.0) + x.get('cpu_system_s', 0.0)),
+    )
 
     return {
         "ok": True,
@@ -1147,7 +1905,7 @@ async def app_history(
 
 
 @app.get("/api/windows/eventlog")
-async def windows_eventlog(
+def windows_eventlog(
     log_name: str = Query("System"),
     since_hours: int = Query(24, ge=1, le=24 * 365),
     max_events: int = Query(200, ge=1, le=5000),
@@ -1155,24 +1913,17 @@ async def windows_eventlog(
     save: bool = Query(False),
 ):
     """Windows イベントログを収集して簡易分析。save=true でDB保存。"""
-    try:
-        payload = await asyncio.wait_for(
-            run_in_threadpool(
-                windows_collect.collect_eventlog,
-                log_name=log_name,
-                since_hours=since_hours,
-                max_events=max_events,
-                timeout_s=timeout_s,
-            ),
-            timeout=timeout_s + 10,
-        )
-    except asyncio.TimeoutError:
-        raise HTTPException(status_code=504, detail="eventlog collection timed out")
+    payload = windows_collect.collect_eventlog(
+        log_name=log_name,
+        since_hours=since_hours,
+        max_events=max_events,
+        timeout_s=timeout_s,
+    )
 
     if save:
         try:
             db_id = db.insert_eventlog_batch(
-                hostname=payload.get('hostname') or socket.gethostname(),
+                hostname=payload.get('hostname') or HOSTNAME,
                 log_name=payload.get('log_name') or log_name,
                 since_hours=int(payload.get('since_hours') or since_hours),
                 max_events=int(payload.get('max_events') or max_events),
@@ -1189,22 +1940,15 @@ async def windows_eventlog(
 
 
 @app.get("/api/windows/eventlog/logs")
-async def windows_eventlog_logs(
+def windows_eventlog_logs(
     limit: int = Query(200, ge=1, le=2000),
     timeout_s: int = Query(30, ge=5, le=120),
 ):
     """利用可能なWindowsイベントログ（LogNameなど）の一覧を返す。"""
-    try:
-        payload = await asyncio.wait_for(
-            run_in_threadpool(
-                windows_collect.collect_eventlog_log_list,
-                limit=limit,
-                timeout_s=timeout_s,
-            ),
-            timeout=timeout_s + 10,
-        )
-    except asyncio.TimeoutError:
-        raise HTTPException(status_code=504, detail="eventlog log list timed out")
+    payload = windows_collect.collect_eventlog_log_list(
+        limit=limit,
+        timeout_s=timeout_s,
+    )
 
     return payload
 
@@ -1220,6 +1964,10 @@ async def windows_collect_all(request: Request):
     if not isinstance(data, dict):
         data = {}
 
+    return await run_in_threadpool(_windows_collect_all, data)
+
+
+def _windows_collect_all(data: Dict[str, Any]) -> Dict[str, Any]:
     proc_cfg = data.get('process') if isinstance(data.get('process'), dict) else {}
     evt_cfg = data.get('eventlog') if isinstance(data.get('eventlog'), dict) else {}
 
@@ -1233,51 +1981,24 @@ async def windows_collect_all(request: Request):
     evt_timeout_s = int(evt_cfg.get('timeout_s', 30)) if isinstance(evt_cfg, dict) else 30
     evt_save = bool(evt_cfg.get('save', False)) if isinstance(evt_cfg, dict) else False
 
-    try:
-        process_payload = await asyncio.wait_for(
-            run_in_threadpool(
-                windows_collect.collect_process_snapshot,
-                sample_ms=proc_sample_ms,
-                limit=proc_limit,
-                timeout_s=10,
-            ),
-            timeout=15,
-        )
-    except asyncio.TimeoutError:
-        process_payload = {
-            "collected_at": datetime.now().isoformat(),
-            "hostname": socket.gethostname(),
-            "summary": {"error": "process snapshot timed out"},
-            "processes": [],
-        }
+    process_payload = windows_collect.collect_process_snapshot(
+        sample_ms=proc_sample_ms,
+        limit=proc_limit,
+        timeout_s=10,
+    )
 
-    try:
-        eventlog_payload = await asyncio.wait_for(
-            run_in_threadpool(
-                windows_collect.collect_eventlog,
-                log_name=evt_log_name,
-                since_hours=evt_since_hours,
-                max_events=evt_max_events,
-                timeout_s=evt_timeout_s,
-            ),
-            timeout=evt_timeout_s + 10,
-        )
-    except asyncio.TimeoutError:
-        eventlog_payload = {
-            "collected_at": datetime.now().isoformat(),
-            "hostname": socket.gethostname(),
-            "log_name": evt_log_name,
-            "since_hours": evt_since_hours,
-            "max_events": evt_max_events,
-            "summary": {"error": "eventlog collection timed out"},
-            "events": [],
-        }
+    eventlog_payload = windows_collect.collect_eventlog(
+        log_name=evt_log_name,
+        since_hours=evt_since_hours,
+        max_events=evt_max_events,
+        timeout_s=evt_timeout_s,
+    )
 
     # Optional DB save
     if proc_save:
         try:
             db_id = db.insert_process_snapshot(
-                hostname=process_payload.get('hostname') or socket.gethostname(),
+                hostname=process_payload.get('hostname') or HOSTNAME,
                 summary=process_payload.get('summary') or {},
                 processes=process_payload.get('processes') or [],
             )
@@ -1290,7 +2011,7 @@ async def windows_collect_all(request: Request):
     if evt_save:
         try:
             db_id = db.insert_eventlog_batch(
-                hostname=eventlog_payload.get('hostname') or socket.gethostname(),
+                hostname=eventlog_payload.get('hostname') or HOSTNAME,
                 log_name=eventlog_payload.get('log_name') or evt_log_name,
                 since_hours=int(eventlog_payload.get('since_hours') or evt_since_hours),
                 max_events=int(eventlog_payload.get('max_events') or evt_max_events),
@@ -1319,66 +2040,72 @@ async def start_capture(request: Request):
 
     interface = data.get('interface') if isinstance(data, dict) else None
     packet_count = int(data.get('count', 100)) if isinstance(data, dict) else 100
+    # filter 未指定なら既定フィルタ、空文字ならフィルタなし
+    bpf_filter = data.get('filter', DEFAULT_CAPTURE_FILTER) if isinstance(data, dict) else DEFAULT_CAPTURE_FILTER
+    bpf_filter = (str(bpf_filter).strip() or None) if bpf_filter is not None else None
 
-    global is_capturing, capture_thread, capture_session_id, capture_packets, capture_raw_packets, stop_capture_flag
+    global is_capturing, capture_thread, capture_session_id, stop_capture_flag, capture_pcap
 
     if is_capturing:
         return {'message': 'すでにキャプチャが実行中です', 'status': 'already_running'}
 
     # 初期化
-    capture_packets = []
-    capture_raw_packets = []
+    capture_stats.clear()
     capture_session_id = datetime.now().strftime('%Y%m%d_%H%M%S')
+    # 前回セッションの pcap は破棄し、今回分を書き出すファイルを開く
+    if capture_pcap is not None:
+        capture_pcap.remove()
+    try:
+        capture_pcap = _CapturePcapWriter(os.path.join(EXPORT_DIR, f'packet_capture_{capture_session_id}.pcap'))
+    except OSError as e:
+        print(f"pcapファイルを作成できませんでした（pcapエクスポートは無効）: {e}")
+        capture_pcap = None
     stop_capture_flag = False
     is_capturing = True
 
-    capture_thread = threading.Thread(target=capture_packets_thread, args=(interface, packet_count), daemon=True)
+    capture_thread = threading.Thread(target=capture_packets_thread, args=(interface, packet_count, bpf_filter), daemon=True)
     capture_thread.start()
 
-    print(f"キャプチャ開始: session={capture_session_id}, interface={interface}, target_count={packet_count}")
+    print(f"キャプチャ開始: session={capture_session_id}, interface={interface}, target_count={packet_count}, filter={bpf_filter}")
 
     return {
         'message': 'キャプチャを開始しました',
         'status': 'started',
         'session_id': capture_session_id,
-        'target_count': packet_count
+        'target_count': packet_count,
+        'filter': bpf_filter
     }
 
 
 @app.post("/api/capture/stop")
 async def stop_capture(request: Request):
     """パケットキャプチャを停止（FastAPI版）"""
-    global is_capturing, stop_capture_flag, capture_thread, capture_sniffer
+    global is_capturing, stop_capture_flag, capture_thread, capture_socket
 
-    if not is_capturing and not capture_sniffer:
-        return JSONResponse({'message': 'キャプチャは実行されていません', 'status': 'not_running'})
+    if not is_capturing and not capture_socket:
+        return ORJSONResponse({'message': 'キャプチャは実行されていません', 'status': 'not_running'})
 
     print("停止リクエストを受信しました (FastAPI)")
 
-    # set flag for callback and try to stop AsyncSniffer if present
+    # set flag; the receive loop polls it between select() timeouts
     stop_capture_flag = True
     is_capturing = False
 
-    if capture_sniffer:
-        try:
-            capture_sniffer.stop()
-        except Exception as e:
-            print(f"capture_sniffer.stop() エラー: {e}")
-
     # Wait shortly for thread to finish
     if capture_thread and capture_thread.is_alive():
         capture_thread.join(timeout=2.0)
 
     print(f"キャプチャを停止しました。収集パケット数: {len(capture_packets)}")
 
-    return JSONResponse({'message': 'キャプチャを停止しました', 'status': 'stopped', 'packet_count': len(capture_packets)})
+    return ORJSONResponse({'message': 'キャプチャを停止しました', 'status': 'stopped', 'packet_count': len(capture_packets)})
 
 @app.get("/api/capture/packets")
 async def get_packets():
     """キャプチャしたパケットを取得"""
+    packets = [rec.to_dict() for rec in list(capture_packets)]
     return {
-        'packets': capture_packets,
-        'count': len(capture_packets),
+        'packets': packets,
+        'count': len(packets),
         'is_capturing': is_capturing
     }
 
@@ -1388,15 +2115,32 @@ async def capture_status():
     return {
         'is_capturing': is_capturing,
         'packet_count': len(capture_packets),
+        'dropped_packets': capture_dropped,
         'session_id': capture_session_id
     }
 
+# 統計の計算結果（'entry': (capture_stats.version, 結果)）
+_capture_stats_cache = {}
+
+
 @app.get("/api/capture/statistics")
 async def get_capture_statistics():
     """キャプチャしたパケットの統計情報を取得"""
-    global capture_packets
+    # 前回から変化が無ければそのまま返し、計算が必要なときだけスレッドプールで行う（イベントループを止めない）
+    entry = _capture_stats_cache.get('entry')
+    if entry is not None and entry[0] == capture_stats.version:
+        result = entry[1]
+    else:
+        result = await run_in_threadpool(_compute_capture_statistics)
+    # 破棄数は capture_stats の version に現れないので、キャッシュした結果とは別に付ける
+    return {**result, 'dropped_packets': capture_dropped}
+
+
+def _compute_capture_statistics():
+    # 集計はパケット追加時に済んでいるので、ここでは集計値のコピーを読むだけにする
+    stats = capture_stats.snapshot()
     
-    if not capture_packets:
+    if stats is None:
         return {
             'total_packets': 0,
             'protocol_distribution': {},
@@ -1410,122 +2154,74 @@ async def get_capture_statistics():
             'suspicious_ips': []
         }
     
+    # 直前の計算時からパケットが増えていなければ結果を使い回す
+    cache_key = stats['version']
+    entry = _capture_stats_cache.get('entry')
+    if entry is not None and entry[0] == cache_key:
+        return entry[1]
+    
+    total_packets = stats['total_packets']
+    
     # プロトコル分布
-    protocol_counts = {}
-    for packet in capture_packets:
-        ptype = packet.get('type', 'Unknown')
-        protocol_counts[ptype] = protocol_counts.get(ptype, 0) + 1
+    protocol_counts = stats['protocol']
     
     # ポート番号の使用頻度（上位20個）
-    port_counts = {}
-    for packet in capture_packets:
-        if packet.get('tcp'):
-            sport = packet['tcp'].get('sport')
-            dport = packet['tcp'].get('dport')
-            if sport:
-                port_counts[sport] = port_counts.get(sport, 0) + 1
-            if dport:
-                port_counts[dport] = port_counts.get(dport, 0) + 1
-        elif packet.get('udp'):
-            sport = packet['udp'].get('sport')
-            dport = packet['udp'].get('dport')
-            if sport:
-                port_counts[sport] = port_counts.get(sport, 0) + 1
-            if dport:
-                port_counts[dport] = port_counts.get(dport, 0) + 1
+    port_counts = stats['ports']
     
-    top_ports = sorted(port_counts.items(), key=lambda x: x[1], reverse=True)[:20]
+    top_ports = port_counts.most_common(20)
     
     # IPアドレス統計
-    src_ips = {}
-    dst_ips = {}
-    for packet in capture_packets:
-        if packet.get('ip'):
-            src = packet['ip'].get('src')
-            dst = packet['ip'].get('dst')
-            if src:
-                src_ips[src] = src_ips.get(src, 0) + 1
-            if dst:
-                dst_ips[dst] = dst_ips.get(dst, 0) + 1
+    src_ips = stats['src_ips']
+    dst_ips = stats['dst_ips']
     
     # パケットサイズ統計
-    packet_sizes = [p.get('length', 0) for p in capture_packets]
+    total_bytes = stats['size_sum']
     size_stats = {
-        'min': min(packet_sizes) if packet_sizes else 0,
-        'max': max(packet_sizes) if packet_sizes else 0,
-        'average': sum(packet_sizes) / len(packet_sizes) if packet_sizes else 0,
-        'total_bytes': sum(packet_sizes)
+        'min': stats['size_min'],
+        'max': stats['size_max'],
+        'average': total_bytes / total_packets,
+        'total_bytes': total_bytes
     }
     
     # サイズ分布（範囲別）
-    size_ranges = {
-        '0-100': 0,
-        '101-500': 0,
-        '501-1000': 0,
-        '1001-1500': 0,
-        '1501+': 0
-    }
-    for size in packet_sizes:
-        if size <= 100:
-            size_ranges['0-100'] += 1
-        elif size <= 500:
-            size_ranges['101-500'] += 1
-        elif size <= 1000:
-            size_ranges['501-1000'] += 1
-        elif size <= 1500:
-            size_ranges['1001-1500'] += 1
-        else:
-            size_ranges['1501+'] += 1
+    bucket_counts = stats['size_buckets']
+    size_ranges = {label: bucket_counts.get(i, 0) for i, label in enumerate(_SIZE_BUCKET_LABELS)}
     
     # 時間分析
-    timestamps = [p.get('timestamp') for p in capture_packets if p.get('timestamp')]
-    if timestamps and len(timestamps) > 1:
-        from datetime import datetime as dt
-        start_time = dt.fromisoformat(timestamps[0])
-        end_time = dt.fromisoformat(timestamps[-1])
-        duration = (end_time - start_time).total_seconds()
-        packets_per_second = len(capture_packets) / duration if duration > 0 else 0
+    first_ts = stats['first_ts']
+    last_ts = stats['last_ts']
+    timestamps = [datetime.fromtimestamp(first_ts).isoformat(), datetime.fromtimestamp(last_ts).isoformat()]
+    if total_packets > 1:
+        duration = last_ts - first_ts
+        packets_per_second = total_packets / duration if duration > 0 else 0
     else:
         duration = 0
         packets_per_second = 0
     
     # トップトーカー（通信量が多いIPアドレス）
-    ip_bytes = {}
-    for packet in capture_packets:
-        if packet.get('ip'):
-            src = packet['ip'].get('src')
-            size = packet.get('length', 0)
-            if src:
-                ip_bytes[src] = ip_bytes.get(src, 0) + size
-    
-    top_talkers = sorted(ip_bytes.items(), key=lambda x: x[1], reverse=True)[:10]
+    top_talkers = heapq.nlargest(10, stats['ip_bytes'].items(), key=itemgetter(1))
     top_talkers_list = [{'ip': ip, 'bytes': bytes, 'packets': src_ips.get(ip, 0)} 
                         for ip, bytes in top_talkers]
     
     # セキュリティ分析
+    importance_counts = stats['importance']
     security_info = {
-        'encrypted_packets': sum(1 for p in capture_packets 
-                                if p.get('tcp', {}).get('dport') in [443, 22, 993, 995]),
-        'unencrypted_packets': sum(1 for p in capture_packets 
-                                   if p.get('tcp', {}).get('dport') in [80, 21, 23, 110]),
-        'high_importance': sum(1 for p in capture_packets if p.get('importance') == 'high'),
-        'medium_importance': sum(1 for p in capture_packets if p.get('importance') == 'medium'),
-        'low_importance': sum(1 for p in capture_packets if p.get('importance') == 'low')
+        'encrypted_packets': stats['encrypted'],
+        'unencrypted_packets': stats['unencrypted'],
+        'high_importance': importance_counts.get('high', 0),
+        'medium_importance': importance_counts.get('medium', 0),
+        'low_importance': importance_counts.get('low', 0)
     }
     
-    # TCPフラグ統計
-    tcp_flags = {}
-    for packet in capture_packets:
-        if packet.get('tcp'):
-            flags = packet['tcp'].get('flags', '')
-            tcp_flags[flags] = tcp_flags.get(flags, 0) + 1
+    # TCPフラグ統計（整数で数えてから表記文字列にする）
+    tcp_flags = {_hot.tcp_flags_str(f): c for f, c in stats['tcp_flags'].items()}
     
     # 異常検知と不審なIP分析
-    anomaly_detection = detect_anomalies(capture_packets, src_ips, dst_ips, port_counts)
-    suspicious_ips = analyze_suspicious_ips(capture_packets, src_ips, dst_ips)
+    anomaly_detection = detect_anomalies(stats, src_ips, dst_ips, port_counts)
+    suspicious_ips = analyze_suspicious_ips(stats, src_ips, dst_ips)
     
-    return {
-        'total_packets': len(capture_packets),
+    result = {
+        'total_packets': total_packets,
         'protocol_distribution': protocol_counts,
         'port_distribution': {
             'top_ports': [{'port': port, 'count': count} for port, count in top_ports]
@@ -1533,8 +2229,8 @@ async def get_capture_statistics():
         'ip_statistics': {
             'unique_src_ips': len(src_ips),
             'unique_dst_ips': len(dst_ips),
-            'top_src_ips': sorted(src_ips.items(), key=lambda x: x[1], reverse=True)[:10],
-            'top_dst_ips': sorted(dst_ips.items(), key=lambda x: x[1], reverse=True)[:10]
+            'top_src_ips': src_ips.most_common(10),
+            'top_dst_ips': dst_ips.most_common(10)
         },
         'packet_size_stats': {
             **size_stats,
@@ -1552,9 +2248,12 @@ async def get_capture_statistics():
         'anomaly_detection': anomaly_detection,
         'suspicious_ips': suspicious_ips
     }
+    # 複数スレッドから同時に計算されてもキーと結果がずれないよう、組で差し替える
+    _capture_stats_cache['entry'] = (cache_key, result)
+    return result
 
-def detect_anomalies(packets, src_ips, dst_ips, port_counts):
-    """異常な通信パターンを検出"""
+def detect_anomalies(stats, src_ips, dst_ips, port_counts):
+    """異常な通信パターンを検出（stats は capture_stats.snapshot() の集計値）"""
     anomalies = {
         'port_scanning': [],
         'syn_flood': [],
@@ -1565,34 +2264,16 @@ def detect_anomalies(packets, src_ips, dst_ips, port_counts):
     }
     
     # ポートスキャン検出（同一送信元から多数の異なるポートへの接続）
-    ip_port_map = {}
-    for packet in packets:
-        if packet.get('ip') and packet.get('tcp'):
-            src = packet['ip'].get('src')
-            dport = packet['tcp'].get('dport')
-            if src and dport:
-                if src not in ip_port_map:
-                    ip_port_map[src] = set()
-                ip_port_map[src].add(dport)
-    
-    for ip, ports in ip_port_map.items():
-        if len(ports) > 20:  # 20以上の異なるポートに接続
+    for ip, ports in stats['ip_port_counts'].items():
+        if ports > 20:  # 20以上の異なるポートに接続
             anomalies['port_scanning'].append({
                 'ip': ip,
-                'ports_accessed': len(ports),
+                'ports_accessed': ports,
                 'severity': 'high',
-                'description': f'{ip}が{len(ports)}個の異なるポートに接続しています（ポートスキャンの可能性）'
+                'description': f'{ip}が{ports}個の異なるポートに接続しています（ポートスキャンの可能性）'
             })
-    
     # SYNフラッド検出（大量のSYNパケット）
-    syn_counts = {}
-    for packet in packets:
-        if packet.get('tcp') and packet['tcp'].get('flags') == 'S':
-            src = packet.get('ip', {}).get('src')
-            if src:
-                syn_counts[src] = syn_counts.get(src, 0) + 1
-    
-    for ip, count in syn_counts.items():
+    for ip, count in stats['syn_counts'].items():
         if count > 50:  # 50回以上のSYNパケット
             anomalies['syn_flood'].append({
                 'ip': ip,
@@ -1602,16 +2283,8 @@ def detect_anomalies(packets, src_ips, dst_ips, port_counts):
             })
     
     # 異常なポート番号の使用検出
-    suspicious_ports = [
-        1337, 31337,  # ハッカーツールでよく使われるポート
-        4444, 5555,   # バックドアでよく使われるポート
-        6667, 6668, 6669,  # IRC（ボットネット通信）
-        12345, 54321,  # トロイの木馬
-        1234, 3127, 3128, 8080  # プロキシ/トンネル
-    ]
-    
     for port, count in port_counts.items():
-        if port in suspicious_ports:
+        if port in _SUSPICIOUS_PORTS:
             anomalies['unusual_ports'].append({
                 'port': port,
                 'count': count,
@@ -1631,14 +2304,7 @@ def detect_anomalies(packets, src_ips, dst_ips, port_counts):
             })
     
     # RSTフラグ（接続失敗）の多いIP
-    rst_counts = {}
-    for packet in packets:
-        if packet.get('tcp') and 'R' in packet['tcp'].get('flags', ''):
-            src = packet.get('ip', {}).get('src')
-            if src:
-                rst_counts[src] = rst_counts.get(src, 0) + 1
-    
-    for ip, count in rst_counts.items():
+    for ip, count in stats['rst_counts'].items():
         if count > 10:
             anomalies['failed_connections'].append({
                 'ip': ip,
@@ -1664,8 +2330,8 @@ def detect_anomalies(packets, src_ips, dst_ips, port_counts):
     
     return anomalies
 
-def analyze_suspicious_ips(packets, src_ips, dst_ips):
-    """不審なIPアドレスを分析"""
+def analyze_suspicious_ips(stats, src_ips, dst_ips):
+    """不審なIPアドレスを分析（IPごとの集計は stats から引き、パケットは走査しない）"""
     suspicious_list = []
     
     # 既知の不審なIP範囲（例）
@@ -1677,34 +2343,20 @@ def analyze_suspicious_ips(packets, src_ips, dst_ips):
     }
     
     # 各IPアドレスの分析
-    all_ips = set()
-    for packet in packets:
-        if packet.get('ip'):
-            src = packet['ip'].get('src')
-            dst = packet['ip'].get('dst')
-            if src:
-                all_ips.add(src)
-            if dst:
-                all_ips.add(dst)
+    all_ips = src_ips.keys() | dst_ips.keys()
+    suspicious_dports = stats['suspicious_dports']
+    rst_counts = stats['rst_counts']
     
     for ip in all_ips:
         suspicion_score = 0
         reasons = []
         
         # プライベートIPアドレスの確認
-        is_private = (
-            ip.startswith('10.') or
-            ip.startswith('172.16.') or ip.startswith('172.17.') or
-            ip.startswith('172.18.') or ip.startswith('172.19.') or
-            ip.startswith('172.20.') or ip.startswith('172.21.') or
-            ip.startswith('172.22.') or ip.startswith('172.23.') or
-            ip.startswith('172.24.') or ip.startswith('172.25.') or
-            ip.startswith('172.26.') or ip.startswith('172.27.') or
-            ip.startswith('172.28.') or ip.startswith('172.29.') or
-            ip.startswith('172.30.') or ip.startswith('172.31.') or
-            ip.startswith('192.168.') or
-            ip.startswith('127.')
-        )
+        # 文字列のプレフィックス比較ではなく、整数化して範囲をマスクで判定する
+        ip_int = _ipv4_int(ip)
+        if ip_int is None:
+            ip_int = -1  # どの範囲にも一致させない
+        is_private = any(ip_int & mask == net for net, mask in _PRIVATE_NETS)
         
         # 外部IPで高トラフィック
         if not is_private and src_ips.get(ip, 0) > 50:
@@ -1712,30 +2364,24 @@ def analyze_suspicious_ips(packets, src_ips, dst_ips):
             reasons.append('外部IPからの高トラフィック')
         
         # 特殊なIP範囲
-        if ip.startswith('0.'):
+        if ip_int & _ZERO_NET[1] == _ZERO_NET[0]:
             suspicion_score += 5
             reasons.append('無効なIPアドレス範囲')
-        elif ip.startswith('169.254.'):
+        elif ip_int & _APIPA_NET[1] == _APIPA_NET[0]:
             suspicion_score += 2
             reasons.append('APIPA自動割り当てアドレス')
-        elif ip.startswith('224.') or ip.startswith('239.'):
+        elif any(ip_int & mask == net for net, mask in _MULTICAST_NETS):
             suspicion_score += 1
             reasons.append('マルチキャストアドレス')
         
         # 異常なポートへのアクセス
-        ip_ports = set()
-        for packet in packets:
-            if packet.get('ip', {}).get('src') == ip and packet.get('tcp'):
-                dport = packet['tcp'].get('dport')
-                if dport and dport in [1337, 31337, 4444, 5555, 6667]:
-                    suspicion_score += 4
-                    reasons.append(f'不審なポート{dport}への接続')
-                    break
+        dport = suspicious_dports.get(ip)
+        if dport:
+            suspicion_score += 4
+            reasons.append(f'不審なポート{dport}への接続')
         
         # 大量の接続失敗
-        rst_count = sum(1 for p in packets 
-                       if p.get('ip', {}).get('src') == ip 
-                       and p.get('tcp', {}).get('flags') and 'R' in p['tcp']['flags'])
+        rst_count = rst_counts.get(ip, 0)
         if rst_count > 15:
             suspicion_score += 2
             reasons.append(f'{rst_count}回の接続失敗')
@@ -1753,10 +2399,8 @@ def analyze_suspicious_ips(packets, src_ips, dst_ips):
                 'recommendation': get_recommendation(suspicion_score, reasons)
             })
     
-    # スコアでソート
-    suspicious_list.sort(key=lambda x: x['suspicion_score'], reverse=True)
-    
-    return suspicious_list[:20]  # TOP20
+    # スコアの高い順に TOP20
+    return heapq.nlargest(20, suspicious_list, key=itemgetter('suspicion_score'))
 
 def get_recommendation(score, reasons):
     """スコアと理由に基づいて推奨アクションを返す"""
@@ -1771,45 +2415,107 @@ def get_recommendation(score, reasons):
 
 
 async def call_openai_chat(messages):
-    """OpenAI Chat Completions を呼び出す（同期 requests をスレッドで実行）。"""
+    """OpenAI Chat Completions を呼び出す（共有 httpx.AsyncClient で非同期に実行）。"""
     api_key = os.getenv('OPENAI_API_KEY')
     if not api_key:
         return None, 'OPENAI_API_KEY is not set'
     print('[call_openai_chat] Calling OpenAI API...')
 
-    def _sync_call():
-        try:
-            # モデルは環境変数で切り替え可能（デフォルト: gpt-5-mini）
-            model_name = os.getenv('OPENAI_MODEL') or os.getenv('OPENAI_MODEL_NAME') or 'gpt-5-mini'
-            print(f"[call_openai_chat] Using model: {model_name}")
-
-            resp = requests.post(
-                'https://api.openai.com/v1/chat/completions',
-                headers={
-                    'Authorization': f'Bearer {api_key}',
-                    'Content-Type': 'application/json'
-                },
-                json={
-                    'model': model_name,
-                    'messages': messages,
-                    # 'max_tokens': 512,
-                    # 'temperature': 0.2
-                },
-                timeout=60
-            )
-            resp.raise_for_status()
-            data = resp.json()
-            content = data['choices'][0]['message']['content'] if data.get('choices') else None
-            print('[call_openai_chat] OpenAI response received, content length:', len(content) if content else 0)
-            return content, None
-        except Exception as e:
-            print(f"[call_openai_chat] OpenAI request exception: {e}")
-            return None, str(e)
+    try:
+        # モデルは環境変数で切り替え可能（デフォルト: gpt-5-mini）
+        model_name = os.getenv('OPENAI_MODEL') or os.getenv('OPENAI_MODEL_NAME') or 'gpt-5-mini'
+        print(f"[call_openai_chat] Using model: {model_name}")
+
+        resp = await _get_http_client().post(
+            'https://api.openai.com/v1/chat/completions',
+            headers={
+                'Authorization': f'Bearer {api_key}',
+                'Content-Type': 'application/json'
+            },
+            json={
+                'model': model_name,
+                'messages': messages,
+                # 'max_tokens': 512,
+                # 'temperature': 0.2
+            },
+        )
+        resp.raise_for_status()
+        data = resp.json()
+        content = data['choices'][0]['message']['content'] if data.get('choices') else None
+        print('[call_openai_chat] OpenAI response received, content length:', len(content) if content else 0)
+        return content, None
+    except Exception as e:
+        print(f"[call_openai_chat] OpenAI request exception: {e}")
+        return None, str(e)
+
+# エクスポートファイルは json.dump(indent=2, ensure_ascii=False) と同じ体裁で書き出す
+_EXPORT_JSON_OPTS = orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+_CSV_HEADER = [
+    'Timestamp', 'Type', 'Length', 'Source IP', 'Destination IP',
+    'Source Port', 'Destination Port', 'Protocol Info', 'Summary'
+]
+
+
+def _write_file_bytes(filepath, data):
+    with open(filepath, 'wb') as f:
+        f.write(data)
+
+
+def _write_json_export(filepath, header, packets):
+    """パケット一覧を JSON ファイルへ1件ずつ書き出す（全体を1つの文字列にしない）"""
+    head = orjson.dumps({**header, 'packets': []}, option=_EXPORT_JSON_OPTS)
+    # 末尾の `"packets": []\n}` を開き括弧までにして、要素を後から流し込む
+    head = head[:head.rindex(b'[')]
+    with open(filepath, 'wb') as f:
+        f.write(head)
+        sep = b'[\n    '
+        for rec in packets:
+            f.write(sep)
+            f.write(orjson.dumps(rec.to_dict(), option=_EXPORT_JSON_OPTS).replace(b'\n', b'\n    '))
+            sep = b',\n    '
+        f.write(b'\n  ]\n}' if packets else b'[]\n}')
+
+
+def _write_csv_export(filepath, packets):
+    import csv
+    
+    fromtimestamp = datetime.fromtimestamp
+    flags_str = _hot.tcp_flags_str
+    with open(filepath, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f)
+        writer.writerow(_CSV_HEADER)
+        
+        def rows():
+            for packet in packets:
+                packet_type = packet.type
+                length = packet.length
+                sport = dport = info = ''
+                if packet_type == 'TCP':
+                    sport = packet.sport
+                    dport = packet.dport
+                    info = f"Flags: {flags_str(packet.flags or 0)}"
+                elif packet_type == 'UDP':
+                    sport = packet.sport
+                    dport = packet.dport
+                elif packet_type == 'ICMP':
+                    info = f"Type: {packet.icmp_type}, Code: {packet.icmp_code}"
+                yield (
+                    fromtimestamp(packet.ts).isoformat(),
+                    packet_type or '',
+                    length if length is not None else '',
+                    packet.src or '',
+                    packet.dst or '',
+                    sport,
+                    dport,
+                    info,
+                    packet.summary or ''
+                )
+        
+        writer.writerows(rows())
 
-    return await asyncio.to_thread(_sync_call)
 
 @app.get("/api/capture/statistics/export")
-async def export_statistics():
+async def export_statistics(background_tasks: BackgroundTasks):
     """統計データをJSONファイルとしてエクスポート"""
     try:
         # 統計データを取得
@@ -1826,11 +2532,10 @@ async def export_statistics():
         filename = f'packet_statistics_{timestamp}.json'
         filepath = os.path.join(EXPORT_DIR, filename)
         
-        # JSONファイルとして保存
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(export_data, f, indent=2, ensure_ascii=False)
+        # JSONファイルとして保存（ディスク書き込みはイベントループの外で行う）
+        await run_in_threadpool(_write_file_bytes, filepath, orjson.dumps(export_data, option=_EXPORT_JSON_OPTS))
         
-        # ファイルをダウンロードとして返す
+        # ファイル送信後に削除
         def cleanup():
             try:
                 if os.path.exists(filepath):
@@ -1838,11 +2543,12 @@ async def export_statistics():
             except Exception as e:
                 print(f"Cleanup error: {e}")
         
+        background_tasks.add_task(cleanup)
+        
         return FileResponse(
             path=filepath,
             media_type='application/json',
-            filename=filename,
-            background=BackgroundTasks().add_task(cleanup)
+            filename=filename
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"統計データのエクスポートに失敗しました: {str(e)}")
@@ -1850,11 +2556,12 @@ async def export_statistics():
 @app.get("/api/capture/export/json")
 async def export_json(background_tasks: BackgroundTasks):
     """パケット情報をJSONファイルとしてエクスポート"""
-    global capture_packets, capture_session_id
+    global capture_session_id
     
-    print(f"JSON Export リクエスト受信 - パケット数: {len(capture_packets)}")
+    packets = list(capture_packets)
+    print(f"JSON Export リクエスト受信 - パケット数: {len(packets)}")
     
-    if not capture_packets:
+    if not packets:
         print("エラー: エクスポートするパケットがありません")
         raise HTTPException(status_code=400, detail='エクスポートするパケットがありません')
     
@@ -1866,13 +2573,12 @@ async def export_json(background_tasks: BackgroundTasks):
         
         print(f'JSONファイル作成中: {filepath}')
         
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump({
-                'session_id': session_id,
-                'capture_time': datetime.now().isoformat(),
-                'packet_count': len(capture_packets),
-                'packets': capture_packets
-            }, f, ensure_ascii=False, indent=2)
+        header = {
+            'session_id': session_id,
+            'capture_time': datetime.now().isoformat(),
+            'packet_count': len(packets),
+        }
+        await run_in_threadpool(_write_json_export, filepath, header, packets)
         
         print(f'JSONファイル作成完了: {filename} (サイズ: {os.path.getsize(filepath)} bytes)')
         
@@ -1900,37 +2606,42 @@ async def export_json(background_tasks: BackgroundTasks):
 
 @app.get("/api/capture/export/pcap")
 async def export_pcap(background_tasks: BackgroundTasks):
-    """パケットをpcapファイルとしてエクスポート"""
-    global capture_raw_packets, capture_session_id
-    
-    print(f"PCAP Export リクエスト受信 - パケット数: {len(capture_raw_packets)}")
+    """パケットをpcapファイルとしてエクスポート
+
+    キャプチャ中に追記しているセッションの pcap をそのまま返す。
+    キャプチャ実行中はその時点までの内容を一時ファイルにコピーして返す。
+    """
+    writer = capture_pcap
+    packet_count = writer.count if writer is not None else 0
+    print(f"PCAP Export リクエスト受信 - パケット数: {packet_count}")
     
-    if not capture_raw_packets:
+    if not packet_count:
         print("エラー: エクスポートするパケットがありません")
         raise HTTPException(status_code=400, detail='エクスポートするパケットがありません')
     
     try:
-        temp_dir = tempfile.gettempdir()
-        session_id = capture_session_id if capture_session_id else datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f'packet_capture_{session_id}.pcap'
-        filepath = os.path.join(temp_dir, filename)
-        
-        print(f'PCAPファイル作成中: {filepath}')
+        filename = os.path.basename(writer.path)
         
-        wrpcap(filepath, capture_raw_packets)
-        
-        print(f'PCAPファイル作成完了: {filename} (サイズ: {os.path.getsize(filepath)} bytes)')
-        
-        # ファイル送信後に削除
-        def cleanup():
-            try:
-                if os.path.exists(filepath):
-                    os.remove(filepath)
-                    print(f'クリーンアップ完了: {filename}')
-            except:
-                pass
+        if writer.closed:
+            # キャプチャ終了後は書き込み済みのファイルをコピーせずに送る（次回キャプチャ開始時に削除）
+            filepath = writer.path
+        else:
+            filepath = os.path.join(tempfile.gettempdir(), f'snapshot_{filename}')
+            print(f'PCAPファイル作成中: {filepath}')
+            await run_in_threadpool(writer.copy_to, filepath)
+            
+            # ファイル送信後に削除
+            def cleanup():
+                try:
+                    if os.path.exists(filepath):
+                        os.remove(filepath)
+                        print(f'クリーンアップ完了: {os.path.basename(filepath)}')
+                except:
+                    pass
+            
+            background_tasks.add_task(cleanup)
         
-        background_tasks.add_task(cleanup)
+        print(f'PCAPファイル送信: {filename} (サイズ: {os.path.getsize(filepath)} bytes)')
         
         return FileResponse(
             path=filepath,
@@ -1946,17 +2657,16 @@ async def export_pcap(background_tasks: BackgroundTasks):
 @app.get("/api/capture/export/csv")
 async def export_csv(background_tasks: BackgroundTasks):
     """パケット情報をCSVファイルとしてエクスポート"""
-    global capture_packets, capture_session_id
+    global capture_session_id
     
-    print(f"CSV Export リクエスト受信 - パケット数: {len(capture_packets)}")
+    packets = list(capture_packets)
+    print(f"CSV Export リクエスト受信 - パケット数: {len(packets)}")
     
-    if not capture_packets:
+    if not packets:
         print("エラー: エクスポートするパケットがありません")
         raise HTTPException(status_code=400, detail='エクスポートするパケットがありません')
     
     try:
-        import csv
-        
         temp_dir = tempfile.gettempdir()
         session_id = capture_session_id if capture_session_id else datetime.now().strftime('%Y%m%d_%H%M%S')
         filename = f'packet_capture_{session_id}.csv'
@@ -1964,38 +2674,7 @@ async def export_csv(background_tasks: BackgroundTasks):
         
         print(f'CSVファイル作成中: {filepath}')
         
-        with open(filepath, 'w', newline='', encoding='utf-8-sig') as f:
-            writer = csv.writer(f)
-            
-            writer.writerow([
-                'Timestamp', 'Type', 'Length', 'Source IP', 'Destination IP',
-                'Source Port', 'Destination Port', 'Protocol Info', 'Summary'
-            ])
-            
-            for packet in capture_packets:
-                row = [
-                    packet.get('timestamp', ''),
-                    packet.get('type', ''),
-                    packet.get('length', ''),
-                    packet.get('ip', {}).get('src', ''),
-                    packet.get('ip', {}).get('dst', ''),
-                    '',
-                    '',
-                    '',
-                    packet.get('summary', '')
-                ]
-                
-                if packet.get('tcp'):
-                    row[5] = packet['tcp'].get('sport', '')
-                    row[6] = packet['tcp'].get('dport', '')
-                    row[7] = f"Flags: {packet['tcp'].get('flags', '')}"
-                elif packet.get('udp'):
-                    row[5] = packet['udp'].get('sport', '')
-                    row[6] = packet['udp'].get('dport', '')
-                elif packet.get('icmp'):
-                    row[7] = f"Type: {packet['icmp'].get('type', '')}, Code: {packet['icmp'].get('code', '')}"
-                
-                writer.writerow(row)
+        await run_in_threadpool(_write_csv_export, filepath, packets)
         
         print(f'CSVファイル作成完了: {filename} (サイズ: {os.path.getsize(filepath)} bytes)')
         
@@ -2021,20 +2700,121 @@ async def export_csv(background_tasks: BackgroundTasks):
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f'エクスポートに失敗しました: {str(e)}')
 
+# ルールベース応答で見るキーワード（タグ → いずれかを含めば一致）
+_CHAT_KEYWORDS = (
+    ('pktcap', ('パケットキャプチャ',)),
+    ('what', ('とは', '何')),
+    ('stats', ('統計', '分析')),
+    ('tcp', ('tcp',)),
+    ('udp', ('udp',)),
+    ('https', ('https', 'ssl', 'tls')),
+    ('port', ('ポート',)),
+    ('suspicious', ('不審',)),
+    ('trouble', ('エラー', 'できない', '失敗', '問題')),
+)
+
+# (必要なタグ, 回答) を優先順に並べる。回答が None のルールはキャプチャ統計から組み立てる
+_CHAT_RULES = (
+    (frozenset(('pktcap', 'what')),
+     "パケットキャプチャはネットワーク上のデータパケットを記録・解析する技術です。\n\nこのアプリでは「パケットキャプチャ」タブで簡単にキャプチャできます。"),
+    (frozenset(('stats',)), None),
+    (frozenset(('tcp', 'udp')),
+     "TCPは信頼性重視、UDPは速度重視の通信方式です。用途に応じて使い分けます。"),
+    (frozenset(('https',)),
+     "HTTPSはSSL/TLSによる暗号化通信です。安全ですが、証明書の有効性も確認しましょう。"),
+    (frozenset(('port', 'what')),
+     "ポート番号はPC内のサービスを識別する番号です。\n例: 80=HTTP, 443=HTTPS, 22=SSH"),
+    (frozenset(('suspicious', 'port')),
+     "不審なポート番号（例: 1337, 4444, 6667など）が検出された場合は注意が必要です。\n統計解析タブで自動検出できます。"),
+    (frozenset(('trouble',)),
+     "管理者権限で実行していますか？\nバックエンド・フロントエンドが両方起動しているか確認してください。"),
+)
+
+_CHAT_DEFAULT_ANSWER = "ご質問ありがとうございます。もう少し具体的に教えてください（例: 'パケットキャプチャの始め方'、'特定のIPの通信を調べたい' など）。もしくは右上のよくある質問ボタンを使ってみてください。"
+
+
+# 全キーワードを「タグ名の名前付きグループ」の選択にまとめた1本の正規表現（質問文を1回走査するだけで済む）
+_CHAT_KEYWORDS_RE = re.compile('|'.join(
+    f"(?P<{tag}>{'|'.join(map(re.escape, words))})" for tag, words in _CHAT_KEYWORDS
+))
+
+
+def _chat_keyword_tags(question):
+    """質問文に含まれるキーワードのタグ集合を返す"""
+    return {m.lastgroup for m in _CHAT_KEYWORDS_RE.finditer(question)}
+
+
+def _chat_stats_answer(stats):
+    if stats and stats.get('total_packets', 0) > 0:
+        return f"現在のキャプチャ統計:\nパケット数: {stats['total_packets']}\nプロトコル分布: {stats['protocol_distribution']}\n異常検知: {len(stats.get('anomaly_detection', {}).get('warnings', []))}件の警告があります。"
+    return "まだパケットキャプチャが実行されていません。まずキャプチャを開始してください。"
+
+
+# OpenAI の回答キャッシュ: (正規化した質問, パケット数の桁区切り, 警告数) → (保存時刻, 回答)
+# 同じ質問の繰り返しで API を呼び直さない。パケット数は100件単位に丸めて多少の増減ではヒットさせる
+_CHAT_CACHE_MAX = 1024
+_CHAT_CACHE_TTL_S = 600.0
+_chat_answer_cache: 'OrderedDict[Tuple[str, int, int], Tuple[float, str]]' = OrderedDict()
+
+
+def _chat_cache_key(question, stats):
+    warnings = len(stats.get('anomaly_detection', {}).get('warnings', []))
+    return (question.strip(), stats.get('total_packets', 0) // 100, warnings)
+
+
+def _chat_cache_get(key):
+    entry = _chat_answer_cache.get(key)
+    if entry is None:
+        return None
+    if time.monotonic() - entry[0] > _CHAT_CACHE_TTL_S:
+        del _chat_answer_cache[key]
+        return None
+    _chat_answer_cache.move_to_end(key)
+    return entry[1]
+
+
+def _chat_cache_put(key, answer):
+    _chat_answer_cache[key] = (time.monotonic(), answer)
+    _chat_answer_cache.move_to_end(key)
+    while len(_chat_answer_cache) > _CHAT_CACHE_MAX:
+        _chat_answer_cache.popitem(last=False)
+
+
+def _save_chat_turn(conversation_id, question_raw, answer, source):
+    """質問と回答を履歴に保存する（DB 未設定・接続失敗は無視して応答を優先する）
+
+    DB 呼び出しは同期なので、chatbot からはスレッドプール経由で呼んでイベントループを塞がない。
+    """
+    try:
+        db.insert_chat_messages(
+            conversation_id=conversation_id,
+            messages=[('user', question_raw, 'client'), ('assistant', answer, source)],
+        )
+    except Exception as e:
+        print(f"[chatbot] DB save skipped: {e}")
+
+
 @app.post("/api/chatbot")
 async def chatbot(request: Request):
     """相談チャットボットAPI: 質問を受けて回答を返す"""
     data = await request.json()
     question_raw = data.get('question', '')
     conversation_id = (data.get('conversation_id') or 'default').strip() or 'default'
-    question = question_raw.lower()
+    # 全角/半角（'ＴＣＰ'・半角カナ）や大文字小文字の違いを吸収してからキーワードを探す
+    question = unicodedata.normalize('NFKC', question_raw).casefold()
     print(f"[chatbot] Received question: {question_raw}")
 
-    # 統計データ取得
-    stats = await get_capture_statistics()
-
     # まず、OpenAI（ChatGPT）に問い合わせ可能なら優先して使用する
+    # 統計データはプロンプトと統計ルールでしか使わないので、必要になった分岐でだけ取得する
     if os.getenv('OPENAI_API_KEY'):
+        stats = await get_capture_statistics()
+        cache_key = _chat_cache_key(question, stats)
+        answer = _chat_cache_get(cache_key)
+        if answer is not None:
+            print('[chatbot] Responding with cached OpenAI answer')
+            await run_in_threadpool(_save_chat_turn, conversation_id, question_raw, answer, 'cache')
+            return {"answer": answer, "source": "cache"}
+
         stats_summary = (
             f"現在のキャプチャパケット数: {stats.get('total_packets', 0)}。"
             f"異常警告数: {len(stats.get('anomaly_detection', {}).get('warnings', []))}。"
@@ -2052,101 +2832,37 @@ async def chatbot(request: Request):
         answer, err = await call_openai_chat(messages)
         if answer:
             print('[chatbot] Responding with OpenAI answer')
-            try:
-                db.insert_chat_message(conversation_id=conversation_id, role='user', content=question_raw, source='client')
-                db.insert_chat_message(conversation_id=conversation_id, role='assistant', content=answer, source='openai')
-            except Exception as e:
-                print(f"[chatbot] DB save skipped: {e}")
+            _chat_cache_put(cache_key, answer)
+            await run_in_threadpool(_save_chat_turn, conversation_id, question_raw, answer, 'openai')
             return {"answer": answer, "source": "openai"}
         else:
             print(f"[chatbot] OpenAI request failed: {err}")
 
     # OpenAIが使えない/失敗した場合はルールベース応答を返す
-    if 'パケットキャプチャ' in question and ('とは' in question or '何' in question):
-        answer = "パケットキャプチャはネットワーク上のデータパケットを記録・解析する技術です。\n\nこのアプリでは「パケットキャプチャ」タブで簡単にキャプチャできます。"
-        try:
-            db.insert_chat_message(conversation_id=conversation_id, role='user', content=question_raw, source='client')
-            db.insert_chat_message(conversation_id=conversation_id, role='assistant', content=answer, source='rule')
-        except Exception as e:
-            print(f"[chatbot] DB save skipped: {e}")
-        return {"answer": answer, "source": "rule"}
-    if '統計' in question or '分析' in question:
-        if stats and stats.get('total_packets', 0) > 0:
-            answer = f"現在のキャプチャ統計:\nパケット数: {stats['total_packets']}\nプロトコル分布: {stats['protocol_distribution']}\n異常検知: {len(stats.get('anomaly_detection', {}).get('warnings', []))}件の警告があります。"
-            try:
-                db.insert_chat_message(conversation_id=conversation_id, role='user', content=question_raw, source='client')
-                db.insert_chat_message(conversation_id=conversation_id, role='assistant', content=answer, source='rule')
-            except Exception as e:
-                print(f"[chatbot] DB save skipped: {e}")
-            return {"answer": answer, "source": "rule"}
-        else:
-            answer = "まだパケットキャプチャが実行されていません。まずキャプチャを開始してください。"
-            try:
-                db.insert_chat_message(conversation_id=conversation_id, role='user', content=question_raw, source='client')
-                db.insert_chat_message(conversation_id=conversation_id, role='assistant', content=answer, source='rule')
-            except Exception as e:
-                print(f"[chatbot] DB save skipped: {e}")
+    # 質問に含まれるキーワードを一度だけ調べ、ルール表を上から順に当てはめる
+    tags = _chat_keyword_tags(question)
+    for required, answer in _CHAT_RULES:
+        if required <= tags:
+            if answer is None:
+                answer = _chat_stats_answer(await get_capture_statistics())
+            await run_in_threadpool(_save_chat_turn, conversation_id, question_raw, answer, 'rule')
             return {"answer": answer, "source": "rule"}
-    if 'tcp' in question and 'udp' in question:
-        answer = "TCPは信頼性重視、UDPは速度重視の通信方式です。用途に応じて使い分けます。"
-        try:
-            db.insert_chat_message(conversation_id=conversation_id, role='user', content=question_raw, source='client')
-            db.insert_chat_message(conversation_id=conversation_id, role='assistant', content=answer, source='rule')
-        except Exception as e:
-            print(f"[chatbot] DB save skipped: {e}")
-        return {"answer": answer, "source": "rule"}
-    if 'https' in question or 'ssl' in question or 'tls' in question:
-        answer = "HTTPSはSSL/TLSによる暗号化通信です。安全ですが、証明書の有効性も確認しましょう。"
-        try:
-            db.insert_chat_message(conversation_id=conversation_id, role='user', content=question_raw, source='client')
-            db.insert_chat_message(conversation_id=conversation_id, role='assistant', content=answer, source='rule')
-        except Exception as e:
-            print(f"[chatbot] DB save skipped: {e}")
-        return {"answer": answer, "source": "rule"}
-    if 'ポート' in question and ('何' in question or 'とは' in question):
-        answer = "ポート番号はPC内のサービスを識別する番号です。\n例: 80=HTTP, 443=HTTPS, 22=SSH"
-        try:
-            db.insert_chat_message(conversation_id=conversation_id, role='user', content=question_raw, source='client')
-            db.insert_chat_message(conversation_id=conversation_id, role='assistant', content=answer, source='rule')
-        except Exception as e:
-            print(f"[chatbot] DB save skipped: {e}")
-        return {"answer": answer, "source": "rule"}
-    if '不審' in question and 'ポート' in question:
-        answer = "不審なポート番号（例: 1337, 4444, 6667など）が検出された場合は注意が必要です。\n統計解析タブで自動検出できます。"
-        try:
-            db.insert_chat_message(conversation_id=conversation_id, role='user', content=question_raw, source='client')
-            db.insert_chat_message(conversation_id=conversation_id, role='assistant', content=answer, source='rule')
-        except Exception as e:
-            print(f"[chatbot] DB save skipped: {e}")
-        return {"answer": answer, "source": "rule"}
-    if 'エラー' in question or 'できない' in question or '失敗' in question or '問題' in question:
-        answer = "管理者権限で実行していますか？\nバックエンド・フロントエンドが両方起動しているか確認してください。"
-        try:
-            db.insert_chat_message(conversation_id=conversation_id, role='user', content=question_raw, source='client')
-            db.insert_chat_message(conversation_id=conversation_id, role='assistant', content=answer, source='rule')
-        except Exception as e:
-            print(f"[chatbot] DB save skipped: {e}")
-        return {"answer": answer, "source": "rule"}
 
     # デフォルト応答（より案内的にする）
-    answer = "ご質問ありがとうございます。もう少し具体的に教えてください（例: 'パケットキャプチャの始め方'、'特定のIPの通信を調べたい' など）。もしくは右上のよくある質問ボタンを使ってみてください。"
-    try:
-        db.insert_chat_message(conversation_id=conversation_id, role='user', content=question_raw, source='client')
-        db.insert_chat_message(conversation_id=conversation_id, role='assistant', content=answer, source='default')
-    except Exception as e:
-        print(f"[chatbot] DB save skipped: {e}")
-    return {"answer": answer, "source": "default"}
+    await run_in_threadpool(_save_chat_turn, conversation_id, question_raw, _CHAT_DEFAULT_ANSWER, 'default')
+    return {"answer": _CHAT_DEFAULT_ANSWER, "source": "default"}
 
 
 @app.get("/api/chatbot/history")
-async def chatbot_history(
+def chatbot_history(
     conversation_id: str = Query('default', description='会話ID'),
     limit: int = Query(200, ge=1, le=1000),
+    after_id: Optional[int] = Query(None, ge=0, description='この id より後のメッセージだけを返す'),
 ):
     """相談チャット履歴を取得（DB設定が必要）。"""
     try:
-        rows = db.fetch_chat_messages(conversation_id=conversation_id, limit=limit)
-        messages = [{"role": r.get("role"), "content": r.get("content"), "created_at": r.get("created_at"), "source": r.get("source")} for r in rows]
+        rows = db.fetch_chat_messages(conversation_id=conversation_id, limit=limit, after_id=after_id)
+        messages = [{"id": r.get("id"), "role": r.get("role"), "content": r.get("content"), "created_at": r.get("created_at"), "source": r.get("source")} for r in rows]
         return {"ok": True, "configured": True, "conversation_id": (conversation_id or 'default'), "messages": messages}
     except Exception as e:
         # DB未設定/接続失敗でもフロントは動けるようにする
@@ -2154,7 +2870,7 @@ async def chatbot_history(
 
 
 @app.delete("/api/chatbot/history")
-async def chatbot_history_clear(
+def chatbot_history_clear(
     conversation_id: str = Query('default', description='会話ID'),
 ):
     """相談チャット履歴を削除（DB設定が必要）。"""
@@ -2166,7 +2882,7 @@ async def chatbot_history_clear(
 
 
 @app.get("/api/chatbot/conversations")
-async def chatbot_conversations(
+def chatbot_conversations(
     limit: int = Query(100, ge=1, le=500),
 ):
     """保存済み会話一覧（DB設定が必要）。"""
@@ -2191,4 +2907,5 @@ async def chatbot_test():
 
 if __name__ == '__main__':
     import uvicorn
-    uvicorn.run(app, host='0.0.0.0', port=5000)
+    # loop/http は uvloop・httptools が入っていれば自動で使われる（uvloop は Windows 非対応）
+    uvicorn.run(app, host='0.0.0.0', port=5000, loop='auto', http='auto')
@@ -1,14 +1,37 @@
 import os
+import threading
+from contextlib import contextmanager
 from datetime import datetime, timezone
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
 
 from dotenv import load_dotenv
 from pathlib import Path
 
 import psycopg
-from psycopg import Connection
-from psycopg.rows import dict_row
-from psycopg.types.json import Jsonb
+from psycopg import Connection, sql
+from psycopg.rows import dict_row, tuple_row
+from psycopg.types.json import Jsonb, set_json_dumps, set_json_loads
+
+try:
+    from psycopg_pool import ConnectionPool
+except ImportError:  # psycopg_pool が無い環境では呼び出しごとに接続する
+    ConnectionPool = None
+
+try:
+    import orjson
+except ImportError:  # orjson が無ければ psycopg 既定の標準 json のまま
+    orjson = None
+
+
+def _orjson_dumps(obj: Any) -> bytes:
+    # 標準 json と同様に int などの非文字列キーも受け付ける
+    return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+
+if orjson is not None:
+    # プロセス一覧・イベントログは数百KBになるので、JSONB の直列化を C 実装に任せる（bytes をそのまま送る）
+    set_json_dumps(_orjson_dumps)
+    set_json_loads(orjson.loads)
 
 
 # Ensure backend/.env is loaded even if the app entrypoint doesn't load it.
@@ -16,9 +39,25 @@ _env_path = Path(__file__).resolve().parent / ".env"
 load_dotenv(dotenv_path=_env_path, override=True)
 
 
+def _env_mtime() -> Optional[int]:
+    try:
+        return _env_path.stat().st_mtime_ns
+    except OSError:
+        return None
+
+
+# 最後に読み込んだ .env の更新時刻（DB 操作のたびにパースし直さないため）
+_env_loaded_mtime = _env_mtime()
+
+
 def get_database_url() -> Optional[str]:
     # Reload backend/.env at call time so changes take effect without restart.
-    load_dotenv(dotenv_path=_env_path, override=True)
+    # 中身の再読込は .env の更新時刻が変わったときだけ（毎回は stat 1回で済ませる）
+    global _env_loaded_mtime
+    mtime = _env_mtime()
+    if mtime != _env_loaded_mtime:
+        load_dotenv(dotenv_path=_env_path, override=True)
+        _env_loaded_mtime = mtime
     url = os.getenv("DATABASE_URL")
     if url:
         return url
@@ -35,20 +74,138 @@ def get_database_url() -> Optional[str]:
     return f"postgresql://{user}:{password}@{host}:{port}/{dbname}"
 
 
-def connect() -> Connection[Any]:
+# 接続はプロセス内のプールから借りる（毎回の TCP/認証ハンドシェイクを避ける）
+_POOL_MIN_SIZE = 1
+_POOL_MAX_SIZE = 10
+_POOL_TIMEOUT_S = 5.0
+# 同じ SQL を3回実行したらサーバー側 prepared statement にする（psycopg の既定は5回）。
+# INSERT/SELECT は毎回同じ文なので、以降はパース・プランを省ける
+_PREPARE_THRESHOLD = 3
+_CONNECT_KWARGS: Dict[str, Any] = {"autocommit": True, "row_factory": dict_row, "prepare_threshold": _PREPARE_THRESHOLD}
+
+_pool: Optional[Any] = None
+_pool_url: Optional[str] = None
+_pool_lock = threading.Lock()
+# ensure_schema を実行済みの接続先（接続先ごとに1回だけ実行する）
+_schema_url: Optional[str] = None
+_schema_lock = threading.Lock()
+
+
+def _get_pool(url: str) -> Any:
+    global _pool, _pool_url
+    with _pool_lock:
+        if _pool is None or _pool_url != url:
+            # サーバーに届かない状態でプールを作ると、借りるたびに timeout まで待たされる。
+            # 先に1本だけ直接つないで確かめ（失敗ならすぐ例外）、ついでにスキーマを用意する
+            with psycopg.connect(url, **_CONNECT_KWARGS) as conn:
+                _ensure_schema_once(conn, url)
+            # .env の接続先が変わったらプールを作り直す
+            old = _pool
+            _pool = ConnectionPool(
+                conninfo=url,
+                min_size=_POOL_MIN_SIZE,
+                max_size=_POOL_MAX_SIZE,
+                timeout=_POOL_TIMEOUT_S,
+                kwargs=_CONNECT_KWARGS,
+                open=False,
+            )
+            _pool.open()
+            _pool_url = url
+            if old is not None:
+                old.close()
+        return _pool
+
+
+def _ensure_schema_once(conn: Connection[Any], url: str) -> None:
+    global _schema_url
+    if _schema_url == url:
+        return
+    with _schema_lock:
+        if _schema_url != url:
+            ensure_schema(conn)
+            _schema_url = url
+
+
+# 月パーティションを用意済みの (接続先, テーブル, 月)。保存のたびにカタログを見に行かないため
+_partition_months: Set[Tuple[str, str, str]] = set()
+
+
+def _month_start(year: int, month: int) -> str:
+    # 月の境界は UTC で固定する（セッションのタイムゾーン設定に左右されない）
+    year += (month - 1) // 12
+    month = (month - 1) % 12 + 1
+    return f"{year:04d}-{month:02d}-01 00:00:00+00"
+
+
+def _ensure_month_partitions(conn: Connection[Any], table: str) -> None:
+    """table が月パーティション分割されていれば、前月・今月・来月のパーティションを作っておく
+
+    サーバーの NOW() とこちらの時計が月境界をまたいでずれても、入れ先が無くならないように前後の月も作る。
+    """
+    url = get_database_url() or ""
+    now = datetime.now(timezone.utc)
+    key = (url, table, f"{now.year:04d}_{now.month:02d}")
+    if key in _partition_months:
+        return
+    with _schema_lock:
+        if key in _partition_months:
+            return
+        with conn.cursor() as cur:
+            cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (table,))
+            row = cur.fetchone()
+            if row and row["relkind"] == "p":
+                for offset in (-1, 0, 1):
+                    m = now.month + offset
+                    lower = _month_start(now.year, m)
+                    upper = _month_start(now.year, m + 1)
+                    name = f"{table}_{lower[:4]}_{lower[5:7]}"
+                    cur.execute(
+                        sql.SQL(
+                            "CREATE TABLE IF NOT EXISTS {} PARTITION OF {} FOR VALUES FROM ({}) TO ({})"
+                        ).format(sql.Identifier(name), sql.Identifier(table), sql.Literal(lower), sql.Literal(upper))
+                    )
+        _partition_months.add(key)
+
+
+@contextmanager
+def connect() -> Iterator[Connection[Any]]:
     url = get_database_url()
     if not url:
         raise RuntimeError(
             "Database is not configured. Set DATABASE_URL or PGHOST/PGPORT/PGUSER/PGPASSWORD/PGDATABASE"
         )
 
-    conn = psycopg.connect(url, autocommit=True, row_factory=dict_row)
-    ensure_schema(conn)
-    return conn
+    if ConnectionPool is None:
+        with psycopg.connect(url, **_CONNECT_KWARGS) as conn:
+            _ensure_schema_once(conn, url)
+            yield conn
+        return
+
+    with _get_pool(url).connection() as conn:
+        _ensure_schema_once(conn, url)
+        yield conn
+
+
+def close_pool() -> None:
+    global _pool, _pool_url
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+        _pool = None
+        _pool_url = None
 
 
 def ensure_schema(conn: Connection[Any]) -> None:
+        # eventlog_batches / app_usage_samples は追記のみの時系列なので collected_at の月単位で
+        # パーティション分割する（月のパーティションは保存時に _ensure_month_partitions が作る）。
+        # 分割前に作られた既存のテーブルはそのまま使う
         with conn.cursor() as cur:
+                cur.execute("SELECT to_regclass('chat_conversations') IS NOT NULL AS present")
+                row = cur.fetchone()
+                had_conversations = bool(row and row["present"])
+
+        # 互いに独立した DDL なのでパイプラインでまとめて送り、往復を1回に減らす
+        with conn.pipeline(), conn.cursor() as cur:
                 cur.execute(
                         """
                         CREATE TABLE IF NOT EXISTS process_snapshots (
@@ -63,25 +220,40 @@ def ensure_schema(conn: Connection[Any]) -> None:
                 cur.execute(
                         """
                         CREATE TABLE IF NOT EXISTS eventlog_batches (
-                            id BIGSERIAL PRIMARY KEY,
+                            id BIGSERIAL,
                             collected_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
                             hostname TEXT,
                             log_name TEXT NOT NULL,
                             since_hours INTEGER NOT NULL,
                             max_events INTEGER NOT NULL,
                             summary JSONB NOT NULL,
-                            events JSONB NOT NULL
-                        );
+                            events JSONB NOT NULL,
+                            PRIMARY KEY (id, collected_at)
+                        ) PARTITION BY RANGE (collected_at);
                         """
                 )
                 cur.execute(
                         """
                         CREATE TABLE IF NOT EXISTS app_usage_samples (
-                            id BIGSERIAL PRIMARY KEY,
+                            id BIGSERIAL,
                             collected_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
                             hostname TEXT,
-                            sample JSONB NOT NULL
-                        );
+                            sample JSONB NOT NULL,
+                            PRIMARY KEY (id, collected_at)
+                        ) PARTITION BY RANGE (collected_at);
+                        """
+                )
+                # 期間指定の取得（fetch_app_usage_samples_since）を範囲スキャンにする
+                cur.execute(
+                        """
+                        CREATE INDEX IF NOT EXISTS idx_app_usage_samples_hostname_collected_at
+                            ON app_usage_samples (hostname, collected_at);
+                        """
+                )
+                cur.execute(
+                        """
+                        CREATE INDEX IF NOT EXISTS idx_app_usage_samples_collected_at
+                            ON app_usage_samples (collected_at);
                         """
                 )
 
@@ -105,6 +277,87 @@ def ensure_schema(conn: Connection[Any]) -> None:
                         """
                 )
 
+                # 会話一覧（list_chat_conversations）用の集計表。chat_messages のトリガーで更新し、
+                # 一覧のたびに全メッセージを GROUP BY しなくて済むようにする
+                cur.execute(
+                        """
+                        CREATE TABLE IF NOT EXISTS chat_conversations (
+                            conversation_id TEXT PRIMARY KEY,
+                            last_message_at TIMESTAMPTZ NOT NULL,
+                            message_count BIGINT NOT NULL
+                        );
+                        """
+                )
+                cur.execute(
+                        """
+                        CREATE INDEX IF NOT EXISTS idx_chat_conversations_last_message_at
+                            ON chat_conversations (last_message_at DESC);
+                        """
+                )
+                cur.execute(
+                        """
+                        CREATE OR REPLACE FUNCTION chat_conversations_on_insert() RETURNS trigger
+                        LANGUAGE plpgsql AS $$
+                        BEGIN
+                            INSERT INTO chat_conversations (conversation_id, last_message_at, message_count)
+                            VALUES (NEW.conversation_id, NEW.created_at, 1)
+                            ON CONFLICT (conversation_id) DO UPDATE SET
+                                last_message_at = GREATEST(chat_conversations.last_message_at, EXCLUDED.last_message_at),
+                                message_count = chat_conversations.message_count + 1;
+                            RETURN NULL;
+                        END
+                        $$;
+                        """
+                )
+                # 削除は会話単位のまとめ消しなので、文単位で消えた会話だけ数え直す
+                cur.execute(
+                        """
+                        CREATE OR REPLACE FUNCTION chat_conversations_on_delete() RETURNS trigger
+                        LANGUAGE plpgsql AS $$
+                        BEGIN
+                            DELETE FROM chat_conversations
+                            WHERE conversation_id IN (SELECT conversation_id FROM old_rows);
+                            INSERT INTO chat_conversations (conversation_id, last_message_at, message_count)
+                            SELECT conversation_id, MAX(created_at), COUNT(*)
+                            FROM chat_messages
+                            WHERE conversation_id IN (SELECT conversation_id FROM old_rows)
+                            GROUP BY conversation_id;
+                            RETURN NULL;
+                        END
+                        $$;
+                        """
+                )
+                cur.execute(
+                        """
+                        CREATE OR REPLACE TRIGGER trg_chat_messages_conversations_insert
+                            AFTER INSERT ON chat_messages
+                            FOR EACH ROW EXECUTE FUNCTION chat_conversations_on_insert();
+                        """
+                )
+                cur.execute(
+                        """
+                        CREATE OR REPLACE TRIGGER trg_chat_messages_conversations_delete
+                            AFTER DELETE ON chat_messages
+                            REFERENCING OLD TABLE AS old_rows
+                            FOR EACH STATEMENT EXECUTE FUNCTION chat_conversations_on_delete();
+                        """
+                )
+
+        if not had_conversations:
+            # 集計表を作ったばかりなら、それまでの履歴から埋める
+            with conn.cursor() as cur:
+                cur.execute(
+                        """
+                        INSERT INTO chat_conversations (conversation_id, last_message_at, message_count)
+                        SELECT conversation_id, MAX(created_at), COUNT(*)
+                        FROM chat_messages
+                        GROUP BY conversation_id
+                        ON CONFLICT (conversation_id) DO UPDATE SET
+                            last_message_at = EXCLUDED.last_message_at,
+                            message_count = EXCLUDED.message_count;
+                        """
+                )
+
 
 def db_health() -> Dict[str, Any]:
     url = get_database_url()
@@ -122,19 +375,19 @@ def db_health() -> Dict[str, Any]:
 
 
 def insert_process_snapshot(*, hostname: str, summary: Dict[str, Any], processes: Any) -> int:
-    collected_at = datetime.now(timezone.utc)
     with connect() as conn:
-        with conn.cursor() as cur:
+        # RETURNING id しか読まないので、INSERT のカーソルは tuple_row にして dict を作らない
+        with conn.cursor(row_factory=tuple_row) as cur:
             cur.execute(
                 """
-                INSERT INTO process_snapshots (collected_at, hostname, summary, processes)
-                VALUES (%s, %s, %s, %s)
+                INSERT INTO process_snapshots (hostname, summary, processes)
+                VALUES (%s, %s, %s)
                 RETURNING id
                 """,
-                (collected_at, hostname, Jsonb(summary), Jsonb(processes)),
+                (hostname, Jsonb(summary), Jsonb(processes)),
             )
             row = cur.fetchone()
-            return int(row["id"]) if row and "id" in row else -1
+            return int(row[0]) if row else -1
 
 
 def insert_eventlog_batch(
@@ -146,19 +399,18 @@ def insert_eventlog_batch(
     summary: Dict[str, Any],
     events: Any,
 ) -> int:
-    collected_at = datetime.now(timezone.utc)
     with connect() as conn:
-        with conn.cursor() as cur:
+        _ensure_month_partitions(conn, "eventlog_batches")
+        with conn.cursor(row_factory=tuple_row) as cur:
             cur.execute(
                 """
                 INSERT INTO eventlog_batches (
-                  collected_at, hostname, log_name, since_hours, max_events, summary, events
+                  hostname, log_name, since_hours, max_events, summary, events
                 )
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                VALUES (%s, %s, %s, %s, %s, %s)
                 RETURNING id
                 """,
                 (
-                    collected_at,
                     hostname,
                     log_name,
                     int(since_hours),
@@ -168,41 +420,56 @@ def insert_eventlog_batch(
                 ),
             )
             row = cur.fetchone()
-            return int(row["id"]) if row and "id" in row else -1
+            return int(row[0]) if row else -1
 
 
 def insert_app_usage_sample(*, hostname: str, sample: Any) -> int:
-    collected_at = datetime.now(timezone.utc)
     with connect() as conn:
-        with conn.cursor() as cur:
+        _ensure_month_partitions(conn, "app_usage_samples")
+        with conn.cursor(row_factory=tuple_row) as cur:
             cur.execute(
                 """
-                INSERT INTO app_usage_samples (collected_at, hostname, sample)
-                VALUES (%s, %s, %s)
+                INSERT INTO app_usage_samples (hostname, sample)
+                VALUES (%s, %s)
                 RETURNING id
                 """,
-                (collected_at, hostname, Jsonb(sample)),
+                (hostname, Jsonb(sample)),
             )
             row = cur.fetchone()
-            return int(row["id"]) if row and "id" in row else -1
+            return int(row[0]) if row else -1
+
 
+def fetch_app_usage_samples_since(
+    *,
+    hostname: Optional[str],
+    since_hours: int,
+    limit: int = 200,
+    after_id: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """指定期間のサンプルを古い順で取得（履歴計算用）。
 
-def fetch_app_usage_samples_since(*, hostname: Optional[str], since_hours: int, limit: int = 200) -> List[Dict[str, Any]]:
-    """指定期間のサンプルを古い順で取得（履歴計算用）。"""
+    after_id を渡すとそれより後に保存された行だけを返す（前回の最後の id を渡して続きを読む）。
+    """
     since_hours_i = max(1, min(24 * 365, int(since_hours)))
     limit_i = max(2, min(2000, int(limit)))
 
-    where = "WHERE collected_at >= (NOW() - (%s * INTERVAL '1 hour'))"
+    where = "WHERE collected_at >= NOW() - make_interval(hours => %s)"
     params: List[Any] = [since_hours_i]
     if hostname:
         where += " AND hostname = %s"
         params.append(hostname)
+    # after_id で続きを読むときはカーソルと同じ id 順で並べる（時刻が同じ行の取りこぼし・重複を防ぐ）
+    order_by = "collected_at ASC, id ASC"
+    if after_id is not None:
+        where += " AND id > %s"
+        params.append(int(after_id))
+        order_by = "id ASC"
 
     sql = f"""
         SELECT id, collected_at, hostname, sample
         FROM app_usage_samples
         {where}
-        ORDER BY collected_at ASC
+        ORDER BY {order_by}
         LIMIT %s
     """
     params.append(limit_i)
@@ -210,18 +477,25 @@ def fetch_app_usage_samples_since(*, hostname: Optional[str], since_hours: int,
     with connect() as conn:
         with conn.cursor() as cur:
             cur.execute(sql, params)
-            rows = cur.fetchall() or []
-            return [dict(r) for r in rows]
+            # dict_row なので行はそのまま dict（コピーし直さない）
+            return cur.fetchall()
 
 
-def insert_chat_message(
-    *,
+_INSERT_CHAT_MESSAGE_SQL = """
+    INSERT INTO chat_messages (conversation_id, role, content, source, meta)
+    VALUES (%s, %s, %s, %s, %s)
+    RETURNING id
+"""
+
+
+def _chat_message_params(
     conversation_id: str,
     role: str,
     content: str,
-    source: Optional[str] = None,
-    meta: Optional[Dict[str, Any]] = None,
-) -> int:
+    source: Optional[str],
+    meta: Optional[Dict[str, Any]],
+) -> Optional[Tuple[Any, ...]]:
+    """INSERT 用のパラメータに整える。本文が空なら None（保存しない）"""
     conversation_id_s = (conversation_id or "default").strip() or "default"
     role_s = (role or "").strip()
     if role_s not in {"system", "user", "assistant"}:
@@ -229,39 +503,83 @@ def insert_chat_message(
 
     content_s = (content or "").strip()
     if not content_s:
+        return None
+
+    return (conversation_id_s, role_s, content_s, source, Jsonb(meta) if meta is not None else None)
+
+
+def insert_chat_message(
+    *,
+    conversation_id: str,
+    role: str,
+    content: str,
+    source: Optional[str] = None,
+    meta: Optional[Dict[str, Any]] = None,
+) -> int:
+    params = _chat_message_params(conversation_id, role, content, source, meta)
+    if params is None:
         return -1
 
     with connect() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                INSERT INTO chat_messages (conversation_id, role, content, source, meta)
-                VALUES (%s, %s, %s, %s, %s)
-                RETURNING id
-                """,
-                (conversation_id_s, role_s, content_s, source, Jsonb(meta) if meta is not None else None),
-            )
+        with conn.cursor(row_factory=tuple_row) as cur:
+            cur.execute(_INSERT_CHAT_MESSAGE_SQL, params)
             row = cur.fetchone()
-            return int(row["id"]) if row and "id" in row else -1
+            return int(row[0]) if row else -1
+
+
+def insert_chat_messages(*, conversation_id: str, messages: List[Tuple[str, str, Optional[str]]]) -> List[int]:
+    """(role, content, source) の並びをまとめて保存し、保存した行の id を返す（本文が空のものは飛ばす）。
+
+    executemany はパイプラインで送るので、質問と回答の2件でも往復は1回で済む。
+    """
+    rows = []
+    for role, content, source in messages:
+        params = _chat_message_params(conversation_id, role, content, source, None)
+        if params is not None:
+            rows.append(params)
+    if not rows:
+        return []
+
+    ids: List[int] = []
+    with connect() as conn:
+        with conn.cursor(row_factory=tuple_row) as cur:
+            cur.executemany(_INSERT_CHAT_MESSAGE_SQL, rows, returning=True)
+            while True:
+                row = cur.fetchone()
+                if row:
+                    ids.append(int(row[0]))
+                if not cur.nextset():
+                    break
+    return ids
 
 
-def fetch_chat_messages(*, conversation_id: str, limit: int = 200) -> List[Dict[str, Any]]:
+def fetch_chat_messages(*, conversation_id: str, limit: int = 200, after_id: Optional[int] = None) -> List[Dict[str, Any]]:
+    """会話の履歴を古い順で取得。after_id を渡すとそれより後のメッセージだけを返す。"""
     conversation_id_s = (conversation_id or "default").strip() or "default"
     limit_i = max(1, min(1000, int(limit)))
+
+    where = "WHERE conversation_id = %s"
+    params: List[Any] = [conversation_id_s]
+    # after_id で続きを読むときはカーソルと同じ id 順で並べる（時刻が同じ行の取りこぼし・重複を防ぐ）
+    order_by = "created_at ASC, id ASC"
+    if after_id is not None:
+        where += " AND id > %s"
+        params.append(int(after_id))
+        order_by = "id ASC"
+
+    sql = f"""
+        SELECT id, created_at, conversation_id, role, content, source
+        FROM chat_messages
+        {where}
+        ORDER BY {order_by}
+        LIMIT %s
+    """
+    params.append(limit_i)
+
     with connect() as conn:
         with conn.cursor() as cur:
-            cur.execute(
-                """
-                SELECT id, created_at, conversation_id, role, content, source
-                FROM chat_messages
-                WHERE conversation_id = %s
-                ORDER BY created_at ASC
-                LIMIT %s
-                """,
-                (conversation_id_s, limit_i),
-            )
-            rows = cur.fetchall() or []
-            return [dict(r) for r in rows]
+            cur.execute(sql, params)
+            return cur.fetchall()
 
 
 def clear_chat_messages(*, conversation_id: str) -> int:
@@ -281,16 +599,11 @@ def list_chat_conversations(*, limit: int = 100) -> List[Dict[str, Any]]:
         with conn.cursor() as cur:
             cur.execute(
                 """
-                SELECT
-                  conversation_id,
-                  MAX(created_at) AS last_message_at,
-                  COUNT(*)::BIGINT AS message_count
-                FROM chat_messages
-                GROUP BY conversation_id
+                SELECT conversation_id, last_message_at, message_count
+                FROM chat_conversations
                 ORDER BY last_message_at DESC
                 LIMIT %s
                 """,
                 (limit_i,),
             )
-            rows = cur.fetchall() or []
-            return [dict(r) for r in rows]
+            return cur.fetchall()
@@ -1,26 +1,106 @@
 from __future__ import annotations
 
+import ipaddress
+import json
 import platform
 import re
+import select
 import socket
 import subprocess
 import time
 import ssl
+import struct
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, wraps
 from urllib.parse import urlparse
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import dns.exception
+    import dns.resolver
+except ImportError:  # dnspython is optional; nslookup_server falls back to nslookup
+    dns = None
 
 
 _HOST_RE = re.compile(r"^[a-zA-Z0-9][a-zA-Z0-9._-]{0,252}$")
 _IP_RE = re.compile(r"^[0-9a-fA-F:.]{2,64}$")
 
+# tracert: overall time limit, hop lines ("  3    12 ms    11 ms    12 ms  203.0.113.1") and the
+# resolved destination in the header ("Tracing route to host [203.0.113.9]").
+_TRACERT_TIMEOUT_S = 30.0
+_TRACERT_HOP_RE = re.compile(r"^\s*(\d+)\s")
+_TRACERT_DEST_RE = re.compile(r"\[([0-9a-fA-F:.]+)\]")
+
+# Dotted IPv4 addresses in command output (netsh dnsservers).
+_IPV4_ADDR_RE = re.compile(r"\b(?:\d{1,3}\.){3}\d{1,3}\b")
+
+# nslookup output: the text after the first "Address:" on each line.
+_NSLOOKUP_ADDR_RE = re.compile(r"Address:(.*)")
+
+# Upper bound on concurrent probes in run_connectivity_suite.
+_SUITE_MAX_WORKERS = 32
+# Concurrent nslookup runs for the deep-check name x DNS-server matrix.
+_NSLOOKUP_MAX_WORKERS = 8
+
+# Shared session for http_check: pooled keep-alive connections across probes
+# (and across the concurrent suite workers).
+_HTTP_SESSION = requests.Session()
+_HTTP_ADAPTER = HTTPAdapter(pool_connections=16, pool_maxsize=32, max_retries=0)
+_HTTP_SESSION.mount("http://", _HTTP_ADAPTER)
+_HTTP_SESSION.mount("https://", _HTTP_ADAPTER)
+_HTTP_DRAIN_LIMIT = 64 * 1024
+
+# dns_lookup results: hostname -> (monotonic time, addresses). Kept short so a
+# diagnostics re-run still notices DNS changes.
+_DNS_CACHE_TTL_S = 30.0
+# Hostnames come from API input, so the cache is bounded (oldest entries go first).
+_DNS_CACHE_MAX = 512
+_DNS_CACHE: 'OrderedDict[str, Tuple[float, List[str]]]' = OrderedDict()
+_DNS_CACHE_LOCK = threading.Lock()
+
+# get_default_gateway / get_dns_servers / proxy_pac_info: function name -> (monotonic
+# time, result). The host's network configuration rarely changes between suite runs
+# (e.g. a monitoring loop), so a successful result is reused for a while.
+_NET_CONFIG_TTL_S = 30.0
+_NET_CONFIG_CACHE: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+_NET_CONFIG_CACHE_LOCK = threading.Lock()
+
 
 def _is_windows() -> bool:
     return platform.system().lower() == "windows"
 
 
+def _net_config_cached(fn: Callable[[], Dict[str, Any]]) -> Callable[[], Dict[str, Any]]:
+    """Reuse fn()'s result for _NET_CONFIG_TTL_S; only "ok" results are cached."""
+    key = fn.__name__
+
+    @wraps(fn)
+    def wrapper() -> Dict[str, Any]:
+        now = time.monotonic()
+        with _NET_CONFIG_CACHE_LOCK:
+            hit = _NET_CONFIG_CACHE.get(key)
+        if hit is not None and now - hit[0] < _NET_CONFIG_TTL_S:
+            return dict(hit[1])
+        r = fn()
+        if r.get("ok"):
+            with _NET_CONFIG_CACHE_LOCK:
+                _NET_CONFIG_CACHE[key] = (now, r)
+        return dict(r)
+
+    return wrapper
+
+
+def net_config_cache_clear() -> None:
+    with _NET_CONFIG_CACHE_LOCK:
+        _NET_CONFIG_CACHE.clear()
+
+
 def _trim(s: str, *, limit: int) -> str:
     if not s:
         return ""
@@ -56,64 +136,134 @@ def _run_cmd(cmd: List[str], *, timeout_s: float, stdout_limit: int = 8000, stde
         return {"ok": False, "error": str(e)}
 
 
-def _run_powershell(ps_command: str, *, timeout_s: float = 6.0) -> Dict[str, Any]:
-    if not _is_windows():
-        return {"ok": False, "error": "not windows"}
-    return _run_cmd(["powershell", "-NoProfile", "-Command", ps_command], timeout_s=timeout_s)
+_ERROR_INSUFFICIENT_BUFFER = 122
+
+
+def _default_gateway_win32() -> Optional[str]:
+    """Lowest-metric IPv4 default route from GetIpForwardTable (iphlpapi); no process launch."""
+    import ctypes
+    from ctypes import wintypes
 
+    class _MibIpForwardRow(ctypes.Structure):
+        _fields_ = [
+            (name, wintypes.DWORD)
+            for name in (
+                "dwForwardDest", "dwForwardMask", "dwForwardPolicy", "dwForwardNextHop",
+                "dwForwardIfIndex", "dwForwardType", "dwForwardProto", "dwForwardAge",
+                "dwForwardNextHopAS", "dwForwardMetric1", "dwForwardMetric2",
+                "dwForwardMetric3", "dwForwardMetric4", "dwForwardMetric5",
+            )
+        ]
 
+    try:
+        iphlpapi = ctypes.windll.iphlpapi
+    except Exception:
+        return None
+
+    # The table can grow between the size query and the read, so retry a few times.
+    size = wintypes.ULONG(0)
+    buf = None
+    for _ in range(3):
+        buf = ctypes.create_string_buffer(max(size.value, ctypes.sizeof(wintypes.DWORD)))
+        rc = iphlpapi.GetIpForwardTable(buf, ctypes.byref(size), False)
+        if rc == 0:
+            break
+        if rc != _ERROR_INSUFFICIENT_BUFFER:
+            return None
+    else:
+        return None
+
+    # MIB_IPFORWARDTABLE: DWORD dwNumEntries followed by the rows.
+    count = wintypes.DWORD.from_buffer(buf).value
+    rows = (_MibIpForwardRow * count).from_buffer(buf, ctypes.sizeof(wintypes.DWORD))
+    best = None
+    for row in rows:
+        if row.dwForwardDest == 0 and row.dwForwardMask == 0 and row.dwForwardNextHop:
+            if best is None or row.dwForwardMetric1 < best.dwForwardMetric1:
+                best = row
+    if best is None:
+        return None
+    # Addresses are stored in network byte order as laid out in memory.
+    return socket.inet_ntoa(best.dwForwardNextHop.to_bytes(4, "little"))
+
+
+@_net_config_cached
 def get_default_gateway() -> Dict[str, Any]:
     """Return default gateway (best-effort)."""
     if not _is_windows():
         return {"ok": False, "error": "not windows"}
 
-    # Prefer Get-NetRoute (newer Windows)
-    ps = (
-        "try { "
-        "($r = Get-NetRoute -DestinationPrefix '0.0.0.0/0' -ErrorAction Stop | Sort-Object RouteMetric | Select-Object -First 1); "
-        "$r.NextHop } catch { '' }"
-    )
-    r = _run_powershell(ps, timeout_s=5.0)
-    gw = None
-    if r.get("ok") and isinstance(r.get("stdout"), str):
-        gw_s = r.get("stdout").strip().splitlines()[:1]
-        gw = gw_s[0].strip() if gw_s and gw_s[0].strip() else None
-
+    try:
+        gw = _default_gateway_win32()
+    except (OSError, ValueError) as e:
+        return {"ok": False, "error": str(e)}
     if gw:
-        return {"ok": True, "default_gateway": gw, "source": "Get-NetRoute"}
-
-    # Fallback: parse route print output
-    rr = _run_cmd(["route", "print", "-4"], timeout_s=5.0, stdout_limit=12000)
-    out = rr.get("stdout") if isinstance(rr, dict) else None
-    if isinstance(out, str):
-        # Very loose parse: find line like "0.0.0.0          0.0.0.0      <gw>"
-        for line in out.splitlines():
-            if line.strip().startswith("0.0.0.0"):
-                parts = line.split()
-                if len(parts) >= 3 and parts[0] == "0.0.0.0" and parts[1] == "0.0.0.0":
-                    gw2 = parts[2].strip()
-                    if gw2:
-                        return {"ok": True, "default_gateway": gw2, "source": "route print"}
+        return {"ok": True, "default_gateway": gw, "source": "GetIpForwardTable"}
     return {"ok": False, "error": "default gateway not found"}
 
 
+@_net_config_cached
 def get_dns_servers() -> Dict[str, Any]:
     if not _is_windows():
         return {"ok": False, "error": "not windows"}
-    ps = (
-        "try { "
-        "Get-DnsClientServerAddress -AddressFamily IPv4 | "
-        "Select-Object -ExpandProperty ServerAddresses | Where-Object { $_ } "
-        "} catch { }"
-    )
-    r = _run_powershell(ps, timeout_s=6.0)
-    servers: List[str] = []
-    if r.get("ok") and isinstance(r.get("stdout"), str):
-        for line in r["stdout"].splitlines():
-            s = line.strip()
-            if s and s not in servers:
-                servers.append(s)
-    return {"ok": True, "servers": servers, "raw": r}
+    # netsh starts far faster than powershell.exe. Its section labels are localized,
+    # so only the IPv4 addresses are taken from the output.
+    r = _run_cmd(["netsh", "interface", "ipv4", "show", "dnsservers"], timeout_s=6.0)
+    stdout = r.get("stdout")
+    servers = list(dict.fromkeys(_IPV4_ADDR_RE.findall(stdout))) if isinstance(stdout, str) else []
+    # ok mirrors the netsh run, so a failed read is not cached as an empty server list.
+    return {"ok": bool(r.get("ok")), "servers": servers, "raw": r}
+
+
+def _is_ip_literal(value: str) -> bool:
+    try:
+        ipaddress.ip_address(value)
+        return True
+    except ValueError:
+        return False
+
+
+# server IP -> Resolver pinned to that server (configure=False: ignore the OS resolver config)
+_RESOLVERS: Dict[str, Any] = {}
+_RESOLVERS_LOCK = threading.Lock()
+
+
+def _resolver_for(server: str) -> Any:
+    with _RESOLVERS_LOCK:
+        r = _RESOLVERS.get(server)
+        if r is None:
+            r = dns.resolver.Resolver(configure=False)
+            r.nameservers = [server]
+            _RESOLVERS[server] = r
+        return r
+
+
+def _resolve_with_server(name: str, srv: str, *, timeout_s: float) -> Dict[str, Any]:
+    """nslookup equivalent (A + AAAA against one server) without starting nslookup."""
+    resolver = _resolver_for(srv)
+    ips: List[str] = []
+    error = None
+    started = time.monotonic()
+    for rdtype in ("A", "AAAA"):
+        try:
+            answer = resolver.resolve(name, rdtype, lifetime=timeout_s, search=False)
+        except (dns.resolver.NoAnswer, dns.resolver.NoNameservers) as e:
+            error = error or str(e)
+            continue
+        except dns.exception.DNSException as e:
+            # NXDOMAIN / timeout: the other record type would fail the same way
+            error = str(e)
+            break
+        for rr in answer:
+            v = rr.to_text()
+            if v not in ips:
+                ips.append(v)
+    elapsed_ms = int((time.monotonic() - started) * 1000)
+    ok = len(ips) > 0
+    out: Dict[str, Any] = {"ok": ok, "target": name, "server": srv, "addresses": ips, "elapsed_ms": elapsed_ms}
+    if not ok:
+        out["error"] = error or "no address records"
+    return out
 
 
 def nslookup_server(hostname: str, server: str, *, timeout_s: float = 4.0) -> Dict[str, Any]:
@@ -122,16 +272,15 @@ def nslookup_server(hostname: str, server: str, *, timeout_s: float = 4.0) -> Di
     if not _is_reasonable_host(name) or not _is_reasonable_host(srv):
         return {"ok": False, "target": name, "server": srv, "error": "invalid hostname/server"}
 
+    if dns is not None and _is_ip_literal(srv):
+        return _resolve_with_server(name, srv, timeout_s=timeout_s)
+
     r = _run_cmd(["nslookup", name, srv], timeout_s=timeout_s, stdout_limit=8000)
     stdout = r.get("stdout") if isinstance(r, dict) else ""
     ips: List[str] = []
     if isinstance(stdout, str):
         # collect IPv4/IPv6 address lines
-        for line in stdout.splitlines():
-            if "Address:" in line:
-                v = line.split("Address:", 1)[-1].strip()
-                if v and v not in ips:
-                    ips.append(v)
+        ips = list(dict.fromkeys(filter(None, (v.strip() for v in _NSLOOKUP_ADDR_RE.findall(stdout)))))
     ok = bool(r.get("ok")) and len(ips) > 0
     out = {"ok": ok, "target": name, "server": srv, "addresses": ips}
     out.update({k: r.get(k) for k in ("elapsed_ms", "returncode") if isinstance(r, dict)})
@@ -151,42 +300,122 @@ def tracert(target: str, *, max_hops: int = 15, timeout_ms: int = 1000) -> Dict[
     hops_i = max(3, min(30, int(max_hops)))
     timeout_i = max(200, min(5000, int(timeout_ms)))
 
-    r = _run_cmd(["tracert", "-d", "-h", str(hops_i), "-w", str(timeout_i), t], timeout_s=30.0, stdout_limit=12000)
-    out = r.get("stdout") if isinstance(r, dict) else ""
-    lines = out.splitlines() if isinstance(out, str) else []
-    # Keep last lines (header can be noisy)
-    tail = lines[-80:]
-    return {
-        "ok": bool(r.get("ok")),
+    # Read tracert's output as it arrives and stop as soon as the destination
+    # (or the last allowed hop) has answered, instead of waiting for the whole run.
+    cmd = ["tracert", "-d", "-h", str(hops_i), "-w", str(timeout_i), t]
+    dest_ip = t if _is_ip_literal(t) else None
+    lines: Deque[str] = deque(maxlen=80)  # keep last lines (header can be noisy)
+    reached = False
+    timed_out = threading.Event()
+    started = time.monotonic()
+    try:
+        proc = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            encoding="utf-8",
+            errors="ignore",
+        )
+    except Exception as e:
+        return {"ok": False, "target": t, "error": str(e)}
+
+    def _on_timeout() -> None:
+        timed_out.set()
+        proc.kill()
+
+    timer = threading.Timer(_TRACERT_TIMEOUT_S, _on_timeout)
+    timer.start()
+    try:
+        assert proc.stdout is not None
+        for raw in proc.stdout:
+            line = raw.rstrip("\r\n")
+            lines.append(line)
+            m = _TRACERT_HOP_RE.match(line)
+            if m is None:
+                if dest_ip is None:
+                    # "Tracing route to host [1.2.3.4]"
+                    h = _TRACERT_DEST_RE.search(line)
+                    if h:
+                        dest_ip = h.group(1)
+                continue
+            if dest_ip and line.split()[-1] == dest_ip:
+                reached = True
+                break
+            if int(m.group(1)) >= hops_i:
+                break
+    finally:
+        if proc.poll() is None:
+            proc.terminate()
+        try:
+            rest, err = proc.communicate(timeout=5.0)
+        except Exception:
+            proc.kill()
+            rest, err = "", ""
+        timer.cancel()
+
+    for line in (rest or "").splitlines():
+        if line.strip():
+            lines.append(line)
+    elapsed_ms = int((time.monotonic() - started) * 1000)
+    out: Dict[str, Any] = {
+        "ok": reached or (proc.returncode == 0 and not timed_out.is_set()),
         "target": t,
-        "elapsed_ms": r.get("elapsed_ms"),
-        "returncode": r.get("returncode"),
-        "lines": tail,
-        "stderr": r.get("stderr"),
+        "elapsed_ms": elapsed_ms,
+        "returncode": proc.returncode,
+        "lines": list(lines),
+        "stderr": _trim(err or "", limit=2000),
     }
+    if timed_out.is_set():
+        out["error"] = "timeout"
+    return out
+
 
+_INET_SETTINGS_KEY = r"Software\Microsoft\Windows\CurrentVersion\Internet Settings"
+_INET_SETTINGS_VALUES = ("ProxyEnable", "ProxyServer", "ProxyOverride", "AutoConfigURL", "AutoDetect")
 
+
+def _read_inet_settings() -> Dict[str, Any]:
+    """WinINET proxy values from HKCU, read in-process (missing values are None)."""
+    import winreg  # type: ignore
+
+    try:
+        key = winreg.OpenKey(winreg.HKEY_CURRENT_USER, _INET_SETTINGS_KEY)
+    except OSError:
+        return {}
+    out: Dict[str, Any] = {}
+    with key:
+        for name in _INET_SETTINGS_VALUES:
+            try:
+                out[name] = winreg.QueryValueEx(key, name)[0]
+            except OSError:
+                out[name] = None
+    return out
+
+
+@_net_config_cached
 def proxy_pac_info() -> Dict[str, Any]:
     if not _is_windows():
         return {"ok": False, "error": "not windows"}
 
     # IE/WinINET settings (HKCU)
-    ps = (
-        "try { "
-        "$p = Get-ItemProperty 'HKCU:\\Software\\Microsoft\\Windows\\CurrentVersion\\Internet Settings' -ErrorAction Stop; "
-        "$o = [ordered]@{ ProxyEnable=$p.ProxyEnable; ProxyServer=$p.ProxyServer; ProxyOverride=$p.ProxyOverride; AutoConfigURL=$p.AutoConfigURL; AutoDetect=$p.AutoDetect }; "
-        "$o | ConvertTo-Json -Depth 4 } catch { '{}' }"
-    )
-    ie = _run_powershell(ps, timeout_s=6.0)
+    ie = _read_inet_settings()
     winhttp = _run_cmd(["netsh", "winhttp", "show", "proxy"], timeout_s=6.0, stdout_limit=6000)
 
     return {
-        "ok": True,
-        "inet_settings_raw": ie.get("stdout"),
+        # Likewise: a failed netsh run is reported (and not cached) instead of an empty winhttp_raw.
+        "ok": bool(winhttp.get("ok")),
+        "inet_settings_raw": json.dumps(ie, ensure_ascii=False, indent=4),
         "winhttp_raw": winhttp.get("stdout"),
     }
 
 
+@lru_cache(maxsize=1)
+def _tls_context() -> ssl.SSLContext:
+    # Built once and shared: create_default_context() reloads the CA store every time.
+    return ssl.create_default_context()
+
+
 def tls_handshake(url: str, *, timeout_s: float = 4.0) -> Dict[str, Any]:
     u = (url or "").strip()
     try:
@@ -218,7 +447,7 @@ def tls_handshake(url: str, *, timeout_s: float = 4.0) -> Dict[str, Any]:
     verify_error = None
     cert_info = None
     try:
-        ctx = ssl.create_default_context()
+        ctx = _tls_context()
         with socket.create_connection((host, port), timeout=timeout_f) as sock:
             with ctx.wrap_socket(sock, server_hostname=host) as ssock:
                 cert_info = _cert_dict(ssock.getpeercert())
@@ -226,18 +455,6 @@ def tls_handshake(url: str, *, timeout_s: float = 4.0) -> Dict[str, Any]:
     except Exception as e:
         verify_error = str(e)
 
-    # If verify failed, try unverified to at least fetch certificate details
-    if not verify_ok:
-        try:
-            ctx2 = ssl.create_default_context()
-            ctx2.check_hostname = False
-            ctx2.verify_mode = ssl.CERT_NONE
-            with socket.create_connection((host, port), timeout=timeout_f) as sock:
-                with ctx2.wrap_socket(sock, server_hostname=host) as ssock:
-                    cert_info = _cert_dict(ssock.getpeercert())
-        except Exception:
-            pass
-
     elapsed_ms = int((time.monotonic() - started) * 1000)
     ok = verify_ok
     out = {
@@ -256,12 +473,188 @@ def tls_handshake(url: str, *, timeout_s: float = 4.0) -> Dict[str, Any]:
 def _is_reasonable_host(value: str) -> bool:
     if not value or not isinstance(value, str):
         return False
-    v = value.strip()
+    return _is_reasonable_host_stripped(value.strip())
+
+
+@lru_cache(maxsize=2048)
+def _is_reasonable_host_stripped(v: str) -> bool:
+    # Pure check on the canonical (stripped) string; targets repeat across a suite run.
     if not v or len(v) > 255:
         return False
     return bool(_HOST_RE.match(v) or _IP_RE.match(v))
 
 
+_ICMP_ECHO_REQUEST = 8
+_ICMP_ECHO_REPLY = 0
+_ICMP_PAYLOAD = b"connectivity-check"
+# Set once an in-process ICMP echo turns out to be unavailable (no permission / API).
+_icmp_unavailable = False
+_icmp_seq = 0
+
+
+def _icmp_checksum(data: bytes) -> int:
+    if len(data) % 2:
+        data += b"\0"
+    s = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    s = (s >> 16) + (s & 0xFFFF)
+    s += s >> 16
+    return ~s & 0xFFFF
+
+
+def _icmp_echo_packet(seq: int) -> bytes:
+    # The kernel fills in the identifier for datagram ICMP sockets.
+    header = struct.pack("!BBHHH", _ICMP_ECHO_REQUEST, 0, 0, 0, seq)
+    return struct.pack("!BBHHH", _ICMP_ECHO_REQUEST, 0, _icmp_checksum(header + _ICMP_PAYLOAD), 0, seq) + _ICMP_PAYLOAD
+
+
+def _icmp_echo_socket_batch(ips: List[str], *, timeout_ms: int) -> Optional[List[Dict[str, Any]]]:
+    """Echo every address from one unprivileged ICMP datagram socket (Linux/macOS).
+
+    All requests go out first and the replies are collected with select() until
+    the shared deadline, matched back to their address by sequence number.
+    """
+    global _icmp_seq
+    try:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+    except OSError:
+        return None
+
+    results: List[Optional[Dict[str, Any]]] = [None] * len(ips)
+    pending: Dict[int, Tuple[int, float]] = {}  # seq -> (index into ips, sent at)
+    error = "timeout"
+    with sock:
+        sock.setblocking(False)
+        deadline = time.monotonic() + timeout_ms / 1000.0
+        for i, ip in enumerate(ips):
+            _icmp_seq = (_icmp_seq + 1) & 0xFFFF
+            seq = _icmp_seq
+            try:
+                sock.sendto(_icmp_echo_packet(seq), (ip, 0))
+            except OSError as e:
+                results[i] = {"ok": False, "error": str(e)}
+                continue
+            pending[seq] = (i, time.monotonic())
+
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            ready, _w, _x = select.select([sock], [], [], remaining)
+            if not ready:
+                break
+            try:
+                data, _addr = sock.recvfrom(1024)
+            except (BlockingIOError, InterruptedError):
+                continue
+            except OSError as e:
+                error = str(e)
+                break
+            # macOS includes the IP header, Linux does not.
+            if data and data[0] >> 4 == 4 and len(data) >= 20:
+                data = data[(data[0] & 0x0F) * 4:]
+            if len(data) >= 8:
+                icmp_type, _code, _csum, _ident, rseq = struct.unpack("!BBHHH", data[:8])
+                hit = pending.pop(rseq, None) if icmp_type == _ICMP_ECHO_REPLY else None
+                if hit is not None:
+                    results[hit[0]] = {"ok": True, "rtt_ms": int((time.monotonic() - hit[1]) * 1000)}
+
+    return [r if r is not None else {"ok": False, "error": error} for r in results]
+
+
+def _icmp_echo_socket(ip: str, *, timeout_ms: int) -> Optional[Dict[str, Any]]:
+    """One echo via an unprivileged ICMP datagram socket (Linux/macOS)."""
+    r = _icmp_echo_socket_batch([ip], timeout_ms=timeout_ms)
+    return r[0] if r is not None else None
+
+
+def _icmp_echo_windows(ip: str, *, timeout_ms: int) -> Optional[Dict[str, Any]]:
+    """One echo via IcmpSendEcho (iphlpapi); no admin rights or ping.exe needed."""
+    import ctypes
+    from ctypes import wintypes
+
+    class _IpOptionInformation(ctypes.Structure):
+        _fields_ = [
+            ("Ttl", ctypes.c_ubyte),
+            ("Tos", ctypes.c_ubyte),
+            ("Flags", ctypes.c_ubyte),
+            ("OptionsSize", ctypes.c_ubyte),
+            ("OptionsData", ctypes.c_void_p),
+        ]
+
+    class _IcmpEchoReply(ctypes.Structure):
+        _fields_ = [
+            ("Address", ctypes.c_ulong),
+            ("Status", ctypes.c_ulong),
+            ("RoundTripTime", ctypes.c_ulong),
+            ("DataSize", ctypes.c_ushort),
+            ("Reserved", ctypes.c_ushort),
+            ("Data", ctypes.c_void_p),
+            ("Options", _IpOptionInformation),
+        ]
+
+    try:
+        iphlpapi = ctypes.windll.iphlpapi
+    except Exception:
+        return None
+    iphlpapi.IcmpCreateFile.restype = wintypes.HANDLE
+    iphlpapi.IcmpSendEcho.argtypes = [
+        wintypes.HANDLE, ctypes.c_ulong, ctypes.c_void_p, ctypes.c_ushort,
+        ctypes.c_void_p, ctypes.c_void_p, ctypes.c_ulong, ctypes.c_ulong,
+    ]
+    iphlpapi.IcmpSendEcho.restype = ctypes.c_ulong
+    iphlpapi.IcmpCloseHandle.argtypes = [wintypes.HANDLE]
+
+    handle = iphlpapi.IcmpCreateFile()
+    if not handle or handle == wintypes.HANDLE(-1).value:
+        return None
+    try:
+        # IPAddr is the address in network byte order as laid out in memory.
+        dest = int.from_bytes(socket.inet_aton(ip), "little")
+        req = ctypes.create_string_buffer(_ICMP_PAYLOAD, len(_ICMP_PAYLOAD))
+        reply_size = ctypes.sizeof(_IcmpEchoReply) + len(_ICMP_PAYLOAD) + 8 + 16
+        reply = ctypes.create_string_buffer(reply_size)
+        n = iphlpapi.IcmpSendEcho(handle, dest, req, len(_ICMP_PAYLOAD), None, reply, reply_size, timeout_ms)
+        if n == 0:
+            return {"ok": False, "error": "timeout"}
+        echo = _IcmpEchoReply.from_buffer(reply)
+        if echo.Status != 0:
+            return {"ok": False, "error": f"icmp status {echo.Status}"}
+        return {"ok": True, "rtt_ms": int(echo.RoundTripTime)}
+    finally:
+        iphlpapi.IcmpCloseHandle(handle)
+
+
+def _icmp_address(host: str) -> Optional[str]:
+    try:
+        return socket.getaddrinfo(host, None, socket.AF_INET)[0][4][0]
+    except (socket.gaierror, IndexError):
+        # IPv6-only names / IPv6 literals are left to the ping command.
+        return None
+
+
+def _icmp_ping(host: str, *, timeout_ms: int) -> Optional[Dict[str, Any]]:
+    """In-process IPv4 echo; None means "not available here, use the ping command"."""
+    global _icmp_unavailable
+    if _icmp_unavailable:
+        return None
+    ip = _icmp_address(host)
+    if ip is None:
+        return None
+
+    try:
+        if _is_windows():
+            r = _icmp_echo_windows(ip, timeout_ms=timeout_ms)
+        else:
+            r = _icmp_echo_socket(ip, timeout_ms=timeout_ms)
+    except OSError as e:
+        return {"ok": False, "address": ip, "error": str(e)}
+    if r is None:
+        _icmp_unavailable = True
+        return None
+    r["address"] = ip
+    return r
+
+
 def ping_once(host: str, *, timeout_ms: int = 1000) -> Dict[str, Any]:
     host_s = (host or "").strip()
     if not _is_reasonable_host(host_s):
@@ -269,6 +662,15 @@ def ping_once(host: str, *, timeout_ms: int = 1000) -> Dict[str, Any]:
 
     timeout_ms_i = max(200, min(5000, int(timeout_ms)))
 
+    # Send the echo from this process when possible: no ping.exe launch or output parsing.
+    started = time.monotonic()
+    icmp = _icmp_ping(host_s, timeout_ms=timeout_ms_i)
+    if icmp is not None:
+        elapsed_ms = int((time.monotonic() - started) * 1000)
+        res: Dict[str, Any] = {"ok": icmp["ok"], "target": host_s, "elapsed_ms": elapsed_ms}
+        res.update({k: icmp[k] for k in ("address", "rtt_ms", "error") if k in icmp})
+        return res
+
     if _is_windows():
         cmd = ["ping", "-n", "1", "-w", str(timeout_ms_i), host_s]
         timeout_s = max(1.0, (timeout_ms_i / 1000.0) + 1.5)
@@ -308,30 +710,89 @@ def ping_once(host: str, *, timeout_ms: int = 1000) -> Dict[str, Any]:
         return {"ok": False, "target": host_s, "error": str(e)}
 
 
+def ping_many(hosts: List[str], *, timeout_ms: int = 1000) -> List[Dict[str, Any]]:
+    """ping_once for each host (same result dicts, same order).
+
+    Where datagram ICMP sockets are available the IPv4 echoes share one socket
+    and one wait; everything else goes through ping_once concurrently.
+    """
+    global _icmp_unavailable
+    timeout_ms_i = max(200, min(5000, int(timeout_ms)))
+    out: List[Optional[Dict[str, Any]]] = [None] * len(hosts)
+
+    if hosts and not _icmp_unavailable and not _is_windows():
+        valid = []
+        for i, host in enumerate(hosts):
+            host_s = (host or "").strip()
+            if _is_reasonable_host(host_s):
+                valid.append((i, host_s))
+            else:
+                out[i] = {"ok": False, "target": host, "error": "invalid host"}
+        with ThreadPoolExecutor(max_workers=max(1, min(_NSLOOKUP_MAX_WORKERS, len(valid)))) as rex:
+            addrs = list(rex.map(_icmp_address, [h for _i, h in valid]))
+        batch = [(i, h, ip) for (i, h), ip in zip(valid, addrs) if ip is not None]
+
+        started = time.monotonic()
+        try:
+            echoes = _icmp_echo_socket_batch([ip for _i, _h, ip in batch], timeout_ms=timeout_ms_i) if batch else []
+        except OSError as e:
+            echoes = [{"ok": False, "error": str(e)} for _b in batch]
+        elapsed_ms = int((time.monotonic() - started) * 1000)
+        if echoes is None:
+            _icmp_unavailable = True
+        else:
+            for (i, host_s, ip), icmp in zip(batch, echoes):
+                res: Dict[str, Any] = {"ok": icmp["ok"], "target": host_s, "elapsed_ms": icmp.get("rtt_ms", elapsed_ms), "address": ip}
+                res.update({k: icmp[k] for k in ("rtt_ms", "error") if k in icmp})
+                out[i] = res
+
+    rest = [i for i, r in enumerate(out) if r is None]
+    if rest:
+        with ThreadPoolExecutor(max_workers=max(1, min(_SUITE_MAX_WORKERS, len(rest)))) as pex:
+            for i, r in zip(rest, pex.map(lambda i: ping_once(hosts[i], timeout_ms=timeout_ms_i), rest)):
+                out[i] = r
+    return [r for r in out if r is not None]
+
+
 def dns_lookup(hostname: str) -> Dict[str, Any]:
     name = (hostname or "").strip()
     if not _is_reasonable_host(name):
         return {"ok": False, "target": hostname, "error": "invalid hostname"}
 
+    # Only successful lookups are cached, so a failure is always re-checked.
+    now = time.monotonic()
+    with _DNS_CACHE_LOCK:
+        hit = _DNS_CACHE.get(name)
+    if hit is not None and now - hit[0] < _DNS_CACHE_TTL_S:
+        return {"ok": True, "target": name, "addresses": list(hit[1])}
+
     try:
-        infos = socket.getaddrinfo(name, None)
-        addrs: List[str] = []
-        for family, _socktype, _proto, _canonname, sockaddr in infos:
-            if not sockaddr:
-                continue
-            addr = sockaddr[0]
-            if isinstance(addr, str):
-                addrs.append(addr)
-        # unique
-        uniq = []
-        for a in addrs:
-            if a not in uniq:
-                uniq.append(a)
-        return {"ok": True, "target": name, "addresses": uniq}
+        # One entry per address instead of one per socktype/proto combination.
+        infos = socket.getaddrinfo(name, None, type=socket.SOCK_STREAM)
+        # unique, keeping the resolver's preference order
+        uniq = list(dict.fromkeys(
+            sockaddr[0] for _family, _socktype, _proto, _canonname, sockaddr in infos
+            if sockaddr and isinstance(sockaddr[0], str)
+        ))
+        with _DNS_CACHE_LOCK:
+            _DNS_CACHE[name] = (now, uniq)
+            _DNS_CACHE.move_to_end(name)
+            # Entries are kept in write order, so expired ones sit at the front.
+            while _DNS_CACHE:
+                oldest = next(iter(_DNS_CACHE.values()))
+                if now - oldest[0] < _DNS_CACHE_TTL_S and len(_DNS_CACHE) <= _DNS_CACHE_MAX:
+                    break
+                _DNS_CACHE.popitem(last=False)
+        return {"ok": True, "target": name, "addresses": list(uniq)}
     except Exception as e:
         return {"ok": False, "target": name, "error": str(e)}
 
 
+def dns_lookup_cache_clear() -> None:
+    with _DNS_CACHE_LOCK:
+        _DNS_CACHE.clear()
+
+
 def http_check(url: str, *, timeout_s: float = 4.0, use_proxy: bool = True) -> Dict[str, Any]:
     u = (url or "").strip()
     if not (u.startswith("http://") or u.startswith("https://")):
@@ -346,7 +807,17 @@ def http_check(url: str, *, timeout_s: float = 4.0, use_proxy: bool = True) -> D
 
     started = time.monotonic()
     try:
-        resp = requests.get(u, timeout=timeout_f, allow_redirects=True, proxies=proxies)
+        # Only the status line and headers are used: ask with HEAD (no body at all)
+        # and fall back to GET for servers that don't implement HEAD.
+        resp = _HTTP_SESSION.head(u, timeout=timeout_f, allow_redirects=True, proxies=proxies)
+        if resp.status_code in (405, 501):
+            resp.close()
+            with _HTTP_SESSION.get(u, timeout=timeout_f, allow_redirects=True, proxies=proxies, stream=True) as resp:
+                # A small body is drained so the keep-alive connection returns to the pool;
+                # anything larger (or of unknown size) is dropped together with its connection.
+                cl = resp.headers.get("content-length")
+                if cl and cl.isdigit() and int(cl) <= _HTTP_DRAIN_LIMIT:
+                    resp.content
         elapsed_ms = int((time.monotonic() - started) * 1000)
         ct = resp.headers.get("content-type")
         return {
@@ -380,49 +851,76 @@ def run_connectivity_suite(
     trace_targets: Optional[List[str]] = None,
     tls_targets: Optional[List[str]] = None,
 ) -> Dict[str, Any]:
-    out: Dict[str, Any] = {
-        "ping": [ping_once(t, timeout_ms=ping_timeout_ms) for t in (ping_targets or [])],
-        "dns": [dns_lookup(t) for t in (dns_targets or [])],
-        "http": [http_check(t, timeout_s=http_timeout_s, use_proxy=use_proxy) for t in (http_targets or [])],
-    }
+    ping_list = ping_targets or []
+    dns_list = dns_targets or []
+    http_list = http_targets or []
+
+    tls_list: List[str] = []
+    trace_list: List[str] = []
+    if deep_checks:
+        tls_list = tls_targets if isinstance(tls_targets, list) else []
+        if not tls_list:
+            tls_list = [u for u in http_list if isinstance(u, str) and u.strip().startswith("https://")]
+        tls_list = tls_list[:5]
+        trace_list = trace_targets if isinstance(trace_targets, list) else []
+        if not trace_list:
+            trace_list = ping_list[:1]
+        trace_list = trace_list[:2]
+
+    # Probes are almost entirely network wait, so run them all at once and
+    # collect results in the original order (total time ~= slowest probe).
+    n_tasks = 1 + len(dns_list) + len(http_list)
+    if deep_checks:
+        n_tasks += 4 + len(tls_list) + len(trace_list)
+    workers = max(1, min(_SUITE_MAX_WORKERS, n_tasks))
+
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        ping_f = ex.submit(ping_many, ping_list, timeout_ms=ping_timeout_ms)
+        dns_f = [ex.submit(dns_lookup, t) for t in dns_list]
+        http_f = [ex.submit(http_check, t, timeout_s=http_timeout_s, use_proxy=use_proxy) for t in http_list]
+        if deep_checks:
+            gw_f = ex.submit(get_default_gateway)
+            dns_servers_f = ex.submit(get_dns_servers)
+            proxy_f = ex.submit(proxy_pac_info)
+            tls_f = [ex.submit(tls_handshake, u, timeout_s=http_timeout_s) for u in tls_list]
+            trace_f = [ex.submit(tracert, t) for t in trace_list]
+
+        out: Dict[str, Any] = {
+            "ping": ping_f.result(),
+            "dns": [f.result() for f in dns_f],
+            "http": [f.result() for f in http_f],
+        }
 
-    if not deep_checks:
-        return out
+        if not deep_checks:
+            return out
+
+        deep: Dict[str, Any] = {"is_windows": _is_windows()}
+
+        # Default gateway (the gateway ping has to wait for the lookup)
+        gw = gw_f.result()
+        deep["default_gateway"] = gw
+        gw_ip = gw.get("default_gateway") if isinstance(gw, dict) else None
+        if isinstance(gw_ip, str) and gw_ip:
+            deep["gateway_ping"] = ex.submit(ping_once, gw_ip, timeout_ms=ping_timeout_ms).result()
+
+        # DNS servers + per-server nslookup
+        dns_servers = dns_servers_f.result()
+        deep["dns_servers"] = dns_servers
+        servers = dns_servers.get("servers") if isinstance(dns_servers, dict) else None
+        if isinstance(servers, list) and servers:
+            # Up to 5x5 nslookup runs; each is mostly process start + network wait.
+            pairs = [(name, s) for name in dns_list[:5] for s in servers[:5]]
+            with ThreadPoolExecutor(max_workers=max(1, min(_NSLOOKUP_MAX_WORKERS, len(pairs)))) as ns_ex:
+                deep["dns_by_server"] = list(ns_ex.map(lambda p: nslookup_server(p[0], p[1], timeout_s=4.0), pairs))
+
+        # Proxy auto detect / PAC
+        deep["proxy"] = proxy_f.result()
+
+        # TLS handshake (https only)
+        deep["tls"] = [f.result() for f in tls_f]
 
-    deep: Dict[str, Any] = {"is_windows": _is_windows()}
-
-    # Default gateway
-    gw = get_default_gateway()
-    deep["default_gateway"] = gw
-    gw_ip = gw.get("default_gateway") if isinstance(gw, dict) else None
-    if isinstance(gw_ip, str) and gw_ip:
-        deep["gateway_ping"] = ping_once(gw_ip, timeout_ms=ping_timeout_ms)
-
-    # DNS servers + per-server nslookup
-    dns_servers = get_dns_servers()
-    deep["dns_servers"] = dns_servers
-    servers = dns_servers.get("servers") if isinstance(dns_servers, dict) else None
-    if isinstance(servers, list) and servers:
-        per: List[Dict[str, Any]] = []
-        for name in (dns_targets or [])[:5]:
-            for s in servers[:5]:
-                per.append(nslookup_server(name, s, timeout_s=4.0))
-        deep["dns_by_server"] = per
-
-    # Proxy auto detect / PAC
-    deep["proxy"] = proxy_pac_info()
-
-    # TLS handshake (https only)
-    tls_list = tls_targets if isinstance(tls_targets, list) else None
-    if not tls_list:
-        tls_list = [u for u in (http_targets or []) if isinstance(u, str) and u.strip().startswith("https://")]
-    deep["tls"] = [tls_handshake(u, timeout_s=http_timeout_s) for u in (tls_list or [])[:5]]
-
-    # Traceroute
-    trace_list = trace_targets if isinstance(trace_targets, list) else None
-    if not trace_list:
-        trace_list = (ping_targets or [])[:1]
-    deep["traceroute"] = [tracert(t) for t in (trace_list or [])[:2]]
+        # Traceroute
+        deep["traceroute"] = [f.result() for f in trace_f]
 
     out["deep"] = deep
     return out
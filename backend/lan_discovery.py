@@ -2,15 +2,19 @@ from __future__ import annotations
 
 import ipaddress
 import json
+import os
 import platform
 import re
+import select
 import socket
+import struct
 import subprocess
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
 from datetime import datetime, timezone
+from functools import lru_cache
 from threading import Lock
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 import psutil
 
@@ -58,8 +62,6 @@ def _run_cmd(cmd: List[str], *, timeout_s: float, stdout_limit: int = 12000, std
         return {"ok": False, "error": str(e)}
 
 
-_NSLOOKUP_NAME_RE = re.compile(r"^\s*(?:Name|名前)\s*:\s*(?P<name>.+?)\s*$", re.IGNORECASE)
-
 _NBTSTAT_NAME_RE = re.compile(r"^\s*(?P<name>[^\s<]{1,32})\s*<00>\s+UNIQUE\s+Registered\s*$", re.IGNORECASE)
 
 
@@ -117,18 +119,12 @@ def _update_seen_times(ip: str, *, now_iso: str) -> Dict[str, str]:
         return dict(cur)
 
 
-def _guess_subnet_and_if(interfaces: List[Dict[str, Any]], ip: str) -> Dict[str, Optional[str]]:
-    ip_s = (ip or "").strip()
-    if not ip_s:
-        return {"subnet": None, "if_guess": None}
-    try:
-        ip_obj = ipaddress.ip_address(ip_s)
-    except Exception:
-        return {"subnet": None, "if_guess": None}
-    if ip_obj.version != 4:
-        return {"subnet": None, "if_guess": None}
+def _interface_networks(interfaces: List[Dict[str, Any]]) -> List[Tuple[int, int, int, str, str]]:
+    """(network int, netmask int, prefixlen, cidr, ifname) for each IPv4 interface subnet.
 
-    candidates = []
+    Parsed once per collection so matching a neighbor IP is a mask-and-compare per subnet.
+    """
+    nets: List[Tuple[int, int, int, str, str]] = []
     for itf in interfaces or []:
         if not isinstance(itf, dict):
             continue
@@ -142,14 +138,26 @@ def _guess_subnet_and_if(interfaces: List[Dict[str, Any]], ip: str) -> Dict[str,
             continue
         if net.version != 4:
             continue
-        if ip_obj in net:
-            candidates.append((int(net.prefixlen), str(net), str(ifname or "")))
+        nets.append((int(net.network_address), int(net.netmask), int(net.prefixlen), str(net), str(ifname or "")))
+    return nets
+
+
+def _guess_subnet_and_if(nets: List[Tuple[int, int, int, str, str]], ip: str) -> Dict[str, Optional[str]]:
+    ip_s = (ip or "").strip()
+    ip_obj = _ipv4_address(ip_s) if ip_s else None
+    if ip_obj is None:
+        return {"subnet": None, "if_guess": None}
+    ip_i = int(ip_obj)
+
+    # Most specific (largest prefix); the first interface wins on ties
+    best = None
+    for net_i, mask_i, prefixlen, cidr, ifname in nets:
+        if ip_i & mask_i == net_i and (best is None or prefixlen > best[0]):
+            best = (prefixlen, cidr, ifname)
 
-    if not candidates:
+    if best is None:
         return {"subnet": None, "if_guess": None}
-    # Most specific (largest prefix)
-    candidates.sort(key=lambda x: x[0], reverse=True)
-    return {"subnet": candidates[0][1], "if_guess": candidates[0][2] or None}
+    return {"subnet": best[1], "if_guess": best[2] or None}
 
 
 _PING_TIME_RE = re.compile(r"(?:time|時間)\s*[=<]\s*(?P<ms>\d+)", re.IGNORECASE)
@@ -199,28 +207,125 @@ def _ping_one(ip: str, *, timeout_ms: int) -> Dict[str, Any]:
     return {"ok": ok, "ip": ip_s, "rtt_ms": rtt}
 
 
+_ICMP_ECHO_REQUEST = 8
+_ICMP_ECHO_REPLY = 0
+_ICMP_PAYLOAD = b"lan-discovery"
+
+
+def _icmp_checksum(data: bytes) -> int:
+    if len(data) % 2:
+        data += b"\0"
+    s = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    s = (s >> 16) + (s & 0xFFFF)
+    s += s >> 16
+    return ~s & 0xFFFF
+
+
+def _icmp_open_socket() -> Optional[socket.socket]:
+    # Datagram ICMP sockets need no privileges (Linux/macOS); raw sockets need admin/root.
+    kinds = [socket.SOCK_RAW] if _is_windows() else [socket.SOCK_DGRAM, socket.SOCK_RAW]
+    for kind in kinds:
+        try:
+            return socket.socket(socket.AF_INET, kind, socket.IPPROTO_ICMP)
+        except OSError:
+            continue
+    return None
+
+
+def _icmp_sweep(ips: List[str], *, timeout_ms: int) -> Optional[Dict[str, int]]:
+    """Send one ICMP echo to every IP from a single socket, then collect replies until one deadline.
+
+    Returns {ip: rtt_ms} for the IPs that answered, or None when no ICMP socket can be
+    opened (no permission) so callers can fall back to the ping command.
+    """
+    sock = _icmp_open_socket()
+    if sock is None:
+        return None
+
+    # Linux datagram sockets get their identifier from the kernel and only see their own replies,
+    # so those are matched by seq + source. A raw socket sees every echo reply on the host, so
+    # the identifier must match too (another process pinging the same host would otherwise count).
+    ident = os.getpid() & 0xFFFF
+    check_ident = sock.type == socket.SOCK_RAW
+    sent: Dict[int, Any] = {}  # seq -> (ip, monotonic send time)
+    rtts: Dict[str, int] = {}
+    with sock:
+        for i, ip in enumerate(ips):
+            seq = i & 0xFFFF
+            header = struct.pack("!BBHHH", _ICMP_ECHO_REQUEST, 0, 0, ident, seq)
+            packet = struct.pack("!BBHHH", _ICMP_ECHO_REQUEST, 0, _icmp_checksum(header + _ICMP_PAYLOAD), ident, seq) + _ICMP_PAYLOAD
+            try:
+                sock.sendto(packet, (ip, 0))
+            except OSError:
+                continue
+            sent[seq] = (ip, time.monotonic())
+
+        sock.setblocking(False)
+        deadline = time.monotonic() + max(50, int(timeout_ms)) / 1000.0
+        while len(rtts) < len(sent):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            ready, _w, _x = select.select([sock], [], [], remaining)
+            if not ready:
+                break
+            try:
+                data, addr = sock.recvfrom(1024)
+            except (BlockingIOError, InterruptedError):
+                continue
+            except OSError:
+                break
+            # Raw sockets (and macOS datagram sockets) include the IP header.
+            if data and data[0] >> 4 == 4 and len(data) >= 20:
+                data = data[(data[0] & 0x0F) * 4:]
+            if len(data) < 8:
+                continue
+            icmp_type, _code, _csum, rident, rseq = struct.unpack("!BBHHH", data[:8])
+            if check_ident and rident != ident:
+                continue
+            hit = sent.get(rseq)
+            if icmp_type == _ICMP_ECHO_REPLY and hit is not None and hit[0] == addr[0] and addr[0] not in rtts:
+                rtts[addr[0]] = int((time.monotonic() - hit[1]) * 1000)
+    return rtts
+
+
+# Virtual NIC OUIs -> device type
+_VM_OUI_TYPES: Dict[str, str] = {
+    "00:15:5d": "VM/Hyper-V",
+    "08:00:27": "VM/VirtualBox",
+    "00:0c:29": "VM/VMware",
+    "00:50:56": "VM/VMware",
+}
+
+# Vendor keyword buckets, checked in this order (first bucket with a substring hit wins).
+# One precompiled alternation per bucket instead of a Python-level `in` test per keyword.
+_VENDOR_TYPE_RES = [
+    (typ, re.compile("|".join(re.escape(k) for k in keywords)))
+    for typ, keywords in (
+        ("Printer", ["canon", "epson", "brother", "ricoh", "kyocera", "xerox"]),
+        ("Router/AP/Switch", ["cisco", "juniper", "ubiquiti", "mikrotik", "tp-link", "netgear", "buffalo", "nec platforms", "asustek", "huawei", "aruba"]),
+        ("Phone/Tablet", ["apple", "samsung", "xiaomi", "oppo", "vivo", "google"]),
+        ("Camera/IoT", ["hikvision", "dahua", "axis", "ring"]),
+    )
+]
+
+
 def _estimate_device_type(*, ip: str, mac: Optional[str], vendor: Optional[str], hostname: Optional[str]) -> str:
     hn = (hostname or "").strip().lower()
     v = (vendor or "").strip().lower()
-    mac_n = _normalize_mac(mac)
-    oui = _mac_oui(mac_n) if mac_n else None
+    oui = _mac_oui(mac)
 
     # VM / virtual NIC OUIs
-    if oui in {"00:15:5d"}:  # Hyper-V
-        return "VM/Hyper-V"
-    if oui in {"08:00:27"}:
-        return "VM/VirtualBox"
-    if oui in {"00:0c:29", "00:50:56"}:
-        return "VM/VMware"
-
-    if "printer" in hn or any(k in v for k in ["canon", "epson", "brother", "ricoh", "kyocera", "xerox"]):
+    vm_type = _VM_OUI_TYPES.get(oui) if oui else None
+    if vm_type:
+        return vm_type
+
+    if "printer" in hn:
         return "Printer"
-    if any(k in v for k in ["cisco", "juniper", "ubiquiti", "mikrotik", "tp-link", "netgear", "buffalo", "nec platforms", "asustek", "huawei", "aruba"]):
-        return "Router/AP/Switch"
-    if any(k in v for k in ["apple", "samsung", "xiaomi", "oppo", "vivo", "google"]):
-        return "Phone/Tablet"
-    if any(k in v for k in ["hikvision", "dahua", "axis", "ring"]):
-        return "Camera/IoT"
+    if v:
+        for typ, pattern in _VENDOR_TYPE_RES:
+            if pattern.search(v):
+                return typ
     if hn.endswith("-pc") or hn.endswith("pc") or "desktop" in hn or "laptop" in hn:
         return "PC"
 
@@ -230,7 +335,13 @@ def _estimate_device_type(*, ip: str, mac: Optional[str], vendor: Optional[str],
 def _normalize_mac(mac: Optional[str]) -> Optional[str]:
     if not mac:
         return None
-    s = str(mac).strip().lower()
+    return _normalize_mac_str(str(mac))
+
+
+@lru_cache(maxsize=8192)
+def _normalize_mac_str(mac: str) -> Optional[str]:
+    # Called several times per neighbor row (OUI, broadcast/multicast checks, device type).
+    s = mac.strip().lower()
     if not s:
         return None
     # Accept common formats: aa:bb:cc:dd:ee:ff / aa-bb-cc-dd-ee-ff
@@ -254,10 +365,8 @@ def _mac_oui(mac: Optional[str]) -> Optional[str]:
     m = _normalize_mac(mac)
     if not m:
         return None
-    parts = m.split(":")
-    if len(parts) != 6:
-        return None
-    return ":".join(parts[:3])
+    # Normalized form is always "aa:bb:cc:dd:ee:ff"
+    return m[:8]
 
 
 def _mac_is_broadcast(mac: Optional[str]) -> bool:
@@ -269,11 +378,7 @@ def _mac_is_multicast(mac: Optional[str]) -> bool:
     m = _normalize_mac(mac)
     if not m:
         return False
-    try:
-        first_octet = int(m.split(":")[0], 16)
-    except Exception:
-        return False
-    return bool(first_octet & 1)
+    return bool(int(m[:2], 16) & 1)
 
 
 def _lookup_vendor_via_api(mac: str, *, timeout_s: float) -> Dict[str, Any]:
@@ -339,43 +444,49 @@ def _lookup_vendor_via_api(mac: str, *, timeout_s: float) -> Dict[str, Any]:
         return {"ok": False, "vendor": None, "status": None, "oui": oui, "error": str(e)}
 
 
-def _reverse_lookup_best_effort(ip: str, *, timeout_s: float) -> Dict[str, Any]:
-    """Best-effort reverse lookup.
+def _reverse_lookup_many(ips: List[str], *, timeout_s: float, max_workers: int) -> Dict[str, str]:
+    """Reverse lookup for many IPs with the system resolver (getnameinfo), no process per IP.
 
-    We prefer subprocess-based tools to enforce timeouts reliably.
+    Each worker gets timeout_s per lookup; lookups still running when the overall budget
+    ends are abandoned (their threads finish in the background). On Windows, IPs without
+    a PTR name fall back to the NetBIOS name table (nbtstat).
     """
 
-    ip_s = (ip or "").strip()
-    if not ip_s:
-        return {"ok": False, "ip": ip, "hostname": None, "source": None}
+    def _lookup(ip_s: str) -> Optional[str]:
+        try:
+            host, _port = socket.getnameinfo((ip_s, 0), socket.NI_NAMEREQD)
+        except OSError:
+            return None
+        return (host or "").strip().rstrip(".") or None
 
-    # Windows: nslookup is generally available and timeoutable.
-    if _is_windows():
-        r = _run_cmd(["nslookup", ip_s], timeout_s=timeout_s, stdout_limit=6000, stderr_limit=1500)
-        out = (r.get("stdout") or "") if isinstance(r, dict) else ""
-        hostname = None
-        for line in out.splitlines():
-            m = _NSLOOKUP_NAME_RE.match(line)
-            if m:
-                hostname = (m.group("name") or "").strip().rstrip(".")
-                break
-        if not hostname:
-            # Fallback: NetBIOS name table (often available even without PTR)
-            nb = _nbtstat_name_windows(ip_s, timeout_s=max(0.3, timeout_s))
-            if nb:
-                return {"ok": True, "ip": ip_s, "hostname": nb, "source": "nbtstat", "raw": r}
+    resolved: Dict[str, str] = {}
+    if not ips:
+        return resolved
+    workers = max(1, min(int(max_workers), len(ips)))
+    budget_s = timeout_s * -(-len(ips) // workers)
 
-        return {"ok": bool(hostname), "ip": ip_s, "hostname": hostname, "source": "nslookup", "raw": r}
+    ex = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futs = {ex.submit(_lookup, ip): ip for ip in ips}
+        done, pending = wait(futs, timeout=budget_s)
+        for f in pending:
+            f.cancel()
+        for f in done:
+            hn = f.result()
+            if hn:
+                resolved[futs[f]] = hn
+    finally:
+        ex.shutdown(wait=False)
 
-    # Non-Windows: try `getent hosts` first for a bounded timeout.
-    r = _run_cmd(["getent", "hosts", ip_s], timeout_s=timeout_s, stdout_limit=2000, stderr_limit=500)
-    out = (r.get("stdout") or "") if isinstance(r, dict) else ""
-    hostname = None
-    # Typical: "192.168.1.10 host.example.local host"
-    parts = (out.strip().split() if out else [])
-    if len(parts) >= 2:
-        hostname = parts[1].strip().rstrip(".")
-    return {"ok": bool(hostname), "ip": ip_s, "hostname": hostname, "source": "getent", "raw": r}
+    if _is_windows():
+        # Fallback: NetBIOS name table (often available even without PTR)
+        missing = [ip for ip in ips if ip not in resolved]
+        if missing:
+            with ThreadPoolExecutor(max_workers=min(workers, len(missing))) as nb_ex:
+                for ip, nb in zip(missing, nb_ex.map(lambda ip: _nbtstat_name_windows(ip, timeout_s=max(0.3, timeout_s)), missing)):
+                    if nb:
+                        resolved[ip] = nb
+    return resolved
 
 
 def list_local_ipv4_interfaces() -> List[Dict[str, Any]]:
@@ -428,6 +539,48 @@ def _powershell_json(ps_command: str, *, timeout_s: float = 8.0) -> Dict[str, An
     return _run_cmd(["powershell", "-NoProfile", "-Command", ps_command], timeout_s=timeout_s)
 
 
+# `arp -a` entry: "<a.b.c.d>  <mac with - or :>  <type>" (first three columns)
+_ARP_LINE_RE = re.compile(r"^([^\s.]*\.[^\s.]*\.[^\s.]*\.[^\s.]*)\s+(\S*[-:]\S*)\s+(\S+)")
+
+
+@lru_cache(maxsize=4096)
+def _ipv4_address(ip_s: str) -> Optional[ipaddress.IPv4Address]:
+    """Parsed IPv4 address, or None. The same ARP rows come back on every refresh."""
+    try:
+        ip_obj = ipaddress.ip_address(ip_s)
+    except ValueError:
+        return None
+    return ip_obj if ip_obj.version == 4 else None
+
+
+@lru_cache(maxsize=4096)
+def _is_private_host_ip(ip_s: str) -> bool:
+    """Private IPv4 unicast host address (no broadcast/multicast/loopback/link-local/reserved)."""
+    ip_obj = _ipv4_address(ip_s)
+    if ip_obj is None or not ip_obj.is_private:
+        return False
+    # Skip non-host targets
+    if str(ip_obj) == "255.255.255.255":
+        return False
+    if ip_obj.is_multicast or ip_obj.is_unspecified or ip_obj.is_loopback or ip_obj.is_link_local:
+        return False
+    if getattr(ip_obj, "is_reserved", False):
+        return False
+    return True
+
+
+def _private_host_ips(neighbors: List[Any]) -> List[str]:
+    """Unique private IPv4 host addresses of the neighbor rows, in table order."""
+    ips: Dict[str, None] = {}
+    for n in neighbors:
+        if not isinstance(n, dict):
+            continue
+        ip_s = str(n.get("ip") or "").strip()
+        if ip_s and ip_s not in ips and _is_private_host_ip(ip_s):
+            ips[ip_s] = None
+    return list(ips)
+
+
 def _parse_arp_a_windows(text: str) -> List[Dict[str, Any]]:
     """Parse `arp -a` output (Windows) into rows with ip/mac/type.
 
@@ -452,17 +605,13 @@ def _parse_arp_a_windows(text: str) -> List[Dict[str, Any]]:
             continue
 
         # Example: 192.168.1.1          00-11-22-33-44-55     dynamic
-        parts = s.split()
-        if len(parts) >= 3 and parts[0].count(".") == 3 and ("-" in parts[1] or ":" in parts[1]):
-            ip_s = parts[0].strip()
-            mac_s = parts[1].strip()
-            typ = parts[2].strip()
-            try:
-                ip_obj = ipaddress.ip_address(ip_s)
-                if ip_obj.version != 4:
-                    continue
-            except Exception:
+        m = _ARP_LINE_RE.match(s)
+        if m:
+            ip_obj = _ipv4_address(m.group(1))
+            if ip_obj is None:
                 continue
+            mac_s = m.group(2)
+            typ = m.group(3)
 
             rows.append(
                 {
@@ -487,54 +636,188 @@ def _parse_arp_a_windows(text: str) -> List[Dict[str, Any]]:
     return uniq
 
 
-def list_neighbors_ipv4() -> Dict[str, Any]:
-    """Return neighbor (ARP) table for IPv4 (best-effort)."""
+# NL_NEIGHBOR_STATE -> the same names Get-NetNeighbor reports
+_NEIGHBOR_STATES = ("Unreachable", "Incomplete", "Probe", "Delay", "Stale", "Reachable", "Permanent")
 
-    if _is_windows():
-        ps = (
-            "try { "
-            "Get-NetNeighbor -AddressFamily IPv4 | "
-            "Select-Object InterfaceAlias,IPAddress,LinkLayerAddress,State | "
-            "ConvertTo-Json -Depth 4 } catch { '[]' }"
-        )
-        r = _powershell_json(ps, timeout_s=12.0)
-        data = []
-        if r.get("ok") and isinstance(r.get("stdout"), str):
-            s = r["stdout"].strip()
-            try:
-                data = json.loads(s) if s else []
-            except Exception:
-                data = []
 
-        # Normalize: ConvertTo-Json returns object for single item
-        if isinstance(data, dict):
-            data = [data]
-        if not isinstance(data, list):
-            data = []
+def _neighbors_ipv4_win32() -> Optional[List[Dict[str, Any]]]:
+    """IPv4 neighbor table via GetIpNetTable2 (iphlpapi); None when the API is unavailable or fails."""
+    import ctypes
+    from ctypes import wintypes
+
+    class _MibIpNetRow2(ctypes.Structure):
+        _fields_ = [
+            ("Address", ctypes.c_ubyte * 28),  # SOCKADDR_INET
+            ("InterfaceIndex", wintypes.ULONG),
+            ("InterfaceLuid", ctypes.c_uint64),
+            ("PhysicalAddress", ctypes.c_ubyte * 32),
+            ("PhysicalAddressLength", wintypes.ULONG),
+            ("State", ctypes.c_int),
+            ("Flags", ctypes.c_ubyte),
+            ("ReachabilityTime", wintypes.ULONG),
+        ]
+
+    class _MibIpNetTable2(ctypes.Structure):
+        _fields_ = [("NumEntries", wintypes.ULONG), ("Table", _MibIpNetRow2 * 1)]
+
+    try:
+        iphlpapi = ctypes.windll.iphlpapi
+    except Exception:
+        return None
 
+    iphlpapi.GetIpNetTable2.argtypes = [ctypes.c_ushort, ctypes.c_void_p]
+    iphlpapi.GetIpNetTable2.restype = wintypes.ULONG
+    iphlpapi.ConvertInterfaceLuidToAlias.argtypes = [ctypes.POINTER(ctypes.c_uint64), ctypes.c_wchar_p, ctypes.c_size_t]
+    iphlpapi.ConvertInterfaceLuidToAlias.restype = wintypes.ULONG
+    iphlpapi.FreeMibTable.argtypes = [ctypes.c_void_p]
+    iphlpapi.FreeMibTable.restype = None
+
+    table_ptr = ctypes.POINTER(_MibIpNetTable2)()
+    if iphlpapi.GetIpNetTable2(socket.AF_INET, ctypes.byref(table_ptr)) != 0 or not table_ptr:
+        return None
+    try:
+        count = int(table_ptr.contents.NumEntries)
+        rows_addr = ctypes.addressof(table_ptr.contents) + _MibIpNetTable2.Table.offset
+        entries = (_MibIpNetRow2 * count).from_address(rows_addr)
+
+        aliases: Dict[int, str] = {}
+        alias_buf = ctypes.create_unicode_buffer(257)  # NDIS_IF_MAX_STRING_SIZE + 1
         rows: List[Dict[str, Any]] = []
-        for item in data:
-            if not isinstance(item, dict):
-                continue
-            ip = item.get("IPAddress")
-            mac = item.get("LinkLayerAddress")
-            if not ip:
-                continue
-            try:
-                ip_obj = ipaddress.ip_address(str(ip))
-            except Exception:
+        for e in entries:
+            # SOCKADDR_IN: family (2 bytes), port (2 bytes), address (4 bytes)
+            ip_obj = _ipv4_address(socket.inet_ntoa(bytes(e.Address[4:8])))
+            if ip_obj is None:
                 continue
-
+            n_mac = min(int(e.PhysicalAddressLength), 32)
+            mac = "-".join(f"{b:02X}" for b in e.PhysicalAddress[:n_mac])
+
+            luid = int(e.InterfaceLuid)
+            alias = aliases.get(luid)
+            if alias is None:
+                luid_c = ctypes.c_uint64(luid)
+                ok = iphlpapi.ConvertInterfaceLuidToAlias(ctypes.byref(luid_c), alias_buf, len(alias_buf)) == 0
+                alias = alias_buf.value if ok else str(int(e.InterfaceIndex))
+                aliases[luid] = alias
+
+            state = _NEIGHBOR_STATES[e.State] if 0 <= e.State < len(_NEIGHBOR_STATES) else str(e.State)
             rows.append(
                 {
                     "ip": str(ip_obj),
-                    "mac": str(mac) if mac else None,
-                    "state": str(item.get("State") or ""),
-                    "interface": str(item.get("InterfaceAlias") or ""),
+                    "mac": mac or None,
+                    "state": state,
+                    "interface": alias,
                     "is_private": bool(ip_obj.is_private),
-                    "source": "Get-NetNeighbor",
+                    "source": "GetIpNetTable2",
                 }
             )
+        return rows
+    finally:
+        iphlpapi.FreeMibTable(table_ptr)
+
+
+def _neighbors_ipv4_powershell() -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    ps = (
+        "try { "
+        "Get-NetNeighbor -AddressFamily IPv4 | "
+        "Select-Object InterfaceAlias,IPAddress,LinkLayerAddress,State | "
+        "ConvertTo-Json -Depth 4 } catch { '[]' }"
+    )
+    r = _powershell_json(ps, timeout_s=12.0)
+    data = []
+    if r.get("ok") and isinstance(r.get("stdout"), str):
+        s = r["stdout"].strip()
+        try:
+            data = json.loads(s) if s else []
+        except Exception:
+            data = []
+
+    # Normalize: ConvertTo-Json returns object for single item
+    if isinstance(data, dict):
+        data = [data]
+    if not isinstance(data, list):
+        data = []
+
+    rows: List[Dict[str, Any]] = []
+    for item in data:
+        if not isinstance(item, dict):
+            continue
+        ip = item.get("IPAddress")
+        mac = item.get("LinkLayerAddress")
+        if not ip:
+            continue
+        try:
+            ip_obj = ipaddress.ip_address(str(ip))
+        except Exception:
+            continue
+
+        rows.append(
+            {
+                "ip": str(ip_obj),
+                "mac": str(mac) if mac else None,
+                "state": str(item.get("State") or ""),
+                "interface": str(item.get("InterfaceAlias") or ""),
+                "is_private": bool(ip_obj.is_private),
+                "source": "Get-NetNeighbor",
+            }
+        )
+    return rows, r
+
+
+_ATF_COM = 0x02  # entry complete
+_ATF_PERM = 0x04  # permanent (static) entry
+
+
+def _neighbors_ipv4_proc() -> Optional[List[Dict[str, Any]]]:
+    """Parse /proc/net/arp (Linux); None when the file is not available."""
+    try:
+        with open("/proc/net/arp", encoding="ascii", errors="ignore") as f:
+            lines = f.read().splitlines()[1:]  # skip the header line
+    except OSError:
+        return None
+
+    rows: List[Dict[str, Any]] = []
+    for line in lines:
+        # IP address  HW type  Flags  HW address  Mask  Device
+        parts = line.split()
+        if len(parts) < 6:
+            continue
+        ip_s, _hw_type, flags_s, mac_s, _mask, dev = parts[:6]
+        try:
+            flags = int(flags_s, 16)
+        except ValueError:
+            continue
+        if not flags & (_ATF_COM | _ATF_PERM) or mac_s == "00:00:00:00:00:00":
+            continue  # incomplete entry
+        ip_obj = _ipv4_address(ip_s)
+        if ip_obj is None:
+            continue
+
+        rows.append(
+            {
+                "ip": str(ip_obj),
+                "mac": mac_s,
+                "state": "static" if flags & _ATF_PERM else "dynamic",
+                "interface": dev,
+                "is_private": bool(ip_obj.is_private),
+                "source": "/proc/net/arp",
+            }
+        )
+    return rows
+
+
+def list_neighbors_ipv4() -> Dict[str, Any]:
+    """Return neighbor (ARP) table for IPv4 (best-effort)."""
+
+    if _is_windows():
+        # Read the table in-process; PowerShell is only the fallback when the API call fails.
+        native_rows = _neighbors_ipv4_win32()
+        if native_rows is not None:
+            rows = native_rows
+            r: Dict[str, Any] = {"ok": True, "entries": len(rows)}
+            source = "GetIpNetTable2"
+        else:
+            rows, r = _neighbors_ipv4_powershell()
+            source = "Get-NetNeighbor"
 
         rows.sort(key=lambda x: (x.get("interface") or "", x.get("ip") or ""))
         # Fallback: when neighbor table is empty or unhelpful, try arp -a.
@@ -546,9 +829,15 @@ def list_neighbors_ipv4() -> Dict[str, Any]:
             if arp_rows:
                 return {"ok": True, "neighbors": arp_rows, "raw": {"netneighbor": r, "arp": arp}, "source": "arp -a"}
 
-        return {"ok": True, "neighbors": rows, "raw": r, "source": "Get-NetNeighbor"}
+        return {"ok": True, "neighbors": rows, "raw": r, "source": source}
+
+    # Linux: the kernel ARP table is a plain file (no arp process needed).
+    linux_rows = _neighbors_ipv4_proc()
+    if linux_rows is not None:
+        linux_rows.sort(key=lambda x: (x.get("interface") or "", x.get("ip") or ""))
+        return {"ok": True, "neighbors": linux_rows, "raw": {"ok": True, "entries": len(linux_rows)}, "source": "/proc/net/arp"}
 
-    # Fallback (non-Windows): try arp -a parsing
+    # Fallback (other OS): try arp -a parsing
     r = _run_cmd(["arp", "-a"], timeout_s=6.0)
     return {"ok": bool(r.get("ok")), "neighbors": [], "raw": r, "error": "arp parsing not implemented"}
 
@@ -596,6 +885,22 @@ def ping_sweep(
 
     workers = max(1, min(256, int(max_concurrency)))
 
+    # Fast path: every echo from one socket (no ping process per host).
+    replies = _icmp_sweep([str(h) for h in hosts], timeout_ms=timeout_ms)
+    if replies is not None:
+        elapsed_ms = int((time.monotonic() - started) * 1000)
+        return {
+            "ok": True,
+            "cidr": str(net),
+            "attempted": len(hosts),
+            "replied": len(replies),
+            "elapsed_ms": elapsed_ms,
+            # every echo goes out from one socket; max_concurrency only applies to the ping fallback
+            "max_concurrency": None,
+            "timeout_ms": int(timeout_ms),
+            "method": "icmp socket",
+        }
+
     def _ping_one(ip: str) -> None:
         if _is_windows():
             _ping_windows(ip, timeout_ms=timeout_ms)
@@ -624,6 +929,7 @@ def ping_sweep(
         "elapsed_ms": elapsed_ms,
         "max_concurrency": workers,
         "timeout_ms": int(timeout_ms),
+        "method": "ping",
     }
 
 
@@ -673,58 +979,20 @@ def collect_lan_devices(
     if not isinstance(neighbors, list):
         neighbors = []
 
+    # Unique private IPv4 host addresses, shared by the name-resolution and ping passes.
+    host_ips = _private_host_ips(neighbors) if (resolve_names or ping_check) else []
+
     hostname_resolution: Dict[str, Any] = {"requested": bool(resolve_names)}
     if resolve_names and neighbors:
         started = time.monotonic()
 
-        # Unique private IPv4 only.
-        ip_list: List[str] = []
-        seen = set()
-        for n in neighbors:
-            if not isinstance(n, dict):
-                continue
-            ip_s = str(n.get("ip") or "").strip()
-            if not ip_s:
-                continue
-            try:
-                ip_obj = ipaddress.ip_address(ip_s)
-            except Exception:
-                continue
-            if ip_obj.version != 4 or not ip_obj.is_private:
-                continue
-            # Skip non-host targets
-            if str(ip_obj) == "255.255.255.255":
-                continue
-            if ip_obj.is_multicast or ip_obj.is_unspecified or ip_obj.is_loopback or ip_obj.is_link_local:
-                continue
-            if getattr(ip_obj, "is_reserved", False):
-                continue
-            if ip_s in seen:
-                continue
-            seen.add(ip_s)
-            ip_list.append(ip_s)
-            if len(ip_list) >= max(1, int(resolve_max_entries)):
-                break
+        ip_list = host_ips[: max(1, int(resolve_max_entries))]
 
         timeout_s = max(0.1, float(resolve_timeout_ms) / 1000.0)
         workers = max(1, min(128, int(resolve_max_concurrency)))
         workers = min(workers, max(1, len(ip_list)))
 
-        resolved_map: Dict[str, str] = {}
-        # Note: We intentionally do not propagate raw command output per-host to keep payload small.
-        with ThreadPoolExecutor(max_workers=workers) as ex:
-            futs = {ex.submit(_reverse_lookup_best_effort, ip, timeout_s=timeout_s): ip for ip in ip_list}
-            for f in as_completed(futs):
-                try:
-                    r = f.result()
-                except Exception:
-                    continue
-                if not isinstance(r, dict):
-                    continue
-                ip_s = str(r.get("ip") or "").strip()
-                hn = r.get("hostname")
-                if ip_s and isinstance(hn, str) and hn.strip():
-                    resolved_map[ip_s] = hn.strip()
+        resolved_map = _reverse_lookup_many(ip_list, timeout_s=timeout_s, max_workers=workers)
 
         # Apply back to neighbor list
         for n in neighbors:
@@ -745,7 +1013,7 @@ def collect_lan_devices(
             "max_concurrency": int(workers),
             "max_entries": int(resolve_max_entries),
             "elapsed_ms": elapsed_ms,
-            "method": "nslookup+nbtstat" if _is_windows() else "getent",
+            "method": "getnameinfo+nbtstat" if _is_windows() else "getnameinfo",
         }
 
     vendor_resolution: Dict[str, Any] = {"requested": bool(resolve_vendors)}
@@ -834,51 +1102,31 @@ def collect_lan_devices(
     if ping_check and neighbors:
         started = time.monotonic()
 
-        ip_list: List[str] = []
-        seen = set()
-        for n in neighbors:
-            if not isinstance(n, dict):
-                continue
-            ip_s = str(n.get("ip") or "").strip()
-            if not ip_s:
-                continue
-            try:
-                ip_obj = ipaddress.ip_address(ip_s)
-            except Exception:
-                continue
-            if ip_obj.version != 4 or not ip_obj.is_private:
-                continue
-            if str(ip_obj) == "255.255.255.255":
-                continue
-            if ip_obj.is_multicast or ip_obj.is_unspecified or ip_obj.is_loopback or ip_obj.is_link_local:
-                continue
-            if getattr(ip_obj, "is_reserved", False):
-                continue
-            if ip_s in seen:
-                continue
-            seen.add(ip_s)
-            ip_list.append(ip_s)
-            if len(ip_list) >= max(1, int(ping_max_entries)):
-                break
+        ip_list = host_ips[: max(1, int(ping_max_entries))]
 
         workers = max(1, min(256, int(ping_max_concurrency)))
         workers = min(workers, max(1, len(ip_list)))
         timeout_ms_i = max(50, int(ping_timeout_ms))
 
         ping_map: Dict[str, Dict[str, Any]] = {}
-        with ThreadPoolExecutor(max_workers=workers) as ex:
-            futs = {ex.submit(_ping_one, ip, timeout_ms=timeout_ms_i): ip for ip in ip_list}
-            for f in as_completed(futs):
-                try:
-                    r = f.result()
-                except Exception:
-                    continue
-                if not isinstance(r, dict):
-                    continue
-                ip_s = str(r.get("ip") or "").strip()
-                if not ip_s:
-                    continue
-                ping_map[ip_s] = {"ok": bool(r.get("ok")), "rtt_ms": r.get("rtt_ms")}
+        rtts = _icmp_sweep(ip_list, timeout_ms=timeout_ms_i)
+        if rtts is not None:
+            for ip_s in ip_list:
+                ping_map[ip_s] = {"ok": ip_s in rtts, "rtt_ms": rtts.get(ip_s)}
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as ex:
+                futs = {ex.submit(_ping_one, ip, timeout_ms=timeout_ms_i): ip for ip in ip_list}
+                for f in as_completed(futs):
+                    try:
+                        r = f.result()
+                    except Exception:
+                        continue
+                    if not isinstance(r, dict):
+                        continue
+                    ip_s = str(r.get("ip") or "").strip()
+                    if not ip_s:
+                        continue
+                    ping_map[ip_s] = {"ok": bool(r.get("ok")), "rtt_ms": r.get("rtt_ms")}
 
         for n in neighbors:
             if not isinstance(n, dict):
@@ -897,9 +1145,11 @@ def collect_lan_devices(
             "max_concurrency": int(workers),
             "max_entries": int(ping_max_entries),
             "elapsed_ms": elapsed_ms,
+            "method": "icmp socket" if rtts is not None else "ping",
         }
 
     # Enrich rows with seen times / subnet guess / type
+    nets = _interface_networks(interfaces)
     for n in neighbors:
         if not isinstance(n, dict):
             continue
@@ -909,7 +1159,7 @@ def collect_lan_devices(
             if seen_times:
                 n.update(seen_times)
 
-            guess = _guess_subnet_and_if(interfaces, ip_s)
+            guess = _guess_subnet_and_if(nets, ip_s)
             if guess.get("subnet") and not n.get("subnet"):
                 n["subnet"] = guess.get("subnet")
             if guess.get("if_guess") and not n.get("interface"):
@@ -0,0 +1,215 @@
+"""パケット1件ごとに呼ばれる重要度判定・解説文生成（キャプチャのホットパス）
+
+Scapy オブジェクトや app.py のグローバル状態に依存しない純粋関数だけを置き、
+引数・戻り値をすべて型注釈しておく。そのままでも import して使えるが、
+mypyc でネイティブ拡張にビルドすると整数ポート比較やフラグのビット判定の
+ボックス化が減る（ビルドは任意）::
+
+    pip install mypy
+    cd backend
+    mypyc packet_hot.py
+
+ビルド済みの .pyd/.so があればそちらが優先して読み込まれ、無ければこの .py が使われる。
+"""
+
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import Dict, Final, List, Optional, Tuple
+
+
+# TCP フラグのビット（Scapy の TCP.flags と同じ並び: FSRPAUECN）
+TCP_FIN: Final = 0x01
+TCP_SYN: Final = 0x02
+TCP_RST: Final = 0x04
+TCP_PSH: Final = 0x08
+TCP_ACK: Final = 0x10
+
+_TCP_FLAG_LETTERS: Final = 'FSRPAUECN'
+
+# フラグ整数 → Scapy と同じ表記の文字列（'S', 'SA', 'PA' ...）。9ビットなので全パターンを前計算しておく
+_TCP_FLAG_STRINGS: Final[Tuple[str, ...]] = tuple(
+    ''.join(c for i, c in enumerate(_TCP_FLAG_LETTERS) if v >> i & 1) for v in range(1 << len(_TCP_FLAG_LETTERS))
+)
+
+
+def tcp_flags_str(flags: int) -> str:
+    """TCP フラグ整数を 'SA' のような文字列表記にする"""
+    return _TCP_FLAG_STRINGS[flags & 0x1FF]
+
+
+# ポート番号 → 重要度 / 解説文のテーブル（パケットごとの if/elif 連鎖を辞書参照1回にする）
+_TCP_PORT_IMPORTANCE: Final[Dict[int, str]] = {22: 'high', 443: 'high', 80: 'high', 3389: 'high', 21: 'high'}
+_UDP_PORT_IMPORTANCE: Final[Dict[int, str]] = {53: 'medium', 67: 'medium', 68: 'medium'}
+
+_TCP_PORT_EXPLANATIONS: Final[Dict[int, Tuple[str, ...]]] = {
+    80: ("🌐 ポート80: HTTP通信（暗号化されていないWeb通信）",
+         "⚠️ セキュリティ: データが暗号化されていないため、盗聴のリスクがあります"),
+    443: ("🔒 ポート443: HTTPS通信（暗号化されたWeb通信）",
+          "✅ セキュリティ: SSL/TLSで暗号化されており安全です"),
+    22: ("🔐 ポート22: SSH通信（リモートログイン）",
+         "✅ セキュリティ: サーバーへの安全な接続です"),
+    21: ("📁 ポート21: FTP通信（ファイル転送）",
+         "⚠️ セキュリティ: パスワードが平文で送信されるため推奨されません"),
+    3389: ("🖥️ ポート3389: RDP通信（リモートデスクトップ）",
+           "💡 用途: Windows PCへのリモート接続です"),
+    25: ("📧 ポート25: SMTP通信（メール送信）",),
+    110: ("📬 ポート110: POP3通信（メール受信）",),
+    143: ("📮 ポート143: IMAP通信（メール受信）",),
+    993: ("🔒 ポート993: IMAPS通信（暗号化されたメール受信）",),
+    3306: ("🗄️ ポート3306: MySQL通信（データベース）",),
+    5432: ("🗄️ ポート5432: PostgreSQL通信（データベース）",),
+    8080: ("🌐 ポート8080: HTTP代替ポート（開発用Webサーバーなど）",),
+}
+
+_UDP_PORT_EXPLANATIONS: Final[Dict[int, Tuple[str, ...]]] = {
+    53: ("🔍 ポート53: DNS通信（ドメイン名の解決）",
+         "💡 役割: www.example.com → IPアドレスへの変換"),
+    **{p: (f"📡 ポート{p}: DHCP通信（IPアドレスの自動割り当て）",
+           "💡 役割: ネットワーク参加時に自動でIPアドレスを取得") for p in (67, 68)},
+    123: ("⏰ ポート123: NTP通信（時刻同期）",
+          "💡 役割: コンピュータの時計を正確に保つ"),
+    **{p: (f"🏷️ ポート{p}: NetBIOSネーム通信",
+           "💡 役割: Windowsネットワークでのコンピュータ名解決") for p in (137, 138)},
+    **{p: (f"📊 ポート{p}: SNMP通信（ネットワーク機器の監視）",) for p in (161, 162)},
+    **{p: ("☎️ ポート5060-5061: SIP通信（VoIP電話）",) for p in (5060, 5061)},
+    **{p: ("🎮 ポート27000番台: オンラインゲーム通信の可能性",) for p in range(27000, 27051)},
+}
+
+_ICMP_TYPE_EXPLANATIONS: Final[Dict[int, Tuple[str, ...]]] = {
+    8: ("🔔 Pingリクエスト（Echo Request）",
+        "💡 用途: ネットワーク接続の確認、応答速度の測定"),
+    0: ("✅ Ping応答（Echo Reply）",
+        "💡 意味: 相手が正常に応答、ネットワークは正常"),
+    3: ("⚠️ 到達不可能（Destination Unreachable）",
+        "💡 原因: ファイアウォール、経路なし、サービス停止など"),
+    11: ("⏱️ 時間超過（Time Exceeded）",
+         "💡 原因: パケットが経路上で時間切れ（TTL=0）"),
+}
+
+
+@lru_cache(maxsize=4096)
+def _classify_ip(ip: str) -> Optional[str]:
+    """IP アドレスの種別（local / loopback / multicast / broadcast）を判定する
+
+    同じアドレスがキャプチャ中に何度も現れるため、プレフィックス判定の結果をキャッシュする。
+    """
+    if ip.startswith('192.168.') or ip.startswith('10.') or ip.startswith('172.'):
+        return 'local'
+    if ip.startswith('127.'):
+        return 'loopback'
+    if ip.startswith('224.') or ip.startswith('239.'):
+        return 'multicast'
+    if ip == '255.255.255.255':
+        return 'broadcast'
+    return None
+
+
+def determine_packet_importance(packet_type: str, dport: Optional[int], flags: Optional[int]) -> str:
+    """パケットの重要度を判定"""
+    if packet_type == 'TCP':
+        if dport is not None:
+            importance = _TCP_PORT_IMPORTANCE.get(dport)
+            if importance:
+                return importance
+        if flags is not None and flags & (TCP_RST | TCP_FIN):
+            return 'medium'
+
+    if packet_type == 'UDP':
+        if dport is not None:
+            importance = _UDP_PORT_IMPORTANCE.get(dport)
+            if importance:
+                return importance
+
+    if packet_type == 'ICMP':
+        return 'medium'
+
+    if packet_type == 'ARP':
+        return 'low'
+
+    return 'normal'
+
+
+def get_packet_explanation(
+    packet_type: str,
+    sport: Optional[int],
+    dport: Optional[int],
+    flags: Optional[int],
+    icmp_type: Optional[int],
+    arp_op: Optional[int],
+    src: Optional[str],
+    dst: Optional[str],
+) -> str:
+    """パケットの解説を生成"""
+    explanation: List[str] = []
+
+    if packet_type == 'TCP':
+        explanation.append("📌 TCP (Transmission Control Protocol): 信頼性の高いデータ転送を行うプロトコル")
+        f = flags or 0
+
+        if dport is not None:
+            port_lines = _TCP_PORT_EXPLANATIONS.get(dport)
+            if port_lines:
+                explanation.extend(port_lines)
+
+        syn_ack = f & (TCP_SYN | TCP_ACK)
+        if syn_ack == TCP_SYN:
+            explanation.append("🔄 SYNフラグ: 接続開始リクエスト（3ウェイハンドシェイクの開始）")
+        elif syn_ack == TCP_SYN | TCP_ACK:
+            explanation.append("🤝 SYN-ACKフラグ: 接続受け入れ応答（3ウェイハンドシェイクの2段階目）")
+        elif f & TCP_FIN:
+            explanation.append("👋 FINフラグ: 接続終了リクエスト（正常な切断）")
+        elif f & TCP_RST:
+            explanation.append("⛔ RSTフラグ: 接続リセット（異常な切断または拒否）")
+        elif f & TCP_PSH:
+            explanation.append("📤 PSHフラグ: データの即座送信（アプリケーションへすぐに渡す）")
+
+    elif packet_type == 'UDP':
+        explanation.append("📌 UDP (User Datagram Protocol): 高速だが信頼性は低いプロトコル")
+        explanation.append("💡 特徴: 接続確立なし、データ到達保証なし、ストリーミングやゲームに最適")
+
+        # DNS は送信元ポート53（応答）でも判定する
+        key = 53 if sport == 53 else dport
+        if key is not None:
+            port_lines = _UDP_PORT_EXPLANATIONS.get(key)
+            if port_lines:
+                explanation.extend(port_lines)
+
+    elif packet_type == 'ICMP':
+        explanation.append("📌 ICMP: ネットワーク診断やエラー通知に使用されるプロトコル")
+
+        if icmp_type is not None:
+            type_lines = _ICMP_TYPE_EXPLANATIONS.get(icmp_type)
+            if type_lines:
+                explanation.extend(type_lines)
+
+    elif packet_type == 'ARP':
+        explanation.append("📌 ARP (Address Resolution Protocol): IPアドレスからMACアドレスを解決")
+        explanation.append("💡 役割: ローカルネットワーク内でのデバイス通信に必要")
+        explanation.append("🔄 動作: 「このIPアドレスのMACアドレスを教えて」と問い合わせ")
+        if arp_op == 1:
+            explanation.append("❓ ARPリクエスト: 誰かのMACアドレスを探しています")
+        elif arp_op == 2:
+            explanation.append("✅ ARP応答: MACアドレスを返答しています")
+
+    if src is not None:
+        s = src or ''
+        d = dst or ''
+
+        src_kind = _classify_ip(s)
+        if src_kind == 'local':
+            explanation.append(f"🏠 送信元 {s}: ローカルネットワーク内のデバイス")
+        elif src_kind == 'loopback':
+            explanation.append(f"💻 送信元 {s}: 自分自身（ループバック）")
+
+        dst_kind = _classify_ip(d)
+        if dst_kind == 'local':
+            explanation.append(f"🏠 宛先 {d}: ローカルネットワーク内のデバイス")
+        elif dst_kind == 'loopback':
+            explanation.append(f"💻 宛先 {d}: 自分自身（ループバック）")
+        elif dst_kind == 'multicast':
+            explanation.append(f"📢 宛先 {d}: マルチキャスト（複数デバイスへの同時配信）")
+        elif dst_kind == 'broadcast':
+            explanation.append("📣 宛先 255.255.255.255: ブロードキャスト（全デバイスへの配信）")
+
+    return ' | '.join(explanation) if explanation else 'その他の通信'
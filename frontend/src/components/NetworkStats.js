@@ -29,8 +29,40 @@ function NetworkStats() {
 
   useEffect(() => {
     fetchStats();
-    const interval = setInterval(fetchStats, 5000); // 5秒ごとに更新
-    return () => clearInterval(interval);
+
+    // サーバーから push される統計を受け取る。WebSocket が使えない場合は5秒ごとのポーリングに戻す
+    let interval = null;
+    let ws = null;
+    const startPolling = () => {
+      if (!interval) {
+        interval = setInterval(fetchStats, 5000); // 5秒ごとに更新
+      }
+    };
+
+    try {
+      ws = new WebSocket('ws://localhost:5000/ws/network-stats');
+      ws.onmessage = (event) => {
+        try {
+          setStats(JSON.parse(event.data));
+          setError(null);
+        } catch (e) {
+          // 壊れたメッセージは無視
+        }
+      };
+      ws.onerror = startPolling;
+      ws.onclose = startPolling;
+    } catch (e) {
+      startPolling();
+    }
+
+    return () => {
+      if (ws) {
+        ws.onclose = null;
+        ws.onerror = null;
+        ws.close();
+      }
+      if (interval) clearInterval(interval);
+    };
   }, []);
 
   if (loading && !stats) return <div className="loading">読み込み中...</div>;